@@ -19,41 +19,14 @@ export const getPostgresSchemasQuery =
 FROM pg_catalog.pg_namespace
 WHERE nspname NOT LIKE 'pg_%' AND nspname <> 'information_schema'`;
 
-// Helper function to get initial rows query with pagination
-export const getRowsQuery = (
-  entityName: string,
-  limit: number = 100,
-  offset: number = 0,
-  schemaName?: string
-): string => {
+// Helper function to get the rows query of a table, the server pages it with
+// the limit and offset query params
+export const getRowsQuery = (entityName: string, schemaName?: string): string => {
   // For PostgreSQL, use schema-qualified table name if schema is provided
   const tableName = schemaName ? `${schemaName}.${entityName}` : entityName;
-  return `SELECT * FROM ${tableName} LIMIT ${limit} OFFSET ${offset}`;
+  return `SELECT * FROM ${tableName}`;
 };
 
-export function getQueryWithRowOffsetAndLimits(
-  query: string,
-  limit: number,
-  offset: number
-) {
-  const lower = query.toLowerCase();
-  let newQuery = query;
-
-  if (limit < 0) return query;
-  const hasLimit = lower.includes(" limit ");
-  const hasOffset = lower.includes(" offset ");
-
-  if (!hasLimit) {
-    newQuery += ` LIMIT ${limit >= 0 ? limit : -1}`;
-  }
-
-  if (!hasOffset) {
-    newQuery += ` OFFSET ${Math.max(0, offset)}`;
-  }
-
-  return newQuery;
-}
-
 export const getTableRecordsSearchQuery = (
   connectionType: string,
   table: string,
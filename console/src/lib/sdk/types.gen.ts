@@ -118,6 +118,18 @@ export type QueryResult = {
      * Columns
      */
     columns: Array<unknown>;
+    /**
+     * Truncated
+     */
+    truncated?: boolean;
+    /**
+     * Total Rows
+     */
+    total_rows?: number | null;
+    /**
+     * Total Rows Estimated
+     */
+    total_rows_estimated?: boolean;
 };
 
 /**
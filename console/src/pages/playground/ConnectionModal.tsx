@@ -126,8 +126,11 @@ export function ConnectionModal({ open, onOpenChange, onSuccess, connectionId }:
           throw new Error('Bucket UID not returned from upload response');
         }
         
-        // Use the bucket UID as the connection URI
-        finalConnectionUri = bucketUid;
+        // The file is stored in the bucket as {uid}{extension}
+        const extension = file.name.includes('.')
+          ? file.name.slice(file.name.lastIndexOf('.'))
+          : '';
+        finalConnectionUri = `${bucketUid}${extension}`;
         setUploadStatus('success');
       } else if (connectionType === 'sqlite' && !file && !isEditMode) {
         setErrorMessage('Please upload a SQLite file');
@@ -192,7 +192,7 @@ export default function DatabaseSidebar() {
         const limit = 100;
         const offset = 0;
         // Use schema-qualified name for postgres if schemaId is present
-        const query = getRowsQuery(table.name, limit, offset, table.schemaId);
+        const query = getRowsQuery(table.name, table.schemaId);
         const rowsResponse = await executeQuery({
           path: {
             connection_id: database.id,
@@ -13,7 +13,6 @@ import { QueryResults } from "./result";
 import { X } from "lucide-react";
 import { useDatabaseStore, useTabsStore, type Row, type Column } from "./store/store";
 import { executeQuery } from "@/lib/sdk";
-import { getQueryWithRowOffsetAndLimits } from "@/lib/queries";
 
 export default () => {
   const {
@@ -59,11 +58,10 @@ export default () => {
           entity_name: entityName,
         },
         query: {
-          query: getQueryWithRowOffsetAndLimits(
-            query,
-            tab.rowsLimit,
-            tab.rowsOffset
-          ),
+          query,
+          // -1 ("No limits") leaves the page size to the server cap
+          limit: tab.rowsLimit,
+          offset: tab.rowsOffset,
         },
       });
 
@@ -85,6 +83,9 @@ export default () => {
           columns,
           rows: (response.data.rows as any[]) || [],
           query: response.data.query,
+          truncated: response.data.truncated,
+          totalRows: response.data.total_rows,
+          totalRowsEstimated: response.data.total_rows_estimated,
         });
         updateTabConnection(tabId, connectionId, tab.databaseName,entityName);
         
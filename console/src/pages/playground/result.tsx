@@ -55,6 +55,10 @@ export function QueryResults({ result }: QueryResultsProps) {
         )}
         <p className="text-xs text-muted-foreground mt-1">
           {rows.length} row{rows.length !== 1 ? "s" : ""} returned
+          {result.truncated &&
+            (result.totalRows != null
+              ? ` of ${result.totalRowsEstimated ? "about " : ""}${result.totalRows}`
+              : ", more rows were left out")}
         </p>
       </div>
 
@@ -50,6 +50,10 @@ export interface QueryResult {
   rows: Row[];
   query?: string;
   error?: string;
+  // the server left rows out, totalRows is how many the query has
+  truncated?: boolean;
+  totalRows?: number | null;
+  totalRowsEstimated?: boolean;
 }
 
 const NEW_TAB_ID = "new";
@@ -208,7 +208,7 @@ export function TableView({ tableId, tabId, externalRows, externalColumns }: Tab
       const rowsLimit = limit ?? tab.rowsLimit;
       updateTabPagination(tabId, rowsLimit, offset);
 
-      const query = getRowsQuery(tab.tableName!, rowsLimit, offset);
+      const query = getRowsQuery(tab.tableName!);
 
       const rowsResponse = await executeQuery({
         path: {
@@ -1,9 +1,23 @@
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import router
+from .routes import router, UPLOAD_DIR
+from .routes.common import (
+    bucket_access_times,
+    recently_used_connections,
+    save_bucket_state,
+    save_connection_usage,
+)
+from .models import HealthModel
 from contextlib import asynccontextmanager
 from .database.db import init_schema
+from .services import events
+from .services.broadcast import broadcaster
+from .services.cursors import cursors
+from .services.federation import federation
+from .services.pools import pools
+from .services.supervisor import supervisor
+from .services.tiering import bucket_store
 
 
 def generate_sdk_unique_id(route: APIRoute):
@@ -13,8 +27,19 @@ def generate_sdk_unique_id(route: APIRoute):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
     await init_schema()
+    await broadcaster.start(events.handle)
+    # pools are warmed in the background, startup does not wait for databases
+    await supervisor.start(recently_used_connections, save_connection_usage)
+    await bucket_store.start(bucket_access_times, save_bucket_state)
     yield
+    await bucket_store.stop()
+    await supervisor.stop()
+    await broadcaster.stop()
+    await cursors.close_all()
+    federation.clear()
+    await pools.close_all()
 
 
 def create_api():
@@ -29,8 +54,13 @@ def create_api():
     api.include_router(router=router)
 
     @api.get("/")
-    @api.get("/health")
-    def health():
+    def liveness():
         return "ok"
 
+    @api.get("/health", response_model=HealthModel)
+    def health():
+        """Readiness of the worker with the health and pools of the connections
+        it serves, a connection failing its checks makes the status degraded."""
+        return HealthModel(**supervisor.snapshot())
+
     return api
@@ -1,19 +1,141 @@
 from enum import Enum
-from laserorm.storage.postgresql import PostgreSQL
-from laserorm.storage.sqlite import SQLite
-from dotenv import load_dotenv
 import os
 
-load_dotenv(".env")
+
+def load_env(path: str, override: bool = False):
+    # python-dotenv is only imported when there is a file to load
+    if os.path.exists(path):
+        from dotenv import load_dotenv
+
+        load_dotenv(path, override=override)
+
+
+load_env(".env")
 MODE = os.getenv("MODE", "DEV")
 if MODE.upper() == "TESTING":
-    load_dotenv(".env.test", override=True)
+    load_env(".env.test", override=True)
 
 
 class AppConfig:
     APP_MODE = MODE
     DB_PATH = os.environ.get("DB_PATH")
+    # config store: "sqlite" (DB_PATH, per node) or "postgres" (CONFIG_DB_URI, shared by all nodes)
+    CONFIG_STORE = os.environ.get("CONFIG_STORE", "sqlite")
+    CONFIG_DB_URI = os.environ.get("CONFIG_DB_URI")
     BUCKET_DIR = os.environ.get("BUCKET_DIR")
+    # pooled driver connections per registered connection
+    POOL_MAX_SIZE = int(os.environ.get("POOL_MAX_SIZE", 10))
+    # seconds to wait for a new postgres connection
+    POOL_CONNECT_TIMEOUT = float(os.environ.get("POOL_CONNECT_TIMEOUT", 10))
+    # consecutive failures to reach a server that open its circuit breaker,
+    # and seconds until the first probe, doubling up to BREAKER_MAX_BACKOFF
+    BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", 5))
+    BREAKER_BACKOFF = float(os.environ.get("BREAKER_BACKOFF", 1))
+    BREAKER_MAX_BACKOFF = float(os.environ.get("BREAKER_MAX_BACKOFF", 60))
+    # connections used recently (that ran a query within POOL_WARM_WITHIN
+    # seconds) get POOL_WARM_SIZE pooled connections opened at startup, the
+    # pools of every used connection are pinged every POOL_CHECK_INTERVAL
+    POOL_WARM_CONNECTIONS = int(os.environ.get("POOL_WARM_CONNECTIONS", 10))
+    POOL_WARM_WITHIN = float(os.environ.get("POOL_WARM_WITHIN", 7 * 24 * 3600))
+    POOL_WARM_SIZE = int(os.environ.get("POOL_WARM_SIZE", 2))
+    POOL_CHECK_INTERVAL = float(os.environ.get("POOL_CHECK_INTERVAL", 30))
+    POOL_CHECK_TIMEOUT = float(os.environ.get("POOL_CHECK_TIMEOUT", 5))
+    # prepared (postgres) or compiled (sqlite) statements kept per pooled connection
+    STATEMENT_CACHE_SIZE = int(os.environ.get("STATEMENT_CACHE_SIZE", 100))
+    # postgres read replicas: seconds between health checks, check timeout and
+    # how long reads stay on the primary after a write
+    REPLICA_CHECK_INTERVAL = float(os.environ.get("REPLICA_CHECK_INTERVAL", 5))
+    REPLICA_CHECK_TIMEOUT = float(os.environ.get("REPLICA_CHECK_TIMEOUT", 2))
+    REPLICA_READ_AFTER_WRITE = float(os.environ.get("REPLICA_READ_AFTER_WRITE", 2))
+    # server side cursors
+    CURSOR_IDLE_TIMEOUT = float(os.environ.get("CURSOR_IDLE_TIMEOUT", 300))
+    MAX_CURSORS_PER_USER = int(os.environ.get("MAX_CURSORS_PER_USER", 5))
+    # every cursor pins a connection of the read pool, queries keep the rest
+    MAX_CURSORS = int(os.environ.get("MAX_CURSORS", POOL_MAX_SIZE // 2))
+    # cached query results and catalog responses, 0 ttl disables the cache
+    RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 30))
+    RESULT_CACHE_MAX_BYTES = int(
+        os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+    )
+    RESULT_CACHE_MAX_ENTRY_BYTES = int(
+        os.environ.get("RESULT_CACHE_MAX_ENTRY_BYTES", 16 * 1024 * 1024)
+    )
+    # cache tier shared by the workers of a host, ideally on tmpfs (/dev/shm/datapilot)
+    SHARED_CACHE_DIR = os.environ.get("SHARED_CACHE_DIR")
+    SHARED_CACHE_MAX_BYTES = int(
+        os.environ.get("SHARED_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+    )
+    # live table tailing over server sent events
+    WATCH_POLL_INTERVAL = float(os.environ.get("WATCH_POLL_INTERVAL", 1))
+    WATCH_HEARTBEAT_INTERVAL = float(os.environ.get("WATCH_HEARTBEAT_INTERVAL", 15))
+    WATCH_BATCH_SIZE = int(os.environ.get("WATCH_BATCH_SIZE", 1000))
+    # postgres tables watched without a key are scanned in full on every
+    # change, only tables up to this size can be, by this many streams of a
+    # worker at once
+    WATCH_XMIN_MAX_BYTES = int(os.environ.get("WATCH_XMIN_MAX_BYTES", 64 * 1024 * 1024))
+    WATCH_XMIN_MAX_WATCHERS = int(os.environ.get("WATCH_XMIN_MAX_WATCHERS", 10))
+    # most rows and bytes a query response carries, the rest is reported as truncated
+    MAX_RESULT_ROWS = int(os.environ.get("MAX_RESULT_ROWS", 10000))
+    MAX_RESULT_BYTES = int(os.environ.get("MAX_RESULT_BYTES", 64 * 1024 * 1024))
+    # memory held by query results of one query and of the whole worker; past
+    # it results are spilled to MEMORY_SPILL_DIR (up to MEMORY_SPILL_MAX_BYTES
+    # per query) or, with MEMORY_SPILL=false, the query fails
+    MEMORY_QUERY_BUDGET = int(os.environ.get("MEMORY_QUERY_BUDGET", 256 * 1024 * 1024))
+    MEMORY_WORKER_BUDGET = int(
+        os.environ.get("MEMORY_WORKER_BUDGET", 1024 * 1024 * 1024)
+    )
+    MEMORY_SPILL = os.environ.get("MEMORY_SPILL", "true") == "true"
+    MEMORY_SPILL_DIR = os.environ.get("MEMORY_SPILL_DIR") or None
+    MEMORY_SPILL_MAX_BYTES = int(
+        os.environ.get("MEMORY_SPILL_MAX_BYTES", 4 * 1024 * 1024 * 1024)
+    )
+    # statement fingerprints aggregated per worker, least recently seen go first
+    QUERY_STATS_MAX = int(os.environ.get("QUERY_STATS_MAX", 5000))
+    # executions at least this slow are counted as slow and get their plan
+    # logged, once per SLOW_QUERY_PLAN_INTERVAL seconds for a fingerprint
+    SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 1000))
+    SLOW_QUERY_PLAN_INTERVAL = float(os.environ.get("SLOW_QUERY_PLAN_INTERVAL", 300))
+    # the index advisor looks at the heaviest ADVISOR_WORKLOAD fingerprints run
+    # at least ADVISOR_MIN_CALLS times, and suggests up to ADVISOR_MAX_COLUMNS
+    # columns per index
+    ADVISOR_WORKLOAD = int(os.environ.get("ADVISOR_WORKLOAD", 50))
+    ADVISOR_MIN_CALLS = int(os.environ.get("ADVISOR_MIN_CALLS", 2))
+    ADVISOR_MAX_COLUMNS = int(os.environ.get("ADVISOR_MAX_COLUMNS", 3))
+    # sqlite databases up to this size are copied to measure indexes on, each
+    # measured query is stopped after this many thousand VM instructions
+    ADVISOR_SCRATCH_MAX_BYTES = int(
+        os.environ.get("ADVISOR_SCRATCH_MAX_BYTES", 1024 * 1024 * 1024)
+    )
+    ADVISOR_MAX_STEPS = int(os.environ.get("ADVISOR_MAX_STEPS", 100_000))
+    # postgres tables pulled for federated queries are kept this many seconds,
+    # up to FEDERATED_CACHE_MAX_BYTES; a pull may have at most
+    # FEDERATED_MAX_ROWS rows and a query may run FEDERATED_TIMEOUT seconds
+    FEDERATED_CACHE_TTL = float(os.environ.get("FEDERATED_CACHE_TTL", 300))
+    FEDERATED_CACHE_MAX_BYTES = int(
+        os.environ.get("FEDERATED_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+    )
+    FEDERATED_MAX_ROWS = int(os.environ.get("FEDERATED_MAX_ROWS", 1_000_000))
+    FEDERATED_TIMEOUT = float(os.environ.get("FEDERATED_TIMEOUT", 60))
+    # snapshots copy a postgres table in up to SNAPSHOT_PARTITIONS primary
+    # key ranges at once, each over its own pooled connection
+    SNAPSHOT_PARTITIONS = int(os.environ.get("SNAPSHOT_PARTITIONS", 4))
+    # bytes BUCKET_DIR may hold before the files used least recently are
+    # compressed into BUCKET_COLD_DIR (BUCKET_DIR/cold by default), 0 for no
+    # quota. A file has to go unused for BUCKET_MIN_IDLE seconds first.
+    BUCKET_QUOTA_BYTES = int(os.environ.get("BUCKET_QUOTA_BYTES", 0))
+    BUCKET_COLD_DIR = os.environ.get("BUCKET_COLD_DIR")
+    BUCKET_MIN_IDLE = int(os.environ.get("BUCKET_MIN_IDLE", 900))
+    BUCKET_SWEEP_INTERVAL = int(os.environ.get("BUCKET_SWEEP_INTERVAL", 60))
+    # largest file an upload may store, after decompression, and how many
+    # times a compressed upload may expand
+    UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", 32 * 1024 * 1024 * 1024))
+    UPLOAD_MAX_RATIO = float(os.environ.get("UPLOAD_MAX_RATIO", 1000))
+    # uploaded sqlite files are checked, vacuumed to OPTIMIZE_PAGE_SIZE pages,
+    # analyzed and switched to WAL in the background
+    OPTIMIZE_UPLOADS = os.environ.get("OPTIMIZE_UPLOADS", "true") == "true"
+    OPTIMIZE_PAGE_SIZE = int(os.environ.get("OPTIMIZE_PAGE_SIZE", 8192))
+    # responses smaller than this are sent uncompressed
+    COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
 
     @staticmethod
     def is_testing_mode():
@@ -37,10 +159,15 @@ def get_adapter(source: str):
     except ValueError:
         raise ValueError(f"Unsupported source: {source}")
 
+    # drivers are imported on first use of their source, keeps startup cheap
     match source_enum:
         case SourceConfig.POSTGRES:
+            from laserorm.storage.postgresql import PostgreSQL
+
             return PostgreSQL
         case SourceConfig.SQLITE:
+            from laserorm.storage.sqlite import SQLite
+
             return SQLite
 
 
@@ -1,11 +1,35 @@
-from laserorm.storage.sqlite import SQLite
 from laserorm.storage.storage import StorageSession
 from fastapi import Depends
 from typing import Annotated
+from contextlib import closing
+import asyncio
+import sqlite3
+import zlib
 from .models import models
-from ..config import AppConfig
+from ..config import AppConfig, SourceConfig, get_adapter
 
-storage = SQLite(AppConfig.DB_PATH)
+
+def get_config_storage():
+    """The store for connections, buckets and query logs.
+
+    A local sqlite file per node by default, or a postgres database shared by
+    every node so connection records cannot drift between them.
+    """
+    Adapter = get_adapter(AppConfig.CONFIG_STORE)
+    match SourceConfig(AppConfig.CONFIG_STORE):
+        case SourceConfig.SQLITE:
+            return Adapter(AppConfig.DB_PATH)
+        case SourceConfig.POSTGRES:
+            if not AppConfig.CONFIG_DB_URI:
+                raise ValueError(
+                    "CONFIG_DB_URI is required for the postgres config store"
+                )
+            return Adapter(connection_uri=AppConfig.CONFIG_DB_URI)
+        case _:
+            raise ValueError(f"Unsupported config store: {AppConfig.CONFIG_STORE}")
+
+
+storage = get_config_storage()
 
 
 async def get_db():
@@ -17,8 +41,35 @@ async def get_db():
 DBSession = Annotated[StorageSession, Depends(get_db)]
 
 
+def schema_version() -> int:
+    """Checksum of the config models, changes whenever a model or field does."""
+    layout = [
+        (
+            model.__name__,
+            sorted((name, str(kind)) for name, kind in model.__annotations__.items()),
+        )
+        for model in models
+    ]
+    return zlib.crc32(repr(layout).encode()) & 0x7FFFFFFF
+
+
+def _sqlite_user_version(version: int | None = None) -> int:
+    with closing(sqlite3.connect(AppConfig.DB_PATH)) as conn:
+        if version is not None:
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
 async def init_schema():
-    import asyncio
+    # the sqlite config store remembers the schema it was created with, so
+    # startup skips the DDL round trips when nothing changed
+    local = AppConfig.CONFIG_STORE == SourceConfig.SQLITE.value
+    version = schema_version()
+    if local and await asyncio.to_thread(_sqlite_user_version) == version:
+        return
 
     async with storage.session() as session:
         await asyncio.gather(*(session.init_schema(model) for model in models))
+
+    if local:
+        await asyncio.to_thread(_sqlite_user_version, version)
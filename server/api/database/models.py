@@ -9,6 +9,8 @@ class Connections(Model):
     source: str
     name: str
     connection_uri: str
+    # postgres read replicas: {"replica_uris": [...], "max_replica_lag": seconds}
+    replication: dict = lambda: {}
 
 
 class QueryLogs(Model):
@@ -23,4 +25,10 @@ class Bucket(Model):
     metadata: dict
 
 
-models = [Connections, QueryLogs, Bucket]
+class ConnectionUsage(Model):
+    # uid of the connection, when a query last ran on it
+    connection_id: str
+    last_used_at: float
+
+
+models = [Connections, QueryLogs, Bucket, ConnectionUsage]
@@ -8,6 +8,10 @@ class CreateConnectionsModel(BaseModel):
     source: SourceConfig
     name: str
     connection_uri: str
+    # postgres only, reads are balanced across these and writes go to connection_uri
+    replica_uris: list[str] = []
+    # seconds a replica may lag behind before reads skip it
+    max_replica_lag: Optional[float] = None
 
     class Config:
         use_enum_values = True
@@ -17,6 +21,8 @@ class UpdateConnectionsModel(BaseModel):
     name: Optional[str] = None
     connection_uri: Optional[str] = None
     source: Optional[SourceConfig] = None
+    replica_uris: Optional[list[str]] = None
+    max_replica_lag: Optional[float] = None
 
     class Config:
         use_enum_values = True
@@ -26,11 +32,39 @@ class ConnectionsModel(BaseModel):
     name: str
     connection_uri: str
     source: SourceConfig
+    replica_uris: list[str] = []
+    max_replica_lag: Optional[float] = None
 
     class Config:
         use_enum_values = True
 
 
+class PoolModel(BaseModel):
+    read_only: bool
+    size: int
+    idle: int
+    max_size: int
+
+
+class ReplicaModel(BaseModel):
+    index: int
+    server: str
+    healthy: bool
+    lag_seconds: Optional[float] = None
+    error: Optional[str] = None
+    checked_at: Optional[float] = None
+    in_flight: int
+    served: int
+    pools: list[PoolModel]
+
+
+class ReplicaModelList(BaseModel):
+    primary: list[PoolModel]
+    max_replica_lag: Optional[float] = None
+    replicas: list[ReplicaModel]
+    total: int
+
+
 # Entities
 class EntityModel(BaseModel):
     name: str
@@ -58,8 +92,13 @@ class QueryResult(BaseModel):
     entity_name: str
     limit: Optional[int] = 100
     offset: Optional[int] = 100
+    params: Optional[list] = None
     rows: list
     columns: list
+    # more rows than the page or the server caps allow, total_rows says how many
+    truncated: bool = False
+    total_rows: Optional[int] = None
+    total_rows_estimated: bool = False
 
 
 # Tables
@@ -72,6 +111,19 @@ class TableModelList(BaseModel):
     total: int
 
 
+# Columns
+class ColumnModel(BaseModel):
+    name: str
+    type: Optional[str] = None
+    nullable: Optional[bool] = None
+    default_value: Optional[str] = None
+
+
+class ColumnModelList(BaseModel):
+    columns: list[ColumnModel]
+    total: int
+
+
 # Schemas
 class SchemaModel(BaseModel):
     name: str
@@ -79,4 +131,223 @@ class SchemaModel(BaseModel):
 
 class SchemaModelList(BaseModel):
     schemas: list[SchemaModel]
-    total: int
\ No newline at end of file
+    total: int
+
+
+# Cursors
+class CreateCursorModel(BaseModel):
+    query: str
+
+
+class CursorModel(BaseModel):
+    cursor_id: str
+    connection_id: str
+    query: str
+    columns: list
+
+
+class CursorPageModel(BaseModel):
+    cursor_id: str
+    limit: int
+    offset: int
+    rows: list
+    columns: list
+    exhausted: bool
+
+
+# Federated queries
+class CreateFederatedQueryModel(BaseModel):
+    query: str
+    # alias the query names the connection by -> connection uid
+    connections: dict[str, str]
+    limit: Optional[int] = None
+
+
+class FederatedPullModel(BaseModel):
+    alias: str
+    table: str
+    columns: list[str]
+    predicates: list[str]
+    rows: int
+    cached: bool
+
+
+class FederatedQueryResult(BaseModel):
+    query: str
+    connections: dict[str, str]
+    limit: Optional[int] = None
+    pulls: list[FederatedPullModel]
+    rows: list
+    columns: list
+    truncated: bool = False
+
+
+# Indexes
+class IndexCandidateModel(BaseModel):
+    id: str
+    table: str
+    columns: list[str]
+    statement: str
+    # scan and/or sort, what the index avoids in the plans
+    reasons: list[str]
+    # fingerprints of the statements that would use it
+    queries: list[str]
+    calls: int
+    total_ms: float
+    cost_before: Optional[float] = None
+    cost_after: Optional[float] = None
+    improvement: Optional[float] = None
+
+
+class IndexAdviceModel(BaseModel):
+    connection_id: str
+    analyzed: int
+    method: Optional[str] = None
+    note: Optional[str] = None
+    candidates: list[IndexCandidateModel]
+    total: int
+
+
+class IndexJobModel(BaseModel):
+    id: str
+    connection_id: str
+    candidate_id: str
+    statement: str
+    status: str
+    error: Optional[str] = None
+    created: float
+    finished: Optional[float] = None
+
+
+# Snapshots
+class SnapshotTableModel(BaseModel):
+    # table in the snapshot, the name of the postgres table by default
+    name: Optional[str] = None
+    table: Optional[str] = None
+    query: Optional[str] = None
+    # column to refresh the snapshot from, e.g. updated_at
+    watermark: Optional[str] = None
+
+
+class CreateSnapshotModel(BaseModel):
+    # name of the connection registered for the snapshot
+    name: Optional[str] = None
+    tables: list[SnapshotTableModel]
+
+
+class SnapshotJobTableModel(BaseModel):
+    name: str
+    rows: int
+    watermark: Optional[str] = None
+    high_water: Optional[str] = None
+
+
+class SnapshotJobModel(BaseModel):
+    id: str
+    kind: str
+    connection_id: str
+    snapshot_id: str
+    snapshot_connection_id: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+    rows: int
+    tables: list[SnapshotJobTableModel]
+    created: float
+    finished: Optional[float] = None
+
+
+# Admin
+class QueryMemoryModel(BaseModel):
+    connection_id: str
+    query: str
+    bytes: int
+    peak_bytes: int
+    rows: int
+    spilled_bytes: int
+    started: float
+
+
+class MemoryUsageModel(BaseModel):
+    used_bytes: int
+    peak_bytes: int
+    worker_budget_bytes: int
+    query_budget_bytes: int
+    spill: bool
+    spilled_queries: int
+    aborted_queries: int
+    queries: list[QueryMemoryModel]
+
+
+class BucketFileModel(BaseModel):
+    uid: str
+    name: str
+    tier: str
+    size: int
+    last_accessed_at: float
+    pooled: bool
+
+
+class BucketUsageModel(BaseModel):
+    quota: Optional[int] = None
+    hot_bytes: int
+    cold_bytes: int
+    files: list[BucketFileModel]
+
+
+class BreakerModel(BaseModel):
+    connection_id: str
+    server: str
+    state: str
+    failures: int
+    error: Optional[str] = None
+    opened_at: Optional[float] = None
+    retry_in: Optional[float] = None
+    opened: int
+    rejected: int
+
+
+class BreakerModelList(BaseModel):
+    breakers: list[BreakerModel]
+    open: int
+    total: int
+
+
+class QueryStatsModel(BaseModel):
+    id: str
+    connection_id: str
+    fingerprint: str
+    query: str
+    calls: int
+    total_ms: float
+    mean_ms: float
+    p95_ms: float
+    max_ms: float
+    rows: int
+    slow_calls: int
+    last_seen: float
+    plan_logged_at: Optional[float] = None
+
+
+class QueryStatsModelList(BaseModel):
+    queries: list[QueryStatsModel]
+    total: int
+
+
+# Health
+class ConnectionHealthModel(BaseModel):
+    connection_id: str
+    source: str
+    healthy: Optional[bool] = None
+    latency_ms: Optional[float] = None
+    error: Optional[str] = None
+    checked_at: Optional[float] = None
+    last_used_at: Optional[float] = None
+    failures: int
+    breaker: str
+    pools: list[PoolModel]
+
+
+class HealthModel(BaseModel):
+    status: str
+    uptime: float
+    connections: list[ConnectionHealthModel]
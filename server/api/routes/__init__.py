@@ -2,8 +2,8 @@ from fastapi import APIRouter
 from pathlib import Path
 from ..config import AppConfig
 
+# created on startup (and on upload), not at import time
 UPLOAD_DIR = Path(AppConfig.BUCKET_DIR)
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 router = APIRouter()
 
@@ -19,9 +19,21 @@ router = APIRouter()
 from .connections import router as ConnectionsRouter
 from .bucket import router as BucketRouter
 from .queries import router as QueryRouter
+from .cursors import router as CursorRouter
+from .watch import router as WatchRouter
+from .admin import router as AdminRouter
+from .indexes import router as IndexRouter
+from .federation import router as FederationRouter
+from .snapshots import router as SnapshotRouter
 
 router.include_router(ConnectionsRouter)
 router.include_router(BucketRouter)
 router.include_router(QueryRouter)
+router.include_router(CursorRouter)
+router.include_router(WatchRouter)
+router.include_router(AdminRouter)
+router.include_router(IndexRouter)
+router.include_router(FederationRouter)
+router.include_router(SnapshotRouter)
 
 __all__ = [router]
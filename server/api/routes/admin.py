@@ -0,0 +1,88 @@
+import os
+from fastapi import APIRouter, HTTPException, Query, status
+from typing import Annotated, Optional
+from ..models import (
+    BreakerModel,
+    BreakerModelList,
+    BucketUsageModel,
+    MemoryUsageModel,
+    QueryStatsModel,
+    QueryStatsModelList,
+)
+from ..services.breaker import OPEN, breakers
+from ..services.memory import memory
+from ..services.querystats import ORDERINGS, query_stats
+from ..services.replicas import describe_uri
+from ..services.tiering import bucket_store
+
+router = APIRouter(tags=["admin"])
+
+
+@router.get("/admin/memory", response_model=MemoryUsageModel)
+async def get_memory_usage():
+    """Memory held by query results in this worker, largest queries first."""
+    return MemoryUsageModel(**memory.snapshot())
+
+
+@router.get("/admin/bucket", response_model=BucketUsageModel)
+async def get_bucket_usage():
+    """Disk used by the bucket in each tier, files used least recently first."""
+    return BucketUsageModel(**bucket_store.snapshot())
+
+
+@router.get("/admin/breakers", response_model=BreakerModelList)
+async def get_breakers():
+    """Circuit breakers of the servers this worker connected to."""
+    results = [
+        BreakerModel(
+            **{key: value for key, value in breaker.items() if key != "uri"},
+            # postgres uris carry credentials, sqlite ones are bucket paths
+            server=(
+                describe_uri(breaker["uri"])
+                if "://" in breaker["uri"]
+                else os.path.basename(breaker["uri"])
+            ),
+        )
+        for breaker in breakers.snapshot()
+    ]
+    return BreakerModelList(
+        breakers=results,
+        open=sum(breaker.state == OPEN for breaker in results),
+        total=len(results),
+    )
+
+
+@router.get("/admin/queries", response_model=QueryStatsModelList)
+async def get_query_stats(
+    connection_id: Annotated[Optional[str], Query()] = None,
+    order_by: Annotated[str, Query(description=", ".join(ORDERINGS))] = "total",
+    limit: Annotated[int, Query(ge=1, le=500)] = 20,
+):
+    """Statements executed by this worker grouped by fingerprint, heaviest first."""
+    if order_by not in ORDERINGS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"order_by must be one of {', '.join(ORDERINGS)}",
+        )
+    ranked = query_stats.top(connection_id, order_by, limit=None)
+    return QueryStatsModelList(
+        queries=[
+            QueryStatsModel(
+                id=stats.id,
+                connection_id=stats.connection_id,
+                fingerprint=stats.fingerprint,
+                query=stats.query,
+                calls=stats.calls,
+                total_ms=stats.total_ms,
+                mean_ms=stats.mean_ms,
+                p95_ms=stats.p95_ms,
+                max_ms=stats.max_ms,
+                rows=stats.rows,
+                slow_calls=stats.slow_calls,
+                last_seen=stats.last_seen,
+                plan_logged_at=stats.plan_logged_at,
+            )
+            for stats in ranked[:limit]
+        ],
+        total=len(ranked),
+    )
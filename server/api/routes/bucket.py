@@ -1,29 +1,220 @@
-from fastapi import UploadFile, APIRouter
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from fastapi import UploadFile, APIRouter, HTTPException, status
 from pathlib import Path
 import uuid
 from . import router, UPLOAD_DIR
+from ..config import AppConfig
 from ..models import BucketModel
-from ..database.db import DBSession
+from ..database.db import DBSession, storage
 from ..database.models import Bucket
+from ..services.compression import (
+    ENCODINGS,
+    OUTPUT_CHUNK,
+    UPLOAD_SUFFIXES,
+    DecompressionLimitExceeded,
+    StreamDecompressor,
+    sniff,
+)
+from ..services.optimizer import OptimizationSkipped, is_sqlite_file, optimize_sqlite
+from ..services.pools import pools
+from ..services.tiering import QuotaExceeded, bucket_store
+from .responses import FileDownload, file_etag
 
 router = APIRouter(tags=["buckets"])
 
+logger = logging.getLogger(__name__)
+
+# optimization tasks, referenced until they finish
+_background: set[asyncio.Task] = set()
+
+# content types and codings a compressed upload may be labelled with
+UPLOAD_ENCODINGS = {
+    "gzip": "gzip",
+    "x-gzip": "gzip",
+    "application/gzip": "gzip",
+    "application/x-gzip": "gzip",
+    "zstd": "zstd",
+    "application/zstd": "zstd",
+}
+
+
+def decompressed_name(filename: str) -> str:
+    # snapshot.db.zst is stored as a .db once decompressed
+    name = Path(filename)
+    return name.stem if name.suffix.lower() in UPLOAD_SUFFIXES else name.name
+
+
+def stored_name(file_id: str, filename: str | None) -> str:
+    """The name an upload is kept under in UPLOAD_DIR."""
+    return f"{file_id}{Path(decompressed_name(filename or '')).suffix}"
+
+
+def upload_encoding(file: UploadFile, head: bytes) -> str | None:
+    """The compression of an upload from its part headers, its name or its
+    first bytes, None when it is stored as it is."""
+    labels = [file.headers.get("content-encoding", ""), file.content_type or ""]
+    for label in labels:
+        if encoding := UPLOAD_ENCODINGS.get(label.lower().strip()):
+            return encoding
+    return UPLOAD_SUFFIXES.get(Path(file.filename or "").suffix.lower()) or sniff(head)
+
+
+async def store_upload(file: UploadFile, file_path: Path) -> dict:
+    """Stream an upload to disk, decompressing it on the way when it is
+    gzip or zstd compressed. The file only appears once it is complete."""
+    head = await file.read(OUTPUT_CHUNK)
+    encoding = upload_encoding(file, head)
+    if encoding and encoding not in ENCODINGS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"{encoding} uploads need the compression extra installed",
+        )
+    partial = file_path.with_name(file_path.name + ".part")
+    try:
+        with open(partial, "wb") as f:
+            if encoding:
+                decompressor = StreamDecompressor(
+                    encoding,
+                    f.write,
+                    AppConfig.UPLOAD_MAX_BYTES,
+                    AppConfig.UPLOAD_MAX_RATIO,
+                )
+                chunk = head
+                while chunk:
+                    await asyncio.to_thread(decompressor.decompress, chunk)
+                    chunk = await file.read(OUTPUT_CHUNK)
+                await asyncio.to_thread(decompressor.finish)
+            else:
+                size = 0
+                chunk = head
+                while chunk:
+                    size += len(chunk)
+                    if size > AppConfig.UPLOAD_MAX_BYTES:
+                        raise DecompressionLimitExceeded(
+                            f"Upload exceeds {AppConfig.UPLOAD_MAX_BYTES // 2**20} MB"
+                        )
+                    await asyncio.to_thread(f.write, chunk)
+                    chunk = await file.read(OUTPUT_CHUNK)
+        os.replace(partial, file_path)
+    except DecompressionLimitExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e)
+        )
+    except (ValueError, zlib.error) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Could not decompress the {encoding} upload: {e}",
+        )
+    finally:
+        partial.unlink(missing_ok=True)
+
+    metadata = {"file_size": file_path.stat().st_size, "filename": file.filename}
+    if encoding:
+        metadata.update(encoding=encoding, compressed_size=decompressor.read)
+    return metadata
+
 
 @router.post("/bucket", response_model=BucketModel)
 async def upload_file(file: UploadFile, db: DBSession):
     file_id = str(uuid.uuid4())
 
-    ext = Path(file.filename).suffix or ""
+    try:
+        await bucket_store.reserve()
+    except QuotaExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_507_INSUFFICIENT_STORAGE, detail=str(e)
+        )
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    file_path = UPLOAD_DIR / stored_name(file_id, file.filename)
+    metadata = await store_upload(file, file_path)
+    optimize = AppConfig.OPTIMIZE_UPLOADS and is_sqlite_file(file_path)
+    if optimize:
+        metadata["optimization"] = {"status": "pending"}
+    await db.create(Bucket(uid=file_id, metadata=metadata))
+    await db.commit()
+    if optimize:
+        task = asyncio.get_running_loop().create_task(
+            optimize_upload(file_id, file_path)
+        )
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+    return BucketModel(uid=file_id, filename=file.filename)
+
+
+def checkpointed_stat(file_path: Path) -> os.stat_result:
+    """Stat a bucket file, first copying what a sqlite database in WAL mode
+    still has in its -wal file into it, so a download has all committed
+    changes."""
+    wal = file_path.with_name(file_path.name + "-wal")
+    if wal.exists() and wal.stat().st_size and is_sqlite_file(file_path):
+        try:
+            with closing(sqlite3.connect(file_path)) as conn:
+                conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Could not checkpoint %s: %s", file_path.name, e)
+    return file_path.stat()
 
-    new_filename = f"{file_id}{ext}"
-    file_path = UPLOAD_DIR / new_filename
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
 
-    await db.create(
-        Bucket(
-            uid=file_id, metadata={"file_size": file.size, "filename": file.filename}
+@router.get("/bucket/{uid}", response_class=FileDownload)
+async def download_file(uid: str, db: DBSession):
+    bucket = await db.get(Bucket, filters=Bucket.uid == uid)
+    if not bucket:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"File {uid} not found"
+        )
+    filename = (bucket.metadata or {}).get("filename")
+    file_path = UPLOAD_DIR / stored_name(uid, filename)
+    try:
+        bucket_store.touch(file_path)
+        await bucket_store.ensure_hot(file_path)
+        stat_result = await asyncio.to_thread(checkpointed_stat, file_path)
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail=f"File {uid} not found"
         )
+    return FileDownload(
+        file_path,
+        stat_result=stat_result,
+        filename=(
+            decompressed_name(filename) if filename else stored_name(uid, filename)
+        ),
+        # revalidated with If-None-Match, files are replaced in place
+        headers={"etag": file_etag(stat_result), "cache-control": "no-cache"},
     )
-    await db.commit()
-    return BucketModel(uid=f"{file_id}.{ext}", filename=file.filename)
+
+
+async def optimize_upload(file_id: str, file_path: Path):
+    """Optimize an uploaded sqlite database and record how it went in the
+    metadata of its bucket entry."""
+    try:
+        # pools on the file would write to the replaced one, opening a pool
+        # waits for this lock and files already queried are left as they are
+        async with bucket_store.lock(file_path):
+            if str(file_path) in pools.uris():
+                raise OptimizationSkipped("the database is already in use")
+            result = {
+                "status": "done",
+                **await asyncio.to_thread(optimize_sqlite, file_path),
+            }
+    except OptimizationSkipped as e:
+        result = {"status": "skipped", "reason": str(e)}
+    except Exception as e:
+        logger.warning("Could not optimize %s: %s", file_path.name, e)
+        result = {"status": "failed", "reason": str(e)}
+    result["finished_at"] = time.time()
+    try:
+        async with storage.session() as session:
+            bucket = await session.get(Bucket, filters=Bucket.uid == file_id)
+            if bucket is None:
+                return
+            bucket.metadata = {**(bucket.metadata or {}), "optimization": result}
+            await session.update(Bucket, Bucket.uid == file_id, bucket.to_dict())
+            await session.commit()
+    except Exception as e:
+        logger.warning("Could not record the optimization of %s: %s", file_path.name, e)
@@ -0,0 +1,200 @@
+from fastapi import HTTPException, Request, Depends, status
+from typing import Annotated
+import math
+import sqlite3
+import sys
+import time
+from . import UPLOAD_DIR
+from ..config import AppConfig, SourceConfig
+from ..database.db import storage
+from ..database.models import Bucket, ConnectionUsage, Connections
+from ..services.breaker import CircuitOpen
+from ..services.memory import MemoryBudgetExceeded
+from ..services.replicas import ReplicaSet, replicas
+
+
+async def get_connection_or_404(db, connection_id: str) -> Connections:
+    connection = await db.get(Connections, filters=Connections.uid == connection_id)
+    if not connection:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Connection {connection_id} not found",
+        )
+    return connection
+
+
+def resolve_connection_uri(connection: Connections) -> str:
+    # sqlite connections store the bucket filename
+    if connection.source == SourceConfig.SQLITE.value:
+        return str(UPLOAD_DIR / connection.connection_uri)
+    return connection.connection_uri
+
+
+def resolve_replicas(connection: Connections) -> ReplicaSet | None:
+    """The read replicas of a postgres connection, None when it has none."""
+    if connection.source != SourceConfig.POSTGRES.value:
+        return None
+    replication = connection.replication or {}
+    return replicas.get(
+        connection.uid,
+        replication.get("replica_uris") or [],
+        replication.get("max_replica_lag"),
+    )
+
+
+async def recently_used_connections() -> list[tuple[str, str, str]]:
+    """(uid, source, uri) of the connections that ran a query within
+    POOL_WARM_WITHIN, most recently used first."""
+    since = time.time() - AppConfig.POOL_WARM_WITHIN
+    recent = []
+    async with storage.session() as session:
+        usage = await session.list(
+            ConnectionUsage, filters=ConnectionUsage.last_used_at >= since
+        )
+        usage.sort(key=lambda used: used.last_used_at, reverse=True)
+        for used in usage:
+            if len(recent) >= AppConfig.POOL_WARM_CONNECTIONS:
+                break
+            # deleted connections keep their usage row
+            connection = await session.get(
+                Connections, filters=Connections.uid == used.connection_id
+            )
+            if connection:
+                recent.append(
+                    (
+                        connection.uid,
+                        connection.source,
+                        resolve_connection_uri(connection),
+                    )
+                )
+    return recent
+
+
+async def save_connection_usage(updates: dict[str, float]):
+    """Record when connections were last used, by uid."""
+    async with storage.session() as session:
+        for uid, used_at in updates.items():
+            filters = ConnectionUsage.connection_id == uid
+            usage = await session.get(ConnectionUsage, filters=filters)
+            if usage is None:
+                await session.create(
+                    ConnectionUsage(connection_id=uid, last_used_at=used_at)
+                )
+            # another worker may have saved a later use meanwhile
+            elif used_at > usage.last_used_at:
+                usage.last_used_at = used_at
+                await session.update(ConnectionUsage, filters, usage.to_dict())
+        await session.commit()
+
+
+async def bucket_access_times() -> dict[str, float]:
+    """Last access of every bucket entry by uid, as saved by any worker."""
+    async with storage.session() as session:
+        entries = await session.list(Bucket)
+    return {
+        entry.uid: (entry.metadata or {}).get("last_accessed_at") or 0
+        for entry in entries
+    }
+
+
+async def save_bucket_state(updates: dict[str, dict]):
+    """Merge access times and tiers into the metadata of bucket entries."""
+    async with storage.session() as session:
+        for uid, changes in updates.items():
+            entry = await session.get(Bucket, filters=Bucket.uid == uid)
+            if entry is None:
+                continue
+            metadata = {**(entry.metadata or {}), **changes}
+            # another worker may have saved a later access meanwhile
+            if "last_accessed_at" in changes:
+                metadata["last_accessed_at"] = max(
+                    changes["last_accessed_at"],
+                    (entry.metadata or {}).get("last_accessed_at") or 0,
+                )
+            entry.metadata = metadata
+            await session.update(Bucket, Bucket.uid == uid, entry.to_dict())
+        await session.commit()
+
+
+def get_client_id(request: Request) -> str:
+    # there are no accounts yet, the console sends a stable id per browser
+    return request.headers.get("x-client-id") or (
+        request.client.host if request.client else "anonymous"
+    )
+
+
+ClientId = Annotated[str, Depends(get_client_id)]
+
+
+def raise_database_error(e: Exception, action: str):
+    """Translate driver errors raised while talking to a source into HTTP errors."""
+    if isinstance(e, HTTPException):
+        raise e
+    # the server was failing, the query was not attempted
+    if isinstance(e, CircuitOpen):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database unavailable: {e.error}. Retrying the connection shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
+    # asyncpg is imported lazily, if it is not loaded the error cannot be one of its
+    asyncpg = sys.modules.get("asyncpg")
+    if asyncpg and isinstance(e, asyncpg.exceptions.InternalServerError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"PostgreSQL connection error: {str(e)}. Please check your connection URI and credentials.",
+        )
+    if asyncpg and isinstance(e, asyncpg.exceptions.InvalidPasswordError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"PostgreSQL authentication failed: {str(e)}. Please check your password.",
+        )
+    if asyncpg and isinstance(e, asyncpg.exceptions.InvalidCatalogNameError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"PostgreSQL database not found: {str(e)}. Please check your database name.",
+        )
+    if isinstance(e, MemoryBudgetExceeded):
+        if e.worker:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e),
+                headers={"Retry-After": "5"},
+            )
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    # wrong number of bound parameters
+    if isinstance(e, sqlite3.ProgrammingError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid query parameters: {str(e)}",
+        )
+    # parameters asyncpg could not encode for the types of their placeholders
+    if asyncpg and isinstance(e, asyncpg.exceptions._base.DataError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid query parameters: {str(e)}",
+        )
+    # bad parameter values and other data exceptions (class 22)
+    if asyncpg and isinstance(e, asyncpg.exceptions.DataError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid data: {str(e)}",
+        )
+    if isinstance(e, (ConnectionError, OSError)) or (
+        asyncpg and isinstance(e, asyncpg.exceptions.PostgresError)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Database connection error: {str(e)}. Please check your connection settings and ensure the database server is running.",
+        )
+    if isinstance(e, AttributeError):
+        if "'NoneType' object has no attribute 'close'" in str(e):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Database connection failed. Please check your connection URI and credentials.",
+            )
+        raise e
+    raise HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail=f"Error {action}: {str(e)}",
+    )
@@ -1,32 +1,66 @@
 from fastapi import APIRouter, HTTPException, status
 from . import UPLOAD_DIR
 from ..config import SourceConfig
-from ..models import CreateConnectionsModel, UpdateConnectionsModel, ConnectionsModel, ConnectionsModelList
+from ..models import (
+    CreateConnectionsModel,
+    UpdateConnectionsModel,
+    ConnectionsModel,
+    ConnectionsModelList,
+    PoolModel,
+    ReplicaModel,
+    ReplicaModelList,
+)
 from ..database.db import DBSession
 from ..database.models import Connections
+from ..services.events import connection_changed
+from ..services.pools import pools
+from ..services.replicas import describe_uri
+from ..services.tiering import bucket_store
+from .common import get_connection_or_404, resolve_connection_uri, resolve_replicas
 
 router = APIRouter(tags=["connections"])
 
+# api fields kept together in the replication column
+REPLICATION_FIELDS = ("replica_uris", "max_replica_lag")
+
+
+def to_connections_model(values: dict) -> ConnectionsModel:
+    replication = values.get("replication") or {}
+    return ConnectionsModel(
+        uid=values.get("uid"),
+        name=values.get("name"),
+        source=values.get("source"),
+        connection_uri=values.get("connection_uri"),
+        replica_uris=replication.get("replica_uris") or [],
+        max_replica_lag=replication.get("max_replica_lag"),
+    )
+
+
+def validate_replication(source: str, replication: dict):
+    if replication.get("replica_uris") and source != SourceConfig.POSTGRES.value:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Read replicas are only supported for postgres connections",
+        )
+
 
 @router.post("/connections", response_model=ConnectionsModel)
 async def create_connection(connection: CreateConnectionsModel, db: DBSession):
     if connection.source == SourceConfig.SQLITE.value:
         file_path = UPLOAD_DIR / connection.connection_uri
-        if not file_path.exists():
+        if not bucket_store.exists(file_path):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="First upload sqlite to the bucket then add it",
             )
 
-    created = await db.create(Connections(**connection.model_dump()))
+    values = connection.model_dump()
+    replication = {field: values.pop(field) for field in REPLICATION_FIELDS}
+    validate_replication(connection.source, replication)
+
+    created = await db.create(Connections(**values, replication=replication))
     await db.commit()
-    created = created.get_values()
-    return ConnectionsModel(
-        uid=created.get("uid"),
-        name=created.get("name"),
-        source=created.get("source"),
-        connection_uri=created.get("connection_uri"),
-    )
+    return to_connections_model(created.get_values())
 
 
 @router.get("/connections", response_model=ConnectionsModelList)
@@ -34,7 +68,7 @@ async def list_connections(db: DBSession):
     connections = await db.list(Connections)
     results = []
     for connection in connections:
-        results.append(ConnectionsModel(**connection.get_values()))
+        results.append(to_connections_model(connection.get_values()))
     return ConnectionsModelList(connections=results, total=len(results))
 
 
@@ -43,7 +77,7 @@ async def get_connection(connection_uid: str, db: DBSession):
     connection = await db.get(Connections, filters=Connections.uid == connection_uid)
     if not connection:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    return ConnectionsModel(**connection.get_values())
+    return to_connections_model(connection.get_values())
 
 
 @router.put("/connections/{connection_uid}", response_model=ConnectionsModel)
@@ -75,26 +109,28 @@ async def update_connection(
 
     if source == SourceConfig.SQLITE.value:
         file_path = UPLOAD_DIR / connection_uri
-        if not file_path.exists():
+        if not bucket_store.exists(file_path):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="SQLite file not found. Please upload the file first.",
             )
 
+    replication = dict(connection.replication or {})
+    for field in REPLICATION_FIELDS:
+        if field in update_data:
+            replication[field] = update_data.pop(field)
+    validate_replication(source, replication)
+    update_data["replication"] = replication
+
     # Update the connection fields
     for field, value in update_data.items():
         setattr(connection, field, value)
 
     await db.update(Connections,Connections.uid == connection.uid, connection.to_dict())
     await db.commit()
-    # Get updated values
-    updated = connection.get_values()
-    return ConnectionsModel(
-        uid=updated.get("uid"),
-        name=updated.get("name"),
-        source=updated.get("source"),
-        connection_uri=updated.get("connection_uri"),
-    )
+    # open cursors and pooled connections still point at the old source
+    await connection_changed(connection_uid)
+    return to_connections_model(connection.get_values())
 
 
 @router.delete("/connections/{connection_uid}", status_code=status.HTTP_204_NO_CONTENT)
@@ -107,4 +143,52 @@ async def delete_connection(connection_uid: str, db: DBSession):
         )
     await db.delete(Connections,Connections.uid == connection_uid)
     await db.commit()
-    return None
\ No newline at end of file
+    await connection_changed(connection_uid)
+    return None
+
+
+def pool_models(stats: list[dict], uri: str) -> list[PoolModel]:
+    return [
+        PoolModel(
+            read_only=pool["read_only"],
+            size=pool["size"],
+            idle=pool["idle"],
+            max_size=pool["max_size"],
+        )
+        for pool in stats
+        if pool["uri"] == uri
+    ]
+
+
+@router.get("/connections/{connection_uid}/replicas", response_model=ReplicaModelList)
+async def get_replicas(connection_uid: str, db: DBSession):
+    """Health, lag and pools of the read replicas of a connection, checked now."""
+    connection = await get_connection_or_404(db, connection_uid)
+    replica_set = resolve_replicas(connection)
+    if replica_set is not None:
+        await replica_set.check()
+    stats = pools.stats(connection_uid)
+    primary = pool_models(stats, resolve_connection_uri(connection))
+    if replica_set is None:
+        return ReplicaModelList(primary=primary, replicas=[], total=0)
+
+    results = [
+        ReplicaModel(
+            index=index,
+            server=describe_uri(replica.uri),
+            healthy=replica.healthy,
+            lag_seconds=replica.lag,
+            error=replica.error,
+            checked_at=replica.checked_at,
+            in_flight=replica.in_flight,
+            served=replica.served,
+            pools=pool_models(stats, replica.uri),
+        )
+        for index, replica in enumerate(replica_set.replicas)
+    ]
+    return ReplicaModelList(
+        primary=primary,
+        max_replica_lag=replica_set.max_lag,
+        replicas=results,
+        total=len(results),
+    )
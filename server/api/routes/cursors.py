@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Query, HTTPException, status
+from typing import Annotated
+from ..models import CreateCursorModel, CursorModel, CursorPageModel
+from ..database.db import DBSession
+from ..services.cursors import cursors, CursorNotFound, CursorLimitExceeded
+from .common import (
+    ClientId,
+    get_connection_or_404,
+    resolve_connection_uri,
+    raise_database_error,
+)
+
+router = APIRouter(tags=["cursors"])
+
+
+@router.post("/connection/{connection_id}/cursors", response_model=CursorModel)
+async def open_cursor(
+    connection_id: str,
+    cursor: CreateCursorModel,
+    db: DBSession,
+    client_id: ClientId,
+):
+    """Run a query once and keep it open server side for paging."""
+    connection = await get_connection_or_404(db, connection_id)
+    try:
+        session = await cursors.open(
+            connection_id,
+            connection.source,
+            resolve_connection_uri(connection),
+            client_id,
+            cursor.query,
+        )
+    except CursorLimitExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise_database_error(e, "opening cursor")
+
+    return CursorModel(
+        cursor_id=session.cursor_id,
+        connection_id=connection_id,
+        query=session.query,
+        columns=session.columns,
+    )
+
+
+@router.get(
+    "/connection/{connection_id}/cursors/{cursor_id}",
+    response_model=CursorPageModel,
+)
+async def fetch_cursor_page(
+    connection_id: str,
+    cursor_id: str,
+    client_id: ClientId,
+    limit: Annotated[int, Query(gt=0)] = 100,
+    offset: Annotated[int, Query(ge=0)] = 0,
+):
+    try:
+        session, rows, exhausted = await cursors.fetch(
+            connection_id, cursor_id, client_id, offset, limit
+        )
+    except CursorNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise_database_error(e, "fetching cursor page")
+
+    return CursorPageModel(
+        cursor_id=cursor_id,
+        limit=limit,
+        offset=offset,
+        rows=rows,
+        columns=session.columns,
+        exhausted=exhausted,
+    )
+
+
+@router.delete(
+    "/connection/{connection_id}/cursors/{cursor_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def close_cursor(connection_id: str, cursor_id: str, client_id: ClientId):
+    try:
+        cursors.get(connection_id, cursor_id, client_id)
+    except CursorNotFound as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    await cursors.close(cursor_id)
+    return None
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, HTTPException, Request, status
+from ..config import AppConfig
+from ..models import CreateFederatedQueryModel, FederatedQueryResult
+from ..database.db import DBSession
+from ..services.federation import FederatedSource, FederationError, federation
+from ..services.serialization import encode_query_result
+from .common import get_connection_or_404, raise_database_error, resolve_connection_uri
+from .responses import json_response
+
+router = APIRouter(tags=["federation"])
+
+
+@router.post("/federated/queries", response_model=FederatedQueryResult)
+async def execute_federated_query(
+    request: Request, federated: CreateFederatedQueryModel, db: DBSession
+):
+    """Run a read over several connections at once. SQLite connections are
+    named by their alias, postgres tables as alias.table."""
+    sources = []
+    for alias, connection_id in federated.connections.items():
+        connection = await get_connection_or_404(db, connection_id)
+        sources.append(
+            FederatedSource(
+                alias,
+                connection.uid,
+                connection.source,
+                resolve_connection_uri(connection),
+            )
+        )
+    page = AppConfig.MAX_RESULT_ROWS
+    if federated.limit is not None and federated.limit >= 0:
+        page = min(federated.limit, page)
+
+    try:
+        columns, rows, pulls = await federation.run(sources, federated.query, page)
+    except FederationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        raise_database_error(e, "executing federated query")
+
+    truncated = len(rows) > page
+    meta = {
+        "query": federated.query,
+        "connections": federated.connections,
+        "limit": federated.limit,
+        "pulls": pulls,
+    }
+    # pulled tables are cached, the result of the join is not
+    body = encode_query_result(
+        meta, columns, rows[:page], AppConfig.MAX_RESULT_BYTES, truncated
+    )
+    return json_response(request, ("federated",), body, cache=False)
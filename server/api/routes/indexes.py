@@ -0,0 +1,80 @@
+from dataclasses import asdict
+from fastapi import APIRouter, HTTPException, status
+from ..models import IndexAdviceModel, IndexCandidateModel, IndexJobModel
+from ..database.db import DBSession
+from ..services.advisor import advisor
+from .common import get_connection_or_404, raise_database_error, resolve_connection_uri
+
+router = APIRouter(tags=["indexes"])
+
+
+@router.get(
+    "/connections/{connection_uid}/indexes/advice", response_model=IndexAdviceModel
+)
+async def get_index_advice(connection_uid: str, db: DBSession):
+    """Indexes that would serve the full scans and sorts of the statements the
+    connection has been running, with their estimated benefit."""
+    connection = await get_connection_or_404(db, connection_uid)
+    try:
+        advice = await advisor.advise(
+            connection_uid, connection.source, resolve_connection_uri(connection)
+        )
+    except Exception as e:
+        raise_database_error(e, "analyze the workload")
+    candidates = [
+        IndexCandidateModel(
+            id=candidate.id,
+            table=candidate.table,
+            columns=candidate.columns,
+            statement=candidate.statement(connection.source),
+            reasons=sorted(candidate.reasons),
+            queries=[stats.fingerprint for stats in candidate.queries],
+            calls=candidate.calls,
+            total_ms=candidate.total_ms,
+            cost_before=candidate.cost_before,
+            cost_after=candidate.cost_after,
+            improvement=candidate.improvement,
+        )
+        for candidate in advice.candidates
+    ]
+    return IndexAdviceModel(
+        connection_id=connection_uid,
+        analyzed=advice.analyzed,
+        method=advice.method,
+        note=advice.note,
+        candidates=candidates,
+        total=len(candidates),
+    )
+
+
+@router.post(
+    "/connections/{connection_uid}/indexes/advice/{candidate_id}",
+    response_model=IndexJobModel,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def apply_index(connection_uid: str, candidate_id: str, db: DBSession):
+    """Create a suggested index in the background, poll the returned job."""
+    connection = await get_connection_or_404(db, connection_uid)
+    candidate = advisor.candidate(connection_uid, candidate_id)
+    if candidate is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Index suggestion {candidate_id} not found, get the advice again",
+        )
+    job = advisor.apply(
+        connection_uid, connection.source, resolve_connection_uri(connection), candidate
+    )
+    return IndexJobModel(**asdict(job))
+
+
+@router.get(
+    "/connections/{connection_uid}/indexes/jobs/{job_id}", response_model=IndexJobModel
+)
+async def get_index_job(connection_uid: str, job_id: str):
+    job = advisor.job(job_id)
+    if job is None or job.connection_id != connection_uid:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Index job {job_id} not found",
+        )
+    return IndexJobModel(**asdict(job))
@@ -1,78 +1,338 @@
-from fastapi import APIRouter, Query, HTTPException, status
+import asyncio
+import logging
+import time
+from dataclasses import replace
+from fastapi import APIRouter, HTTPException, Query, Request, status
 from typing import Annotated, Optional
-import asyncpg
-from ..config import get_adapter, SourceConfig
-from . import UPLOAD_DIR
-from ..models import QueryResult, TableModelList, TableModel, SchemaModelList, SchemaModel
-from ..database.db import DBSession
-from ..database.models import Connections
+import orjson
+from ..config import AppConfig, SourceConfig
+from ..models import (
+    QueryResult,
+    TableModelList,
+    TableModel,
+    SchemaModelList,
+    SchemaModel,
+    ColumnModelList,
+    ColumnModel,
+)
+from .. import utils
+from ..database.db import DBSession, storage
+from ..database.models import QueryLogs
+from ..services.cache import result_cache
+from ..services.events import data_changed
+from ..services.executor import ReadOnlyViolation, run_query
+from ..services.querystats import QueryStats, query_stats
+from ..services.singleflight import singleflight
+from ..services.sql import StatementKind, classify, explainable, normalize, paginate
+from ..services.serialization import (
+    ROW_BATCH_SIZE,
+    dumps,
+    encode_query_result,
+    iter_query_result,
+)
+from .common import (
+    get_connection_or_404,
+    resolve_connection_uri,
+    resolve_replicas,
+    raise_database_error,
+)
+from .responses import (
+    json_response,
+    payload_response,
+    streaming_json_response,
+    use_cached,
+)
 
 router = APIRouter(tags=["queries"])
 
+logger = logging.getLogger(__name__)
+
+
+def parse_params(params: Optional[str]) -> list:
+    """Bound parameters arrive as a json array in the query string."""
+    if params is None:
+        return []
+    try:
+        values = orjson.loads(params)
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"params must be a json array: {e}",
+        )
+    if not isinstance(values, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="params must be a json array",
+        )
+    return values
+
+
+async def fetch_rows(connection, query: str) -> list[dict]:
+    """Run a catalog read on the read only pool and key rows by column name."""
+    columns, rows = await run_query(
+        connection.uid,
+        connection.source,
+        resolve_connection_uri(connection),
+        classify(query),
+        replicas=resolve_replicas(connection),
+    )
+    names = [column["name"] for column in columns]
+    return [dict(zip(names, row)) for row in rows]
+
 
 @router.get(
     "/connection/{connection_id}/entitities/{entity_name}/queries",
     response_model=QueryResult,
 )
 async def execute_query(
+    request: Request,
     connection_id: str,
     entity_name: str,
     db: DBSession,
     query: Annotated[str, Query()],
     limit: Annotated[Optional[int], Query()] = None,
     offset: Annotated[Optional[int], Query()] = None,
+    params: Annotated[
+        Optional[str],
+        Query(
+            description="json array bound to the placeholders ($1 on postgres, ? on sqlite)"
+        ),
+    ] = None,
 ):
-    connection = await db.get(Connections, filters=Connections.uid == connection_id)
-    if connection.source == SourceConfig.SQLITE.value:
-        connection.connection_uri = UPLOAD_DIR / connection.connection_uri
-    Adapter = get_adapter(connection.source)
-    storage = Adapter(connection_uri=connection.connection_uri)
-    
-    try:
-        async with storage.session() as session:
-            # Execute query as-is (frontend controls pagination in SQL)
-            result = await session.execute(query, force_commit=True)
-            return QueryResult(
-                rows=result.rows,
-                columns=result.description or [],
-                entity_name=entity_name,
-                connection_id=connection_id,
-                query=query,
-                limit=limit,
-                offset=offset,
-            )
-    except asyncpg.exceptions.InternalServerError as e:
+    connection = await get_connection_or_404(db, connection_id)
+    values = parse_params(params)
+    # canonical form, the same values always map to the same cache entry
+    params_key = dumps(values) if values else None
+
+    classification = classify(query)
+    if values and len(classification.statements) > 1:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"PostgreSQL connection error: {str(e)}. Please check your connection URI and credentials.",
+            detail="params can only be bound to a single statement",
         )
-    except asyncpg.exceptions.InvalidPasswordError as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"PostgreSQL authentication failed: {str(e)}. Please check your password.",
+    read = classification.read_only
+    key = (connection_id, "query", query, params_key, entity_name, limit, offset)
+    if read and use_cached(request) and (payload := result_cache.get(key)):
+        return payload_response(request, key, payload)
+    generation = result_cache.generation(connection_id)
+
+    # rows past the page, or past the server cap for "no limit", are not sent;
+    # a single read is wrapped so the database stops after one row more than
+    # the page, which tells whether anything was left out
+    page = AppConfig.MAX_RESULT_ROWS
+    if limit is not None and limit >= 0:
+        page = min(limit, page)
+    statement = None
+    if read and len(classification.statements) == 1:
+        statement = classification.statements[0]
+        if paged := paginate(statement, page + 1, offset):
+            classification = replace(classification, statements=[paged])
+        else:
+            statement = None
+
+    uri = resolve_connection_uri(connection)
+    replicas = resolve_replicas(connection)
+
+    async def execute(classification, replicas=None):
+        started = time.perf_counter()
+        columns, rows = await run_query(
+            connection_id,
+            connection.source,
+            uri,
+            classification,
+            values,
+            replicas,
+            account=True,
         )
-    except asyncpg.exceptions.InvalidCatalogNameError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"PostgreSQL database not found: {str(e)}. Please check your database name.",
+        duration_ms = (time.perf_counter() - started) * 1000
+        fetched = len(rows)
+        observe_query(connection, query, classification, values, duration_ms, fetched)
+        # truncated here as the rows are shared by every coalesced request,
+        # which all have to see how many there were
+        if fetched > page:
+            rows.truncate(page)
+        return columns, rows, fetched
+
+    try:
+        if read:
+            # identical reads arriving together share a single execution
+            columns, rows, fetched = await singleflight.do(
+                (connection_id, normalize(query), params_key, page, offset),
+                lambda: execute(classification, replicas),
+            )
+        else:
+            columns, rows, fetched = await execute(classification)
+    except ReadOnlyViolation:
+        # looked like a read but writes, e.g. through a function with side
+        # effects, run it again on a connection that may write
+        read = False
+        classification = replace(classification, kinds=[StatementKind.WRITE])
+        try:
+            columns, rows, fetched = await execute(classification)
+        except Exception as e:
+            raise_database_error(e, "executing query")
+    except Exception as e:
+        raise_database_error(e, "executing query")
+    if not read:
+        data_changed(connection_id)
+
+    truncated = fetched > page
+    total_rows, estimated = fetched, False
+    if statement is not None:
+        total_rows += offset or 0
+        if truncated:
+            total_rows, estimated = await count_rows(
+                connection, statement, values, replicas, at_least=total_rows
+            )
+
+    # QueryResult only documents the response, rows are encoded straight from
+    # the driver records instead of being validated row by row
+    meta = {
+        "query": query,
+        "connection_id": connection_id,
+        "entity_name": entity_name,
+        "limit": limit,
+        "offset": offset,
+        "params": values or None,
+        "total_rows": total_rows,
+        "total_rows_estimated": estimated,
+    }
+    max_bytes = AppConfig.MAX_RESULT_BYTES
+    # spilled rows are streamed from disk instead of encoded in one piece
+    if len(rows) > ROW_BATCH_SIZE or rows.spilled:
+        return streaming_json_response(
+            request,
+            key,
+            iter_query_result(meta, columns, rows, max_bytes, truncated),
+            read,
+            generation,
         )
-    except (asyncpg.exceptions.PostgresError, ConnectionError, OSError) as e:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Database connection error: {str(e)}. Please check your connection settings and ensure the database server is running.",
+    return json_response(
+        request,
+        key,
+        encode_query_result(meta, columns, rows, max_bytes, truncated),
+        read,
+        generation,
+    )
+
+
+def get_explain_query(connection_type: str, statement: str) -> str:
+    """Get the query returning the plan of a statement without running it."""
+    match SourceConfig(connection_type):
+        case SourceConfig.POSTGRES:
+            return f"EXPLAIN (FORMAT JSON) {statement}"
+        case _:
+            return f"EXPLAIN QUERY PLAN {statement}"
+
+
+def observe_query(
+    connection,
+    query: str,
+    classification,
+    values: list,
+    duration_ms: float,
+    rows: int,
+):
+    """Add an execution to the statement statistics, slow ones get their plan
+    logged in the background."""
+    stats = query_stats.record(connection.uid, query, duration_ms, rows, values or None)
+    if query_stats.plan_due(stats, duration_ms):
+        task = asyncio.get_running_loop().create_task(
+            log_slow_query(
+                connection, query, classification, values, duration_ms, stats
+            )
         )
-    except AttributeError as e:
-        if "'NoneType' object has no attribute 'close'" in str(e):
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Database connection failed. Please check your connection URI and credentials.",
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+
+# slow query logging tasks, referenced until they finish
+_background: set[asyncio.Task] = set()
+
+
+async def log_slow_query(
+    connection,
+    query: str,
+    classification,
+    values: list,
+    duration_ms: float,
+    stats: QueryStats,
+):
+    """Store a slow statement with its plan in QueryLogs."""
+    metadata = {
+        "connection_uid": connection.uid,
+        "source": connection.source,
+        "fingerprint": stats.fingerprint,
+        "fingerprint_id": stats.id,
+        "duration_ms": round(duration_ms, 3),
+        "params": values or None,
+        "logged_at": time.time(),
+        "plan": None,
+    }
+    statement = classification.statements[-1] if classification.statements else ""
+    # the plan of the statement as it ran, limit pushed down included
+    if len(classification.statements) == 1 and explainable(statement):
+        try:
+            _, rows = await run_query(
+                connection.uid,
+                connection.source,
+                resolve_connection_uri(connection),
+                classify(get_explain_query(connection.source, statement)),
+                values,
+                resolve_replicas(connection),
             )
-        raise
+            if connection.source == SourceConfig.POSTGRES.value:
+                plan = rows[0][0]
+                metadata["plan"] = orjson.loads(plan) if isinstance(plan, str) else plan
+            else:
+                # EXPLAIN QUERY PLAN rows are (id, parent, notused, detail)
+                metadata["plan"] = [
+                    {"id": row[0], "parent": row[1], "detail": row[3]} for row in rows
+                ]
+        except Exception as e:
+            metadata["plan_error"] = str(e)
+    try:
+        async with storage.session() as session:
+            await session.create(
+                QueryLogs(connection_id=connection.id, query=query, metadata=metadata)
+            )
+            await session.commit()
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error executing query: {str(e)}",
+        logger.warning("Could not log slow query %s: %s", stats.id, e)
+
+
+def get_count_query(connection_type: str, statement: str) -> str:
+    """Get the query counting the rows of a statement, the planner's estimate
+    on postgres where an exact count can mean reading a whole table."""
+    match SourceConfig(connection_type):
+        case SourceConfig.POSTGRES:
+            return f"EXPLAIN (FORMAT JSON) {statement}"
+        case _:
+            return f"SELECT COUNT(*) FROM ({statement}\n) AS _count"
+
+
+async def count_rows(
+    connection, statement: str, values: list, replicas, at_least: int
+) -> tuple[int | None, bool]:
+    """Total rows of a truncated result and whether it is an estimate."""
+    query = get_count_query(connection.source, statement)
+    try:
+        _, rows = await run_query(
+            connection.uid,
+            connection.source,
+            resolve_connection_uri(connection),
+            classify(query),
+            values,
+            replicas,
         )
+    except Exception:
+        # the rows are there, only their total is unknown
+        return None, False
+    if connection.source == SourceConfig.POSTGRES.value:
+        # json comes back as text
+        plan = orjson.loads(rows[0][0])
+        return max(int(plan[0]["Plan"]["Plan Rows"]), at_least), True
+    return rows[0][0], False
 
 
 def get_tables_query(connection_type: str, schema_name: Optional[str] = None) -> str:
@@ -102,71 +362,76 @@ WHERE nspname NOT LIKE 'pg_%' AND nspname <> 'information_schema'"""
     response_model=TableModelList,
 )
 async def get_tables(
+    request: Request,
     connection_id: str,
     db: DBSession,
     schema: Annotated[Optional[str], Query()] = None,
 ):
     """Get list of tables for a connection."""
-    connection = await db.get(Connections, filters=Connections.uid == connection_id)
-    if not connection:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Connection {connection_id} not found",
-        )
-    
-    if connection.source == SourceConfig.SQLITE.value:
-        connection.connection_uri = UPLOAD_DIR / connection.connection_uri
-    Adapter = get_adapter(connection.source)
-    storage = Adapter(connection_uri=connection.connection_uri)
-    
+    connection = await get_connection_or_404(db, connection_id)
+    key = (connection_id, "tables", schema)
+    if use_cached(request) and (payload := result_cache.get(key)):
+        return payload_response(request, key, payload)
+    generation = result_cache.generation(connection_id)
+
     try:
-        async with storage.session() as session:
-            query = get_tables_query(connection.source, schema)
-            result = await session.execute(query, force_commit=True)
-            tables = []
-            for row in result.rows:
-                # Handle both dict and tuple/list row formats
-                if isinstance(row, dict):
-                    name = row.get("name")
-                elif isinstance(row, (list, tuple)) and len(row) > 0:
-                    name = row[0]
-                else:
-                    name = str(row)
-                if name:
-                    tables.append(TableModel(name=name))
-            return TableModelList(tables=tables, total=len(tables))
-    except asyncpg.exceptions.InternalServerError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"PostgreSQL connection error: {str(e)}. Please check your connection URI and credentials.",
-        )
-    except asyncpg.exceptions.InvalidPasswordError as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"PostgreSQL authentication failed: {str(e)}. Please check your password.",
-        )
-    except asyncpg.exceptions.InvalidCatalogNameError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"PostgreSQL database not found: {str(e)}. Please check your database name.",
-        )
-    except (asyncpg.exceptions.PostgresError, ConnectionError, OSError) as e:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Database connection error: {str(e)}. Please check your connection settings and ensure the database server is running.",
+        rows = await fetch_rows(connection, get_tables_query(connection.source, schema))
+        tables = [TableModel(name=row["name"]) for row in rows if row["name"]]
+    except Exception as e:
+        raise_database_error(e, "fetching tables")
+
+    result = TableModelList(tables=tables, total=len(tables))
+    return json_response(
+        request, key, dumps(result.model_dump()), generation=generation
+    )
+
+
+@router.get(
+    "/connection/{connection_id}/entitities/{entity_name}/columns",
+    response_model=ColumnModelList,
+)
+async def get_columns(
+    request: Request,
+    connection_id: str,
+    entity_name: str,
+    db: DBSession,
+    schema: Annotated[Optional[str], Query()] = None,
+):
+    """Get the columns of a table."""
+    connection = await get_connection_or_404(db, connection_id)
+    key = (connection_id, "columns", entity_name, schema)
+    if use_cached(request) and (payload := result_cache.get(key)):
+        return payload_response(request, key, payload)
+    generation = result_cache.generation(connection_id)
+
+    try:
+        rows = await fetch_rows(
+            connection, utils.get_columns_query(connection.source, entity_name, schema)
         )
-    except AttributeError as e:
-        if "'NoneType' object has no attribute 'close'" in str(e):
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Database connection failed. Please check your connection URI and credentials.",
+        columns = []
+        for row in rows:
+            # sqlite PRAGMA table_info has notnull/dflt_value, postgres the
+            # information_schema names
+            if "nullable" in row:
+                nullable = bool(row["nullable"])
+            else:
+                nullable = not row.get("notnull")
+            default_value = row.get("default_value", row.get("dflt_value"))
+            columns.append(
+                ColumnModel(
+                    name=row["name"],
+                    type=row.get("type") or None,
+                    nullable=nullable,
+                    default_value=None if default_value is None else str(default_value),
+                )
             )
-        raise
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error fetching tables: {str(e)}",
-        )
+        raise_database_error(e, "fetching columns")
+
+    result = ColumnModelList(columns=columns, total=len(columns))
+    return json_response(
+        request, key, dumps(result.model_dump()), generation=generation
+    )
 
 
 @router.get(
@@ -174,71 +439,31 @@ async def get_tables(
     response_model=SchemaModelList,
 )
 async def get_schemas(
+    request: Request,
     connection_id: str,
     db: DBSession,
 ):
     """Get list of schemas for a connection (PostgreSQL only)."""
-    connection = await db.get(Connections, filters=Connections.uid == connection_id)
-    if not connection:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Connection {connection_id} not found",
-        )
-    
+    connection = await get_connection_or_404(db, connection_id)
+
     # Only PostgreSQL supports schemas
     if connection.source != SourceConfig.POSTGRES.value:
         return SchemaModelList(schemas=[], total=0)
-    
-    if connection.source == SourceConfig.SQLITE.value:
-        connection.connection_uri = UPLOAD_DIR / connection.connection_uri
-    Adapter = get_adapter(connection.source)
-    storage = Adapter(connection_uri=connection.connection_uri)
-    
+
+    key = (connection_id, "schemas")
+    if use_cached(request) and (payload := result_cache.get(key)):
+        return payload_response(request, key, payload)
+    generation = result_cache.generation(connection_id)
+
     try:
-        async with storage.session() as session:
-            query = get_schemas_query()
-            result = await session.execute(query, force_commit=True)
-            schemas = []
-            for row in result.rows:
-                # Handle both dict and tuple/list row formats
-                if isinstance(row, dict):
-                    name = row.get("schema_name")
-                elif isinstance(row, (list, tuple)) and len(row) > 0:
-                    name = row[0]
-                else:
-                    name = str(row)
-                if name:
-                    schemas.append(SchemaModel(name=name))
-            return SchemaModelList(schemas=schemas, total=len(schemas))
-    except asyncpg.exceptions.InternalServerError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"PostgreSQL connection error: {str(e)}. Please check your connection URI and credentials.",
-        )
-    except asyncpg.exceptions.InvalidPasswordError as e:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"PostgreSQL authentication failed: {str(e)}. Please check your password.",
-        )
-    except asyncpg.exceptions.InvalidCatalogNameError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"PostgreSQL database not found: {str(e)}. Please check your database name.",
-        )
-    except (asyncpg.exceptions.PostgresError, ConnectionError, OSError) as e:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Database connection error: {str(e)}. Please check your connection settings and ensure the database server is running.",
-        )
-    except AttributeError as e:
-        if "'NoneType' object has no attribute 'close'" in str(e):
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Database connection failed. Please check your connection URI and credentials.",
-            )
-        raise
+        rows = await fetch_rows(connection, get_schemas_query())
+        schemas = [
+            SchemaModel(name=row["schema_name"]) for row in rows if row["schema_name"]
+        ]
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error fetching schemas: {str(e)}",
-        )
+        raise_database_error(e, "fetching schemas")
+
+    result = SchemaModelList(schemas=schemas, total=len(schemas))
+    return json_response(
+        request, key, dumps(result.model_dump()), generation=generation
+    )
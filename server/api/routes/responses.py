@@ -0,0 +1,201 @@
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.datastructures import Headers
+from typing import Iterator
+from ..config import AppConfig
+from ..services.cache import result_cache, CachedPayload
+from ..services.compression import negotiate, compress, StreamCompressor
+
+JSON = "application/json"
+# bytes read at a time when the server can not send a file by itself
+FILE_CHUNK = 1024 * 1024
+
+
+def use_cached(request: Request) -> bool:
+    # Cache-Control: no-cache skips the lookup, the fresh result is still stored
+    return "no-cache" not in request.headers.get("cache-control", "")
+
+
+def payload_response(request: Request, key: tuple, payload: CachedPayload) -> Response:
+    """Send a cached payload in the encoding the client asked for, compressing
+    it at most once per encoding."""
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate(request.headers.get("accept-encoding", ""))
+    if encoding is None or len(payload.body) < AppConfig.COMPRESSION_MIN_SIZE:
+        return Response(payload.body, media_type=JSON, headers=headers)
+
+    data = payload.encoded.get(encoding)
+    if data is None:
+        data = compress(payload.body, encoding)
+        result_cache.add_encoding(key, payload, encoding, data)
+    headers["Content-Encoding"] = encoding
+    return Response(data, media_type=JSON, headers=headers)
+
+
+def json_response(
+    request: Request,
+    key: tuple,
+    body: bytes,
+    cache: bool = True,
+    generation: int | None = None,
+) -> Response:
+    if cache:
+        payload = result_cache.put(key, body, generation=generation)
+    else:
+        payload = CachedPayload(connection_id=key[0], body=body, expires_at=0)
+    return payload_response(request, key, payload)
+
+
+def streaming_json_response(
+    request: Request,
+    key: tuple,
+    chunks: Iterator[bytes],
+    cache: bool = True,
+    generation: int | None = None,
+) -> StreamingResponse:
+    """Stream a body that is still being encoded, compressing chunk by chunk.
+
+    The raw and compressed bytes are collected on the side so the result can
+    be cached once it is complete, unless it outgrows the cache entry limit.
+    """
+    encoding = negotiate(request.headers.get("accept-encoding", ""))
+
+    def body():
+        compressor = StreamCompressor(encoding) if encoding else None
+        raw, encoded, size = ([], [], 0) if cache else (None, None, 0)
+        for chunk in chunks:
+            if raw is not None:
+                size += len(chunk)
+                if size > AppConfig.RESULT_CACHE_MAX_ENTRY_BYTES:
+                    raw = encoded = None
+                else:
+                    raw.append(chunk)
+            if compressor:
+                chunk = compressor.compress(chunk)
+                if not chunk:
+                    continue
+                if encoded is not None:
+                    encoded.append(chunk)
+            yield chunk
+
+        if compressor:
+            tail = compressor.flush()
+            if encoded is not None:
+                encoded.append(tail)
+            yield tail
+        if raw is not None:
+            result_cache.put(
+                key,
+                b"".join(raw),
+                {encoding: b"".join(encoded)} if compressor else None,
+                generation=generation,
+            )
+
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    # a sync iterator, starlette runs the encoding in the threadpool
+    return StreamingResponse(body(), media_type=JSON, headers=headers)
+
+
+def file_etag(stat_result) -> str:
+    # changes when the file is replaced or written to
+    return (
+        f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    )
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def single_range(http_range: str, size: int) -> tuple[int, int] | None:
+    """(start, end) of a Range asking for one satisfiable byte range, None for
+    anything else, which FileResponse answers."""
+    unit, _, spec = http_range.partition("=")
+    first, dash, last = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or "," in spec or not dash:
+        return None
+    try:
+        if not first:
+            # bytes=-500 are the last 500 bytes
+            start, end = max(0, size - int(last)), size
+        else:
+            start, end = int(first), int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if start >= min(end, size):
+        return None
+    return start, min(end, size)
+
+
+class FileDownload(FileResponse):
+    """A file response that answers If-None-Match with 304 and lets the
+    server move the bytes when it can.
+
+    Servers offering the http.response.zerocopysend extension get the open
+    file to sendfile() whole or as a single range, ones offering
+    http.response.pathsend get the path of whole files. Anything else reads
+    the file in FILE_CHUNK pieces.
+    """
+
+    chunk_size = FILE_CHUNK
+
+    async def __call__(self, scope, receive, send):
+        headers = Headers(scope=scope)
+        if etag_matches(headers.get("if-none-match"), self.headers["etag"]):
+            validators = {
+                name: self.headers[name] for name in ("etag", "last-modified")
+            }
+            return await Response(status_code=304, headers=validators)(
+                scope, receive, send
+            )
+        if (
+            self.status_code == 200
+            and self.stat_result is not None
+            and scope["method"] == "GET"
+            and "http.response.zerocopysend" in scope.get("extensions", {})
+        ):
+            size = self.stat_result.st_size
+            start, end = 0, size
+            http_range, if_range = headers.get("range"), headers.get("if-range")
+            if http_range and (if_range is None or self._should_use_range(if_range)):
+                byte_range = single_range(http_range, size)
+                if byte_range is None:
+                    # malformed, unsatisfiable and multipart ranges
+                    return await super().__call__(scope, receive, send)
+                start, end = byte_range
+            await self._zerocopy(
+                send, start, end, size, partial=(start, end) != (0, size)
+            )
+            if self.background is not None:
+                await self.background()
+            return
+        await super().__call__(scope, receive, send)
+
+    async def _zerocopy(self, send, start: int, end: int, size: int, partial: bool):
+        headers = self.headers.mutablecopy()
+        headers["content-length"] = str(end - start)
+        if partial:
+            headers["content-range"] = f"bytes {start}-{end - 1}/{size}"
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 206 if partial else 200,
+                "headers": headers.raw,
+            }
+        )
+        with open(self.path, "rb") as file:
+            await send(
+                {
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": start,
+                    "count": end - start,
+                    "more_body": False,
+                }
+            )
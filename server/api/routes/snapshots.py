@@ -0,0 +1,173 @@
+import os
+import uuid
+from fastapi import APIRouter, HTTPException, status
+from . import UPLOAD_DIR
+from ..config import SourceConfig
+from ..models import CreateSnapshotModel, SnapshotJobModel, SnapshotJobTableModel
+from ..database.db import DBSession, storage
+from ..database.models import Bucket, Connections
+from ..services.events import data_changed
+from ..services.snapshots import SnapshotError, SnapshotJob, SnapshotTable, snapshots
+from ..services.tiering import QuotaExceeded, bucket_store, bucket_uid
+from .common import get_connection_or_404, resolve_connection_uri
+
+router = APIRouter(tags=["snapshots"])
+
+
+def to_snapshot_job_model(job: SnapshotJob) -> SnapshotJobModel:
+    return SnapshotJobModel(
+        id=job.id,
+        kind=job.kind,
+        connection_id=job.connection_id,
+        snapshot_id=job.snapshot_id,
+        snapshot_connection_id=job.snapshot_connection_id,
+        status=job.status,
+        error=job.error,
+        rows=job.rows,
+        tables=[
+            SnapshotJobTableModel(
+                name=table.name,
+                rows=table.rows,
+                watermark=table.watermark,
+                high_water=table.high_water,
+            )
+            for table in job.tables
+        ],
+        created=job.created,
+        finished=job.finished,
+    )
+
+
+async def register_snapshot(job: SnapshotJob, snapshot: dict) -> str:
+    """Add a finished snapshot file to the bucket and as a sqlite connection."""
+    file_name = f"{job.snapshot_id}.db"
+    metadata = {
+        "filename": f"{job.name}.db",
+        "file_size": os.path.getsize(UPLOAD_DIR / file_name),
+        "snapshot": snapshot,
+    }
+    async with storage.session() as session:
+        await session.create(Bucket(uid=job.snapshot_id, metadata=metadata))
+        created = await session.create(
+            Connections(
+                source=SourceConfig.SQLITE.value,
+                name=job.name,
+                connection_uri=file_name,
+            )
+        )
+        await session.commit()
+    return created.get_values()["uid"]
+
+
+async def save_snapshot(job: SnapshotJob, snapshot: dict):
+    """Record the watermarks of a refreshed snapshot in its bucket entry."""
+    async with storage.session() as session:
+        entry = await session.get(Bucket, filters=Bucket.uid == job.snapshot_id)
+        if entry is not None:
+            entry.metadata = {
+                **(entry.metadata or {}),
+                "file_size": os.path.getsize(UPLOAD_DIR / f"{job.snapshot_id}.db"),
+                "snapshot": snapshot,
+            }
+            await session.update(Bucket, Bucket.uid == job.snapshot_id, entry.to_dict())
+            await session.commit()
+    # cached results of the snapshot connection are stale
+    data_changed(job.snapshot_connection_id)
+
+
+@router.post(
+    "/connections/{connection_uid}/snapshots",
+    response_model=SnapshotJobModel,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def create_snapshot(
+    connection_uid: str, snapshot: CreateSnapshotModel, db: DBSession
+):
+    """Copy tables or query results of a postgres connection into a new
+    sqlite file in the bucket, added as a connection once done. Poll the
+    returned job for its progress."""
+    connection = await get_connection_or_404(db, connection_uid)
+    try:
+        await bucket_store.reserve()
+    except QuotaExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_507_INSUFFICIENT_STORAGE, detail=str(e)
+        )
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    tables = [
+        SnapshotTable(
+            # public.orders is stored as orders
+            name=table.name or (table.table or "").split(".")[-1].strip('"'),
+            table=table.table,
+            query=table.query,
+            watermark=table.watermark,
+        )
+        for table in snapshot.tables
+    ]
+    try:
+        job = snapshots.create(
+            connection_uid,
+            connection.source,
+            resolve_connection_uri(connection),
+            snapshot.name or f"{connection.name} snapshot",
+            tables,
+            str(UPLOAD_DIR / f"{uuid.uuid4()}.db"),
+            register_snapshot,
+        )
+    except SnapshotError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return to_snapshot_job_model(job)
+
+
+@router.post(
+    "/connections/{connection_uid}/snapshots/refresh",
+    response_model=SnapshotJobModel,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def refresh_snapshot(connection_uid: str, db: DBSession):
+    """Bring a snapshot connection up to date with the connection it was
+    taken of, from the watermark of each table that has one."""
+    connection = await get_connection_or_404(db, connection_uid)
+    snapshot = None
+    if connection.source == SourceConfig.SQLITE.value:
+        entry = await db.get(
+            Bucket, filters=Bucket.uid == bucket_uid(connection.connection_uri)
+        )
+        snapshot = ((entry.metadata or {}) if entry else {}).get("snapshot")
+    if not snapshot:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Connection {connection_uid} is not a snapshot",
+        )
+    origin = await get_connection_or_404(db, snapshot["connection_id"])
+    try:
+        job = snapshots.refresh(
+            origin.uid,
+            origin.source,
+            resolve_connection_uri(origin),
+            connection_uid,
+            snapshot.get("name") or connection.name,
+            [SnapshotTable(**table) for table in snapshot["tables"]],
+            resolve_connection_uri(connection),
+            save_snapshot,
+        )
+    except SnapshotError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return to_snapshot_job_model(job)
+
+
+@router.get(
+    "/connections/{connection_uid}/snapshots/jobs/{job_id}",
+    response_model=SnapshotJobModel,
+)
+async def get_snapshot_job(connection_uid: str, job_id: str):
+    job = snapshots.job(job_id)
+    if job is None or connection_uid not in (
+        job.connection_id,
+        job.snapshot_connection_id,
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Snapshot job {job_id} not found",
+        )
+    return to_snapshot_job_model(job)
@@ -0,0 +1,104 @@
+import time
+from fastapi import APIRouter, Header, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from typing import Annotated, Optional
+from ..config import AppConfig
+from ..database.db import DBSession
+from ..services.serialization import dumps
+from ..services.watch import (
+    TableWatcher,
+    WatchLimitExceeded,
+    create_watcher,
+    parse_watermark,
+)
+from .common import get_connection_or_404, resolve_connection_uri, raise_database_error
+
+router = APIRouter(tags=["watch"])
+
+
+def sse_event(event: str, data: bytes, event_id: str | None = None) -> bytes:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\n".encode() + b"data: " + data + b"\n\n"
+
+
+async def watch_events(request: Request, watcher: TableWatcher, resumed: bool):
+    """Push new rows while the client is connected, the table is only queried
+    after the watcher noticed a commit."""
+    try:
+        # browsers reconnect after this many ms and send the last event id back
+        yield b"retry: 3000\n\n"
+        last_sent = time.monotonic()
+        # a resumed stream may have missed rows while it was disconnected
+        pending = resumed
+        while not await request.is_disconnected():
+            if pending or await watcher.changed():
+                pending = False
+                async for _, columns, rows in watcher.poll():
+                    names = [column["name"] for column in columns]
+                    data = dumps(
+                        {
+                            "columns": columns,
+                            "rows": [dict(zip(names, row)) for row in rows],
+                        }
+                    )
+                    yield sse_event("rows", data, watcher.event_id)
+                    last_sent = time.monotonic()
+            if time.monotonic() - last_sent >= AppConfig.WATCH_HEARTBEAT_INTERVAL:
+                # keeps proxies from closing an idle stream
+                yield b": ping\n\n"
+                last_sent = time.monotonic()
+            await watcher.wait()
+    except Exception as e:
+        yield sse_event("error", dumps({"detail": str(e)}))
+    finally:
+        await watcher.close()
+
+
+@router.get("/connection/{connection_id}/entitities/{entity_name}/watch")
+async def watch_table(
+    request: Request,
+    connection_id: str,
+    entity_name: str,
+    db: DBSession,
+    key: Annotated[Optional[str], Query()] = None,
+    since: Annotated[Optional[str], Query()] = None,
+    channel: Annotated[Optional[str], Query()] = None,
+    last_event_id: Annotated[Optional[str], Header()] = None,
+):
+    """Stream rows of a table as they are inserted or updated (server sent events).
+
+    Rows are followed by `key`, a monotonic column (rowid on sqlite, the row
+    xmin on postgres when omitted, which scans the whole table on every change
+    and is limited to small tables). `since` or the Last-Event-ID header resume
+    after a watermark, otherwise only rows committed from now on are sent. On
+    postgres `channel` waits for a NOTIFY instead of polling the table stats.
+    """
+    connection = await get_connection_or_404(db, connection_id)
+    since = last_event_id or since
+    try:
+        watcher = create_watcher(
+            connection_id,
+            connection.source,
+            resolve_connection_uri(connection),
+            entity_name,
+            key=key,
+            since=parse_watermark(since),
+            channel=channel,
+        )
+        await watcher.start()
+    except WatchLimitExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        raise_database_error(e, "watching table")
+
+    return StreamingResponse(
+        watch_events(request, watcher, resumed=since is not None),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
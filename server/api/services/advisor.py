@@ -0,0 +1,716 @@
+import asyncio
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import uuid
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+import orjson
+from ..config import AppConfig, SourceConfig
+from .executor import FETCH_SIZE, run_query
+from .pools import pools
+from .querystats import QueryStats, query_stats
+from .sql import classify, explainable, fingerprint_id, tokens
+
+# sqlite counts executed VM instructions in steps of this many as query cost
+STEP_INTERVAL = 1000
+# measured candidates saving less of the workload cost are not suggested
+MIN_IMPROVEMENT = 0.1
+# finished index jobs kept around for polling
+JOBS_KEPT = 100
+
+# words that are never a table alias or a column
+_KEYWORDS = {
+    "all",
+    "and",
+    "as",
+    "asc",
+    "between",
+    "by",
+    "case",
+    "cast",
+    "collate",
+    "cross",
+    "current_date",
+    "current_timestamp",
+    "delete",
+    "desc",
+    "distinct",
+    "else",
+    "end",
+    "escape",
+    "except",
+    "exists",
+    "false",
+    "fetch",
+    "first",
+    "for",
+    "from",
+    "full",
+    "glob",
+    "group",
+    "having",
+    "ilike",
+    "in",
+    "inner",
+    "insert",
+    "intersect",
+    "interval",
+    "into",
+    "is",
+    "join",
+    "last",
+    "lateral",
+    "left",
+    "like",
+    "limit",
+    "natural",
+    "next",
+    "not",
+    "null",
+    "nulls",
+    "offset",
+    "on",
+    "only",
+    "or",
+    "order",
+    "outer",
+    "over",
+    "partition",
+    "recursive",
+    "returning",
+    "right",
+    "row",
+    "rows",
+    "select",
+    "set",
+    "then",
+    "true",
+    "union",
+    "update",
+    "using",
+    "values",
+    "when",
+    "where",
+    "window",
+    "with",
+}
+# words ending an ORDER BY / GROUP BY list or the SET list of an UPDATE
+_CLAUSE_END = {
+    "limit",
+    "offset",
+    "fetch",
+    "for",
+    "having",
+    "window",
+    "union",
+    "except",
+    "intersect",
+    "where",
+    "from",
+    "returning",
+    "order",
+}
+_COMPARISONS = {"=", "==", "<", ">", "<=", ">=", "<>", "!="}
+# predicates an index can serve by seeking to a single value
+_EQUALITY_WORDS = {"in", "is"}
+_RANGE_WORDS = {"between", "like", "glob"}
+
+
+@dataclass
+class StatementShape:
+    """Tables and the column references an index could serve in a statement,
+    columns are (qualifier or None, column)."""
+
+    tables: dict[str, str] = field(default_factory=dict)
+    equality: list[tuple[str | None, str]] = field(default_factory=list)
+    joins: list[tuple[str | None, str]] = field(default_factory=list)
+    ranges: list[tuple[str | None, str]] = field(default_factory=list)
+    ordering: list[tuple[str | None, str]] = field(default_factory=list)
+
+
+def _identifier(kind: str, text: str) -> str | None:
+    if kind == "quoted":
+        return text[1:-1].replace('""', '"')
+    if kind == "word" and text.lower() not in _KEYWORDS:
+        # unquoted identifiers are case insensitive on both sources
+        return text.lower()
+    return None
+
+
+def shape(statement: str) -> StatementShape:
+    """Find the tables a statement reads and the columns it filters, joins
+    and sorts on, from its tokens alone."""
+    toks = [
+        (kind, text)
+        for kind, text in tokens(statement)
+        if kind not in ("space", "comment")
+    ]
+    result = StatementShape()
+
+    def text_at(i: int) -> str:
+        return toks[i][1].lower() if i < len(toks) else ""
+
+    def name_at(i: int) -> tuple[list[str], int]:
+        """A possibly qualified name starting at i and the index after it."""
+        parts: list[str] = []
+        while i < len(toks) and (part := _identifier(*toks[i])) is not None:
+            parts.append(part)
+            if text_at(i + 1) != ".":
+                return parts, i + 1
+            i += 2
+        return parts, i
+
+    def table_at(i: int) -> int:
+        parts, i = name_at(i)
+        if not parts or text_at(i) == "(":
+            return i
+        table = ".".join(parts)
+        result.tables[parts[-1]] = table
+        result.tables[table] = table
+        if text_at(i) == "as":
+            i += 1
+        if i < len(toks) and (alias := _identifier(*toks[i])) is not None:
+            result.tables[alias] = table
+            i += 1
+        return i
+
+    def operator_at(i: int) -> tuple[str, int]:
+        """The operator starting at i, comparisons span up to two tokens."""
+        pair = text_at(i) + text_at(i + 1)
+        if (
+            i + 1 < len(toks)
+            and toks[i][0] == toks[i + 1][0] == "punct"
+            and pair in _COMPARISONS
+        ):
+            return pair, i + 2
+        return text_at(i), i + 1
+
+    mode = None
+    i = 0
+    while i < len(toks):
+        word = text_at(i) if toks[i][0] == "word" else None
+        if word in ("from", "join", "update"):
+            i = table_at(i + 1)
+            while word == "from" and text_at(i) == ",":
+                i = table_at(i + 1)
+            mode = "set" if word == "update" else None
+            continue
+        if word in ("order", "group") and text_at(i + 1) == "by":
+            mode = "order"
+            i += 2
+            continue
+        if word in _CLAUSE_END or text_at(i) == ")":
+            mode = None
+        if (
+            mode != "set"
+            and (i == 0 or text_at(i - 1) != ".")
+            and (parts := name_at(i)[0])
+        ):
+            column = (parts[-2] if len(parts) > 1 else None, parts[-1])
+            end = name_at(i)[1]
+            if text_at(end) == "(":
+                # a function call, its arguments are looked at on their own
+                i = end
+                continue
+            if mode == "order":
+                result.ordering.append(column)
+                i = end
+                continue
+            op, rhs = operator_at(end)
+            if op in ("=", "=="):
+                other, after = name_at(rhs)
+                if other and text_at(after) != "(":
+                    # a join condition, serves whichever side is looked up
+                    result.joins.append(column)
+                    result.joins.append(
+                        (other[-2] if len(other) > 1 else None, other[-1])
+                    )
+                    i = after
+                    continue
+                result.equality.append(column)
+            elif op in _EQUALITY_WORDS:
+                result.equality.append(column)
+            elif op in _COMPARISONS or op in _RANGE_WORDS:
+                result.ranges.append(column)
+            i = end
+            continue
+        i += 1
+    return result
+
+
+def sqlite_findings(plan: list) -> Iterator[tuple[str | None, str]]:
+    """(table or alias, reason) for every full scan and sort of an
+    EXPLAIN QUERY PLAN, sorts are not tied to a table."""
+    for row in plan:
+        detail = row[3]
+        parts = detail.split()
+        if parts[0] == "SCAN" and "USING" not in parts:
+            # older versions say SCAN TABLE t
+            yield (
+                parts[2] if parts[1] == "TABLE" and len(parts) > 2 else parts[1]
+            ), "scan"
+        elif "AUTOMATIC" in parts:
+            # sqlite builds a throwaway index for every execution of the join
+            yield parts[2] if parts[1] == "TABLE" else parts[1], "scan"
+        elif detail.startswith(
+            ("USE TEMP B-TREE FOR ORDER BY", "USE TEMP B-TREE FOR GROUP BY")
+        ):
+            yield None, "sort"
+
+
+def postgres_findings(node: dict) -> Iterator[tuple[str | None, str]]:
+    """(table or alias, reason) for every sequential scan and sort of a plan
+    node and its children."""
+    match node.get("Node Type"):
+        case "Seq Scan":
+            yield node.get("Alias") or node.get("Relation Name"), "scan"
+        case "Sort" | "Incremental Sort":
+            yield None, "sort"
+    for child in node.get("Plans", []):
+        yield from postgres_findings(child)
+
+
+def quote(name: str) -> str:
+    return ".".join('"' + part.replace('"', '""') + '"' for part in name.split("."))
+
+
+@dataclass(eq=False)
+class IndexCandidate:
+    table: str
+    columns: list[str]
+    reasons: set[str] = field(default_factory=set)
+    queries: list[QueryStats] = field(default_factory=list)
+    # call weighted costs of the queries without and with the index: sqlite
+    # VM instructions on a scratch copy, postgres planner cost with hypopg
+    cost_before: float | None = None
+    cost_after: float | None = None
+
+    @property
+    def id(self) -> str:
+        return fingerprint_id(f"{self.table}({', '.join(self.columns)})")
+
+    @property
+    def name(self) -> str:
+        name = "_".join(["idx", self.table.split(".")[-1], *self.columns])
+        return re.sub(r"\W", "_", name)[:63]
+
+    @property
+    def calls(self) -> int:
+        return sum(stats.calls for stats in self.queries)
+
+    @property
+    def total_ms(self) -> float:
+        return sum(stats.total_ms for stats in self.queries)
+
+    @property
+    def improvement(self) -> float | None:
+        """Share of the workload cost the index saves."""
+        if not self.cost_before or self.cost_after is None:
+            return None
+        return max(0.0, 1 - self.cost_after / self.cost_before)
+
+    def statement(self, source: str, concurrently: bool = True) -> str:
+        columns = ", ".join(quote(column) for column in self.columns)
+        # builds on postgres without blocking writes to the table
+        option = (
+            "CONCURRENTLY "
+            if concurrently and source == SourceConfig.POSTGRES.value
+            else ""
+        )
+        return f"CREATE INDEX {option}IF NOT EXISTS {quote(self.name)} ON {quote(self.table)} ({columns})"
+
+
+@dataclass
+class IndexAdvice:
+    connection_id: str
+    candidates: list[IndexCandidate]
+    # statements of the workload that could be explained
+    analyzed: int = 0
+    # how the benefit was estimated, None when it could not be
+    method: str | None = None
+    note: str | None = None
+
+
+@dataclass(eq=False)
+class IndexJob:
+    connection_id: str
+    candidate_id: str
+    statement: str
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "pending"
+    error: str | None = None
+    created: float = field(default_factory=time.time)
+    finished: float | None = None
+
+
+def workload(connection_id: str) -> list[tuple[QueryStats, str]]:
+    """Repeated single statements of a connection, heaviest first."""
+    statements = []
+    for stats in query_stats.top(connection_id, "total", AppConfig.ADVISOR_WORKLOAD):
+        if stats.calls < AppConfig.ADVISOR_MIN_CALLS:
+            continue
+        classification = classify(stats.query)
+        if len(classification.statements) == 1 and explainable(
+            classification.statements[0]
+        ):
+            statements.append((stats, classification.statements[0]))
+    return statements
+
+
+def build_candidates(
+    observed: list[tuple[QueryStats, StatementShape, list]],
+    columns_of: Callable[[str], dict[str, str]],
+) -> dict[str, IndexCandidate]:
+    """Candidate indexes for the scans and sorts found in the plans, merged
+    across statements asking for the same index."""
+    candidates: dict[str, IndexCandidate] = {}
+    for stats, statement_shape, findings in observed:
+        tables = statement_shape.tables
+
+        def owner(qualifier: str | None, column: str) -> tuple[str, str] | None:
+            """The table of a column reference and the column's own spelling."""
+            if qualifier is not None:
+                owners = [tables[qualifier]] if qualifier in tables else []
+            else:
+                owners = list(dict.fromkeys(tables.values()))
+            found = [(table, columns_of(table).get(column.lower())) for table in owners]
+            found = [(table, name) for table, name in found if name]
+            return found[0] if len(found) == 1 else None
+
+        per_table: dict[str, dict[str, list[str]]] = {}
+        for kind in ("equality", "joins", "ranges", "ordering"):
+            for reference in getattr(statement_shape, kind):
+                if resolved := owner(*reference):
+                    table, column = resolved
+                    columns = per_table.setdefault(table, {}).setdefault(kind, [])
+                    if column not in columns:
+                        columns.append(column)
+
+        scanned = {
+            tables.get(name, tables.get(name.lower(), name))
+            for name, reason in findings
+            if reason == "scan"
+        }
+        sorted_ = any(reason == "sort" for _, reason in findings)
+        for table, references in per_table.items():
+            reasons = set()
+            if table in scanned:
+                reasons.add("scan")
+            if sorted_ and references.get("ordering"):
+                reasons.add("sort")
+            if not reasons:
+                continue
+            # equality first, then a single range or the sort order
+            ranges = references.get("ranges", [])
+            columns = list(references.get("equality", []))
+            if "scan" in reasons and ranges:
+                columns.append(ranges[0])
+            elif "sort" in reasons:
+                columns.extend(references["ordering"])
+            if "scan" in reasons and not columns:
+                # scanned only to be joined, the join column is looked up
+                columns = references.get("joins", [])[:1]
+            columns = list(dict.fromkeys(columns))[: AppConfig.ADVISOR_MAX_COLUMNS]
+            if not columns:
+                continue
+            candidate = IndexCandidate(table, columns)
+            candidate = candidates.setdefault(candidate.id, candidate)
+            candidate.reasons |= reasons
+            if stats not in candidate.queries:
+                candidate.queries.append(stats)
+    return candidates
+
+
+def _sqlite_columns(conn, table: str) -> dict[str, str]:
+    schema, _, name = table.rpartition(".")
+    pragma = (
+        f"PRAGMA {quote(schema)}.table_info({quote(name)})"
+        if schema
+        else (f"PRAGMA table_info({quote(name)})")
+    )
+    return {row[1].lower(): row[1] for row in conn.execute(pragma)}
+
+
+def _sqlite_cost(conn, statement: str, params) -> int:
+    """VM instructions the statement takes to produce all its rows, capped at
+    ADVISOR_MAX_STEPS steps."""
+    steps = 0
+
+    def progress():
+        nonlocal steps
+        steps += 1
+        return steps >= AppConfig.ADVISOR_MAX_STEPS
+
+    conn.set_progress_handler(progress, STEP_INTERVAL)
+    try:
+        cursor = conn.execute(statement, params or ())
+        while cursor.fetchmany(FETCH_SIZE):
+            pass
+        cursor.close()
+    except sqlite3.OperationalError:
+        # interrupted past the cap, the cost is at least that much
+        if steps < AppConfig.ADVISOR_MAX_STEPS:
+            raise
+    finally:
+        conn.set_progress_handler(None, 0)
+    return steps * STEP_INTERVAL
+
+
+def _advise_sqlite(
+    connection_id: str, path: str, statements: list[tuple[QueryStats, str]]
+):
+    scratch = None
+    method, note = "scratch copy", None
+    if os.path.getsize(path) > AppConfig.ADVISOR_SCRATCH_MAX_BYTES:
+        method = None
+        note = "The database is larger than ADVISOR_SCRATCH_MAX_BYTES, benefits were not measured"
+        conn = sqlite3.connect(
+            f"file:{path}?mode=ro", uri=True, check_same_thread=False
+        )
+    else:
+        # indexes are tried out on a copy, the database itself is not touched
+        scratch = tempfile.TemporaryDirectory(
+            prefix="datapilot-advisor-", dir=AppConfig.MEMORY_SPILL_DIR
+        )
+        conn = sqlite3.connect(
+            os.path.join(scratch.name, "scratch.db"), isolation_level=None
+        )
+        with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as source:
+            source.backup(conn)
+    try:
+        columns: dict[str, dict[str, str]] = {}
+
+        def columns_of(table: str) -> dict[str, str]:
+            if table not in columns:
+                try:
+                    columns[table] = _sqlite_columns(conn, table)
+                except sqlite3.Error:
+                    columns[table] = {}
+            return columns[table]
+
+        observed = []
+        for stats, statement in statements:
+            try:
+                plan = conn.execute(
+                    f"EXPLAIN QUERY PLAN {statement}", stats.params or ()
+                ).fetchall()
+            except sqlite3.Error:
+                continue
+            observed.append((stats, shape(statement), list(sqlite_findings(plan))))
+        candidates = build_candidates(observed, columns_of)
+
+        if scratch is not None:
+            reads = {
+                stats.fingerprint: statement
+                for stats, statement in statements
+                if classify(statement).read_only
+            }
+            before: dict[str, int] = {}
+            for candidate in candidates.values():
+                measured = [
+                    stats for stats in candidate.queries if stats.fingerprint in reads
+                ]
+                if not measured:
+                    continue
+                for stats in measured:
+                    if stats.fingerprint not in before:
+                        before[stats.fingerprint] = _sqlite_cost(
+                            conn, reads[stats.fingerprint], stats.params
+                        )
+                conn.execute(candidate.statement(SourceConfig.SQLITE.value))
+                try:
+                    after = {
+                        stats.fingerprint: _sqlite_cost(
+                            conn, reads[stats.fingerprint], stats.params
+                        )
+                        for stats in measured
+                    }
+                finally:
+                    conn.execute(f"DROP INDEX {quote(candidate.name)}")
+                candidate.cost_before = sum(
+                    stats.calls * before[stats.fingerprint] for stats in measured
+                )
+                candidate.cost_after = sum(
+                    stats.calls * after[stats.fingerprint] for stats in measured
+                )
+        return IndexAdvice(
+            connection_id, list(candidates.values()), len(observed), method, note
+        )
+    finally:
+        conn.close()
+        if scratch is not None:
+            scratch.cleanup()
+
+
+async def _explain_postgres(conn, statement: str, params) -> dict:
+    from .statements import coerce_parameters
+
+    prepared = await conn.prepare(f"EXPLAIN (FORMAT JSON) {statement}")
+    plan = await prepared.fetchval(*coerce_parameters(prepared, params or []))
+    if isinstance(plan, str):
+        plan = orjson.loads(plan)
+    return plan[0]["Plan"]
+
+
+async def _advise_postgres(
+    connection_id: str, uri: str, statements: list[tuple[QueryStats, str]]
+):
+    source = SourceConfig.POSTGRES.value
+    # hypothetical indexes only exist in the session that created them
+    async with pools.acquire(connection_id, source, uri, read_only=True) as conn:
+        columns: dict[str, dict[str, str]] = {}
+
+        async def load_columns(table: str):
+            if table not in columns:
+                rows = await conn.fetch(
+                    "SELECT attname FROM pg_attribute WHERE attrelid = to_regclass($1) "
+                    "AND attnum > 0 AND NOT attisdropped",
+                    quote(table),
+                )
+                columns[table] = {
+                    row["attname"].lower(): row["attname"] for row in rows
+                }
+
+        observed, plans = [], {}
+        for stats, statement in statements:
+            try:
+                plan = await _explain_postgres(conn, statement, stats.params)
+            except Exception:
+                continue
+            plans[stats.fingerprint] = (statement, plan["Total Cost"])
+            statement_shape = shape(statement)
+            for table in set(statement_shape.tables.values()):
+                await load_columns(table)
+            observed.append((stats, statement_shape, list(postgres_findings(plan))))
+        candidates = build_candidates(observed, lambda table: columns.get(table, {}))
+
+        hypopg = await conn.fetchval(
+            "SELECT 1 FROM pg_extension WHERE extname = 'hypopg'"
+        )
+        if not hypopg:
+            return IndexAdvice(
+                connection_id,
+                list(candidates.values()),
+                len(observed),
+                note="Install the hypopg extension to estimate the benefit of each index",
+            )
+        for candidate in candidates.values():
+            measured = [
+                stats for stats in candidate.queries if stats.fingerprint in plans
+            ]
+            await conn.fetchval(
+                "SELECT indexrelid FROM hypopg_create_index($1)",
+                candidate.statement(source, concurrently=False),
+            )
+            try:
+                after = {}
+                for stats in measured:
+                    statement = plans[stats.fingerprint][0]
+                    plan = await _explain_postgres(conn, statement, stats.params)
+                    after[stats.fingerprint] = plan["Total Cost"]
+            finally:
+                await conn.execute("SELECT hypopg_reset()")
+            candidate.cost_before = sum(
+                stats.calls * plans[stats.fingerprint][1] for stats in measured
+            )
+            candidate.cost_after = sum(
+                stats.calls * after[stats.fingerprint] for stats in measured
+            )
+        return IndexAdvice(
+            connection_id, list(candidates.values()), len(observed), "hypopg"
+        )
+
+
+class IndexAdvisor:
+    """Suggests indexes from the statements a connection has been running.
+
+    The repeated statements recorded in the query stats are explained, full
+    scans and sorts in their plans are matched with the columns they filter,
+    join and sort on, and every candidate is tried out: created on a scratch
+    copy of a sqlite database and measured, or created as a hypothetical
+    index with hypopg on postgres and costed by the planner. The latest advice
+    of a connection is kept so a candidate can be applied by its id.
+    """
+
+    def __init__(self):
+        self._advice: dict[str, dict[str, IndexCandidate]] = {}
+        self._jobs: dict[str, IndexJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def advise(self, connection_id: str, source: str, uri: str) -> IndexAdvice:
+        statements = workload(connection_id)
+        match SourceConfig(source):
+            case SourceConfig.SQLITE:
+                advice = await asyncio.to_thread(
+                    _advise_sqlite, connection_id, str(uri), statements
+                )
+            case SourceConfig.POSTGRES:
+                advice = await _advise_postgres(connection_id, uri, statements)
+            case _:
+                raise ValueError(f"Index advice not supported for source: {source}")
+        advice.candidates = [
+            candidate
+            for candidate in advice.candidates
+            if candidate.improvement is None or candidate.improvement >= MIN_IMPROVEMENT
+        ]
+        advice.candidates.sort(
+            key=lambda candidate: (candidate.improvement or 0, candidate.total_ms),
+            reverse=True,
+        )
+        self._advice[connection_id] = {
+            candidate.id: candidate for candidate in advice.candidates
+        }
+        return advice
+
+    def candidate(self, connection_id: str, candidate_id: str) -> IndexCandidate | None:
+        return self._advice.get(connection_id, {}).get(candidate_id)
+
+    def apply(
+        self, connection_id: str, source: str, uri: str, candidate: IndexCandidate
+    ) -> IndexJob:
+        """Create the index of a candidate in the background."""
+        for job in self._jobs.values():
+            # candidate ids only hash the table and columns
+            if (
+                job.connection_id == connection_id
+                and job.candidate_id == candidate.id
+                and job.status in ("pending", "running")
+            ):
+                return job
+        job = IndexJob(connection_id, candidate.id, candidate.statement(source))
+        self._jobs[job.id] = job
+        finished = [job for job in self._jobs.values() if job.finished]
+        for old in sorted(finished, key=lambda job: job.finished)[
+            : len(finished) - JOBS_KEPT
+        ]:
+            self._jobs.pop(old.id, None)
+        task = asyncio.get_running_loop().create_task(self._run(job, source, uri))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: IndexJob, source: str, uri: str):
+        job.status = "running"
+        try:
+            await run_query(job.connection_id, source, uri, classify(job.statement))
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        else:
+            job.status = "done"
+            self._advice.get(job.connection_id, {}).pop(job.candidate_id, None)
+        finally:
+            job.finished = time.time()
+
+    def job(self, job_id: str) -> IndexJob | None:
+        return self._jobs.get(job_id)
+
+    def discard(self, connection_id: str):
+        self._advice.pop(connection_id, None)
+
+
+advisor = IndexAdvisor()
@@ -0,0 +1,153 @@
+import asyncio
+import sys
+import time
+from dataclasses import dataclass
+from ..config import AppConfig
+
+
+def is_unreachable(e: Exception) -> bool:
+    """The server could not be reached or dropped the connection.
+
+    Other client side errors, e.g. a parameter asyncpg cannot encode (a
+    DataError, which is an InterfaceError), are the request's fault and
+    must not count against the server.
+    """
+    if isinstance(e, (OSError, asyncio.TimeoutError)):
+        return True
+    asyncpg = sys.modules.get("asyncpg")
+    return bool(asyncpg) and isinstance(
+        e,
+        (
+            # includes ConnectionDoesNotExistError, the connection was lost mid query
+            asyncpg.exceptions.PostgresConnectionError,
+            asyncpg.exceptions.CannotConnectNowError,
+        ),
+    )
+
+
+class CircuitOpen(ConnectionError):
+    """The server failed too often lately, the request was not attempted.
+
+    A ConnectionError so callers treat it like the server being unreachable,
+    e.g. reads fall back from a replica to the primary.
+    """
+
+    def __init__(self, error: str, retry_after: float):
+        super().__init__(f"{error} (not retried for {retry_after:.0f}s)")
+        self.error = error
+        self.retry_after = retry_after
+
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+@dataclass(eq=False)
+class Breaker:
+    connection_id: str
+    uri: str
+    state: str = CLOSED
+    # consecutive uses that could not reach the server
+    failures: int = 0
+    error: str | None = None
+    # monotonic time the next probe may go through, and wall clock for the api
+    retry_at: float = 0.0
+    opened_at: float | None = None
+    # consecutive times it opened, for the backoff, and times in total
+    trips: int = 0
+    opened: int = 0
+    rejected: int = 0
+    probing: bool = False
+
+    @property
+    def backoff(self) -> float:
+        return min(
+            AppConfig.BREAKER_BACKOFF * 2 ** max(0, self.trips - 1),
+            AppConfig.BREAKER_MAX_BACKOFF,
+        )
+
+    def allow(self):
+        """Let a use through or raise CircuitOpen. Once the backoff is over a
+        single use probes the server while the others keep failing fast."""
+        if self.state == CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == OPEN and now >= self.retry_at:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self.probing:
+            self.probing = True
+            return
+        self.rejected += 1
+        raise CircuitOpen(
+            self.error or "the server is unreachable", max(0.0, self.retry_at - now)
+        )
+
+    def succeeded(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.error = None
+        self.opened_at = None
+        self.probing = False
+
+    def failed(self, e: Exception):
+        self.failures += 1
+        self.error = str(e) or type(e).__name__
+        if self.state == HALF_OPEN or self.failures >= AppConfig.BREAKER_FAILURES:
+            self.trips += 1
+            self.opened += 1
+            self.state = OPEN
+            self.opened_at = time.time()
+            self.retry_at = time.monotonic() + self.backoff
+        self.probing = False
+
+    def settle(self):
+        # a probe that neither reached nor missed the server, e.g. cancelled,
+        # leaves the next use to probe
+        self.probing = False
+
+
+class BreakerRegistry:
+    """A circuit breaker per connection and server.
+
+    After BREAKER_FAILURES consecutive uses that could not reach a server its
+    breaker opens, and uses fail at once with the last error instead of each
+    waiting for a connect timeout. After BREAKER_BACKOFF seconds, doubling on
+    every failed probe up to BREAKER_MAX_BACKOFF, one use is let through to
+    probe the server and closes the breaker when it gets an answer.
+    """
+
+    def __init__(self):
+        self._breakers: dict[tuple[str, str], Breaker] = {}
+
+    def get(self, connection_id: str, uri: str) -> Breaker:
+        key = (connection_id, str(uri))
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = Breaker(connection_id, str(uri))
+        return breaker
+
+    def discard(self, connection_id: str):
+        for key in [key for key in self._breakers if key[0] == connection_id]:
+            self._breakers.pop(key, None)
+
+    def snapshot(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "connection_id": breaker.connection_id,
+                "uri": breaker.uri,
+                "state": breaker.state,
+                "failures": breaker.failures,
+                "error": breaker.error,
+                "opened_at": breaker.opened_at,
+                "retry_in": (
+                    max(0.0, breaker.retry_at - now) if breaker.state == OPEN else None
+                ),
+                "opened": breaker.opened,
+                "rejected": breaker.rejected,
+            }
+            for breaker in self._breakers.values()
+        ]
+
+
+breakers = BreakerRegistry()
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+from pathlib import Path
+from typing import Awaitable, Callable
+from ..config import AppConfig, SourceConfig
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "datapilot_events"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+class UnixSocketTransport:
+    """Datagrams between the workers of one host.
+
+    Every worker binds a socket under <dir>/peers and a message is sent to all
+    sockets found there, sockets of workers that died are removed on the way.
+    """
+
+    def __init__(self, directory: str):
+        self.peers = Path(directory) / "peers"
+        self.path = self.peers / f"{os.getpid()}.sock"
+        self._sock: socket.socket | None = None
+
+    async def start(self, deliver: Callable[[bytes], None], missed: Callable[[], None]):
+        self.peers.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(str(self.path))
+        self._sock.setblocking(False)
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self._sock.fileno(), self._read, deliver)
+
+    def _read(self, deliver: Callable[[bytes], None]):
+        try:
+            data = self._sock.recv(65536)
+        except BlockingIOError:
+            return
+        deliver(data)
+
+    def publish(self, data: bytes):
+        for peer in self.peers.glob("*.sock"):
+            if peer == self.path:
+                continue
+            try:
+                self._sock.sendto(data, str(peer))
+            except (ConnectionRefusedError, FileNotFoundError):
+                peer.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning("Could not notify worker %s: %s", peer.stem, e)
+
+    async def stop(self):
+        if self._sock:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+        self.path.unlink(missing_ok=True)
+
+
+class PostgresNotifyTransport:
+    """LISTEN/NOTIFY on the shared config database, reaches every node.
+
+    When the connection is lost it is reopened in the background, waiting
+    BREAKER_BACKOFF seconds doubling up to BREAKER_MAX_BACKOFF between tries.
+    Messages published meanwhile are sent once it is back, and since those of
+    the other nodes are lost `missed` is called to drop what they invalidated.
+    """
+
+    # most messages kept to send after a reconnect
+    MAX_PENDING = 1000
+
+    def __init__(self, uri: str):
+        self.uri = uri
+        self._conn = None
+        self._deliver: Callable[[bytes], None] | None = None
+        self._missed: Callable[[], None] | None = None
+        self._pending: list[str] = []
+        self._reconnecting: asyncio.Task | None = None
+        self._stopped = False
+
+    async def start(self, deliver: Callable[[bytes], None], missed: Callable[[], None]):
+        self._deliver = deliver
+        self._missed = missed
+        await self._connect()
+
+    async def _connect(self):
+        import asyncpg
+
+        conn = await asyncpg.connect(self.uri)
+        try:
+            await conn.add_listener(CHANNEL, self._receive)
+        except BaseException:
+            await conn.close()
+            raise
+        conn.add_termination_listener(self._terminated)
+        self._conn = conn
+
+    def _receive(self, _conn, _pid, _channel, payload: str):
+        self._deliver(payload.encode())
+
+    def _terminated(self, conn):
+        if self._stopped or conn is not self._conn:
+            return
+        logger.warning("Lost the broadcast connection, reconnecting")
+        self._conn = None
+        self._reconnecting = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = AppConfig.BREAKER_BACKOFF
+        while not self._stopped:
+            await asyncio.sleep(delay)
+            try:
+                await self._connect()
+            except Exception as e:
+                logger.warning("Could not reconnect for broadcasts: %s", e)
+                delay = min(delay * 2, AppConfig.BREAKER_MAX_BACKOFF)
+                continue
+            self._reconnecting = None
+            self._missed()
+            pending, self._pending = self._pending, []
+            for payload in pending:
+                await self._notify(payload)
+            return
+
+    def publish(self, data: bytes):
+        asyncio.get_running_loop().create_task(self._notify(data.decode()))
+
+    async def _notify(self, payload: str):
+        if self._conn is None:
+            self._hold(payload)
+            return
+        try:
+            await self._conn.execute("SELECT pg_notify($1, $2)", CHANNEL, payload)
+        except Exception as e:
+            if self._conn is None or self._conn.is_closed():
+                self._hold(payload)
+            else:
+                logger.warning("Could not broadcast %s: %s", payload, e)
+
+    def _hold(self, payload: str):
+        if len(self._pending) >= self.MAX_PENDING:
+            logger.warning("Could not broadcast %s: not connected", payload)
+            return
+        self._pending.append(payload)
+
+    async def stop(self):
+        self._stopped = True
+        if self._reconnecting:
+            self._reconnecting.cancel()
+            self._reconnecting = None
+        if self._conn:
+            await self._conn.close()
+            self._conn = None
+
+
+class Broadcaster:
+    """Sends invalidation messages to the other workers.
+
+    Postgres is used when it is the shared config store since it reaches every
+    node, otherwise unix sockets in SHARED_CACHE_DIR reach the workers of this
+    host. Without either the broadcaster stays a no-op.
+    """
+
+    def __init__(self):
+        self._transport = None
+        self._handler: Handler | None = None
+
+    def _create_transport(self):
+        if AppConfig.CONFIG_STORE == SourceConfig.POSTGRES.value:
+            return PostgresNotifyTransport(AppConfig.CONFIG_DB_URI)
+        if AppConfig.SHARED_CACHE_DIR:
+            return UnixSocketTransport(AppConfig.SHARED_CACHE_DIR)
+        return None
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+        transport = self._create_transport()
+        if transport is None:
+            return
+        try:
+            await transport.start(self._deliver, self._missed)
+        except Exception as e:
+            logger.warning("Broadcasting disabled, could not start transport: %s", e)
+            return
+        self._transport = transport
+
+    def _deliver(self, data: bytes):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        if message.get("origin") == WORKER_ID:
+            return
+        asyncio.get_running_loop().create_task(self._handle(message))
+
+    def _missed(self):
+        """Messages of other workers may have been lost, have everything dropped."""
+        asyncio.get_running_loop().create_task(self._handle({"type": "missed"}))
+
+    async def _handle(self, message: dict):
+        try:
+            await self._handler(message)
+        except Exception as e:
+            logger.warning("Could not handle broadcast %s: %s", message, e)
+
+    def publish(self, message: dict):
+        if self._transport is None:
+            return
+        self._transport.publish(json.dumps({**message, "origin": WORKER_ID}).encode())
+
+    async def stop(self):
+        if self._transport:
+            await self._transport.stop()
+            self._transport = None
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from ..config import AppConfig
+from .shared_cache import SharedCache
+
+
+@dataclass
+class CachedPayload:
+    """An encoded response body and the compressed variants already produced."""
+
+    connection_id: str
+    body: bytes
+    expires_at: float
+    encoded: dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(data) for data in self.encoded.values())
+
+
+class ResultCache:
+    """Per worker LRU of query results and catalog responses.
+
+    Entries are keyed by (connection_id, kind, text) so everything belonging to
+    a connection can be dropped when it is written to. Streamed responses fill
+    the cache from the threadpool, hence the lock.
+
+    With a shared tier configured, misses fall through to the entries the other
+    workers of the host stored and every put is written through to it.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, shared: SharedCache | None = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: OrderedDict[tuple, CachedPayload] = OrderedDict()
+        self._size = 0
+        self._generations: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def generation(self, connection_id: str) -> int:
+        """Bumped on every invalidation, a result computed under an older
+        generation may already be stale and is not stored."""
+        return self._generations.get(connection_id, 0)
+
+    def get(self, key: tuple) -> CachedPayload | None:
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                if payload.expires_at >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    return payload
+                self._remove(key)
+
+        if self.shared is None or self.ttl <= 0:
+            return None
+        generation = self.generation(key[0])
+        found = self.shared.get(key)
+        if found is None:
+            return None
+        body, encoded, remaining = found
+        payload = CachedPayload(
+            connection_id=key[0],
+            body=body,
+            expires_at=time.monotonic() + remaining,
+            encoded=encoded,
+        )
+        self._store(key, payload, generation)
+        return payload
+
+    def put(
+        self,
+        key: tuple,
+        body: bytes,
+        encoded: dict[str, bytes] | None = None,
+        generation: int | None = None,
+    ) -> CachedPayload:
+        payload = CachedPayload(
+            connection_id=key[0],
+            body=body,
+            expires_at=time.monotonic() + self.ttl,
+            encoded=encoded or {},
+        )
+        if self.ttl <= 0 or payload.size > AppConfig.RESULT_CACHE_MAX_ENTRY_BYTES:
+            return payload
+        if self._store(key, payload, generation) and self.shared:
+            self.shared.put(key, body, encoded)
+        return payload
+
+    def _store(
+        self, key: tuple, payload: CachedPayload, generation: int | None
+    ) -> bool:
+        with self._lock:
+            if generation is not None and generation != self.generation(key[0]):
+                return False
+            self._remove(key)
+            self._entries[key] = payload
+            self._size += payload.size
+            self._evict()
+            return True
+
+    def add_encoding(
+        self, key: tuple, payload: CachedPayload, encoding: str, data: bytes
+    ):
+        with self._lock:
+            if self._entries.get(key) is not payload:
+                # not cached (too big or evicted meanwhile), keep it off the books
+                payload.encoded[encoding] = data
+                return
+            payload.encoded[encoding] = data
+            self._size += len(data)
+            self._evict()
+        if self.shared:
+            self.shared.add_encoding(key, encoding, data)
+
+    def invalidate(self, connection_id: str):
+        with self._lock:
+            self._generations[connection_id] = self.generation(connection_id) + 1
+            for key in [key for key in self._entries if key[0] == connection_id]:
+                self._remove(key)
+        if self.shared:
+            self.shared.invalidate(connection_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        if self.shared:
+            self.shared.clear()
+
+    def _remove(self, key: tuple):
+        payload = self._entries.pop(key, None)
+        if payload:
+            self._size -= payload.size
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            _, payload = self._entries.popitem(last=False)
+            self._size -= payload.size
+
+
+result_cache = ResultCache(
+    AppConfig.RESULT_CACHE_MAX_BYTES,
+    AppConfig.RESULT_CACHE_TTL,
+    (
+        SharedCache(
+            AppConfig.SHARED_CACHE_DIR,
+            AppConfig.RESULT_CACHE_TTL,
+            AppConfig.SHARED_CACHE_MAX_BYTES,
+        )
+        if AppConfig.SHARED_CACHE_DIR
+        else None
+    ),
+)
@@ -0,0 +1,192 @@
+import gzip
+import zlib
+from importlib.util import find_spec
+
+# zstd and brotli come with the optional "compression" extra, they are only
+# imported once a client actually asks for them
+_MODULES = {"zstd": "zstandard", "br": "brotli", "gzip": "gzip"}
+
+# preferred first, json compresses best and fastest with zstd
+ENCODINGS = [name for name, module in _MODULES.items() if find_spec(module)]
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# brotli defaults to 11 which is far too slow for dynamic responses
+BROTLI_QUALITY = 5
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    """Pick the content coding for an Accept-Encoding header, None for identity."""
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+
+    best, best_q = None, 0.0
+    for name in ENCODINGS:
+        q = accepted.get(name, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    match encoding:
+        case "zstd":
+            import zstandard
+
+            return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        case "br":
+            import brotli
+
+            return brotli.compress(data, quality=BROTLI_QUALITY)
+        case "gzip":
+            return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+class StreamCompressor:
+    """Incremental compressor for bodies that are produced chunk by chunk."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        match encoding:
+            case "zstd":
+                import zstandard
+
+                self._compressor = zstandard.ZstdCompressor(
+                    level=ZSTD_LEVEL
+                ).compressobj()
+            case "br":
+                import brotli
+
+                self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            case "gzip":
+                self._compressor = zlib.compressobj(GZIP_LEVEL, wbits=31)
+            case _:
+                raise ValueError(f"Unsupported content encoding: {encoding}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk)
+        return self._compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+# upload file suffixes and leading bytes of compressed payloads
+UPLOAD_SUFFIXES = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+MAGIC = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+# decompressed bytes produced at a time, whatever the input
+OUTPUT_CHUNK = 1024 * 1024
+# a zstd frame may ask for a window up to this size, larger ones are refused
+ZSTD_MAX_WINDOW = 1 << 27
+
+
+class DecompressionLimitExceeded(Exception):
+    """A compressed upload expands past the allowed size or ratio."""
+
+
+def sniff(head: bytes) -> str | None:
+    """The content coding of a payload from its first bytes."""
+    for magic, encoding in MAGIC.items():
+        if head.startswith(magic):
+            return encoding
+    return None
+
+
+class StreamDecompressor:
+    """Incremental decompressor that hands its output to `write` in pieces of
+    at most OUTPUT_CHUNK bytes, so a small input cannot expand in memory.
+
+    Fails with DecompressionLimitExceeded once the output passes `max_size`,
+    or `max_ratio` times the input after the first OUTPUT_CHUNK bytes.
+    """
+
+    def __init__(self, encoding: str, write, max_size: int, max_ratio: float):
+        self.encoding = encoding
+        self.read = 0
+        self.written = 0
+        # size the first zstd frame announces, when it does
+        self._expected: int | None = None
+        self._write = write
+        self._max_size = max_size
+        self._max_ratio = max_ratio
+        match encoding:
+            case "gzip":
+                self._decompressor = zlib.decompressobj(wbits=31)
+            case "zstd":
+                import zstandard
+
+                self._decompressor = zstandard.ZstdDecompressor(
+                    max_window_size=ZSTD_MAX_WINDOW
+                ).stream_writer(
+                    self, write_size=OUTPUT_CHUNK, write_return_read=True, closefd=False
+                )
+            case _:
+                raise ValueError(f"Unsupported content encoding: {encoding}")
+
+    # zstandard writes its output here
+    def write(self, data: bytes) -> int:
+        self.written += len(data)
+        if self.written > self._max_size:
+            raise DecompressionLimitExceeded(
+                f"Decompressed upload exceeds {self._max_size // 2**20} MB"
+            )
+        if self.written > OUTPUT_CHUNK and self.written > self.read * self._max_ratio:
+            raise DecompressionLimitExceeded(
+                f"Upload expands more than {self._max_ratio:g} times, refusing it"
+            )
+        self._write(data)
+        return len(data)
+
+    def decompress(self, chunk: bytes):
+        if self.encoding == "zstd":
+            import zstandard
+
+            try:
+                if not self.read and len(chunk) >= 18:
+                    size = zstandard.get_frame_parameters(chunk).content_size
+                    if size != zstandard.CONTENTSIZE_UNKNOWN:
+                        self._expected = size
+                self.read += len(chunk)
+                self._decompressor.write(chunk)
+            except zstandard.ZstdError as e:
+                # reported like zlib.error and truncation, as a bad upload
+                raise ValueError(str(e)) from e
+            return
+        self.read += len(chunk)
+        while chunk:
+            self.write(self._decompressor.decompress(chunk, OUTPUT_CHUNK))
+            chunk = self._decompressor.unconsumed_tail
+            if self._decompressor.eof:
+                # concatenated gzip members, as written by pigz or cat
+                chunk = self._decompressor.unused_data + chunk
+                if chunk:
+                    self._decompressor = zlib.decompressobj(wbits=31)
+
+    def finish(self):
+        if self.encoding == "zstd":
+            self._decompressor.flush()
+            # zstandard keeps waiting for the rest of a frame cut short instead
+            # of failing, the announced size tells it apart
+            if (self.read and not self.written) or (
+                self._expected is not None and self.written < self._expected
+            ):
+                raise ValueError("Compressed upload is truncated")
+            return
+        if not self._decompressor.eof:
+            raise ValueError("Compressed upload is truncated")
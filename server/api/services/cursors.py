@@ -0,0 +1,288 @@
+import asyncio
+import time
+import uuid
+from abc import ABC, abstractmethod
+from ..config import AppConfig, SourceConfig
+from .breaker import breakers, is_unreachable
+from .pools import call_sqlite, pools
+from .sql import classify
+from .tiering import bucket_store
+
+
+class CursorNotFound(Exception):
+    pass
+
+
+class CursorLimitExceeded(Exception):
+    pass
+
+
+class CursorSession(ABC):
+    """A query kept open on a pinned pooled connection so pages can be
+    fetched without executing the query again."""
+
+    def __init__(self, connection_id: str, owner: str, query: str, pool, conn):
+        self.cursor_id = str(uuid.uuid4())
+        self.connection_id = connection_id
+        self.owner = owner
+        # DECLARE/statement handles take a single statement without terminator
+        self.query = query.strip().rstrip(";")
+        self.pool = pool
+        self.conn = conn
+        self.columns: list = []
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    @abstractmethod
+    async def open(self):
+        """Run the query and read its columns."""
+
+    @abstractmethod
+    async def fetch(self, offset: int, limit: int) -> tuple[list, bool]:
+        """Return the rows of the page and whether the cursor is exhausted."""
+
+    @abstractmethod
+    async def _close(self):
+        """Free what the query holds on the connection."""
+
+    async def close(self):
+        try:
+            await self._close()
+        finally:
+            await self.pool.release(self.conn)
+
+
+class PostgresCursor(CursorSession):
+    @property
+    def name(self) -> str:
+        return f"dp_{self.cursor_id.replace('-', '')}"
+
+    async def open(self):
+        # WITH HOLD keeps the cursor alive outside of a transaction block,
+        # SCROLL allows going back to earlier pages
+        await self.conn.execute(
+            f"DECLARE {self.name} SCROLL CURSOR WITH HOLD FOR {self.query}"
+        )
+        statement = await self.conn.prepare(f"FETCH FORWARD 0 FROM {self.name}")
+        self.columns = [
+            {"name": attribute.name, "type": attribute.type.name}
+            for attribute in statement.get_attributes()
+        ]
+
+    async def fetch(self, offset: int, limit: int) -> tuple[list, bool]:
+        await self.conn.execute(f"MOVE ABSOLUTE {offset} IN {self.name}")
+        rows = await self.conn.fetch(f"FETCH FORWARD {limit} FROM {self.name}")
+        return [dict(row) for row in rows], len(rows) < limit
+
+    async def _close(self):
+        await self.conn.execute(f"CLOSE {self.name}")
+
+
+def _execute_sqlite(conn, query: str):
+    wal = conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    return wal, conn.execute(query)
+
+
+class SQLiteCursor(CursorSession):
+    """sqlite statements are forward only, rows already stepped over are
+    buffered so earlier pages can be served again. Only the first
+    MAX_RESULT_ROWS rows can be paged through, the buffer lives in the
+    worker.
+
+    An unfinished statement holds a SHARED lock on a database in rollback
+    journal mode, every write to the file fails with "database is locked"
+    while it is open. On such databases the rows are read when the cursor
+    is opened and the statement is finished right away, only databases in
+    WAL mode, where readers do not block writers, keep it open between pages.
+    """
+
+    async def open(self):
+        self._buffer: list = []
+        # rows past MAX_RESULT_ROWS that were left unread
+        self._truncated = False
+        wal, self._cursor = await call_sqlite(self.conn, _execute_sqlite, self.query)
+        self.columns = [
+            {"name": column[0], "type": None}
+            for column in self._cursor.description or []
+        ]
+        self._exhausted = self._cursor.description is None
+        if not wal and not self._exhausted:
+            await self._read(AppConfig.MAX_RESULT_ROWS + 1)
+            self._truncated = len(self._buffer) > AppConfig.MAX_RESULT_ROWS
+            del self._buffer[AppConfig.MAX_RESULT_ROWS :]
+            await self._close()
+            self._exhausted = True
+
+    async def _read(self, count: int):
+        batch = await call_sqlite(self.conn, lambda conn: self._cursor.fetchmany(count))
+        self._buffer.extend(batch)
+        self._exhausted = len(batch) < count
+
+    async def fetch(self, offset: int, limit: int) -> tuple[list, bool]:
+        bucket_store.touch(self.pool.path)
+        if offset >= AppConfig.MAX_RESULT_ROWS:
+            raise ValueError(
+                f"SQLite cursors page through the first {AppConfig.MAX_RESULT_ROWS} rows, "
+                "narrow the query to read further"
+            )
+        end = min(offset + limit, AppConfig.MAX_RESULT_ROWS)
+        missing = end - len(self._buffer)
+        if missing > 0 and not self._exhausted:
+            await self._read(missing)
+            self._truncated = (
+                not self._exhausted and len(self._buffer) >= AppConfig.MAX_RESULT_ROWS
+            )
+
+        names = [column["name"] for column in self.columns]
+        rows = [dict(zip(names, row)) for row in self._buffer[offset:end]]
+        return rows, self._exhausted and not self._truncated and end >= len(
+            self._buffer
+        )
+
+    async def _close(self):
+        await call_sqlite(self.conn, lambda conn: self._cursor.close())
+
+
+class CursorRegistry:
+    """Open cursor sessions of this worker.
+
+    Sessions idle for longer than CURSOR_IDLE_TIMEOUT are closed by a
+    background reaper and each owner can hold at most MAX_CURSORS_PER_USER.
+    Cursors only read and pin a connection of the read pool each, at most
+    MAX_CURSORS of them and always fewer than the pool holds, so queries
+    are never left without connections.
+    """
+
+    def __init__(self):
+        self._sessions: dict[str, CursorSession] = {}
+        self._reaper: asyncio.Task | None = None
+
+    def count(self, owner: str) -> int:
+        return sum(1 for session in self._sessions.values() if session.owner == owner)
+
+    async def open(
+        self, connection_id: str, source: str, uri: str, owner: str, query: str
+    ) -> CursorSession:
+        if not classify(query).read_only:
+            raise ValueError("Cursors can only be opened on queries that read")
+        if self.count(owner) >= AppConfig.MAX_CURSORS_PER_USER:
+            raise CursorLimitExceeded(
+                f"At most {AppConfig.MAX_CURSORS_PER_USER} cursors can be open at once"
+            )
+        limit = min(AppConfig.MAX_CURSORS, AppConfig.POOL_MAX_SIZE - 1)
+        if len(self._sessions) >= limit:
+            raise CursorLimitExceeded(
+                "Too many cursors are open, close some or try again later"
+            )
+
+        match SourceConfig(source):
+            case SourceConfig.POSTGRES:
+                Cursor = PostgresCursor
+            case SourceConfig.SQLITE:
+                Cursor = SQLiteCursor
+                bucket_store.touch(uri)
+            case _:
+                raise ValueError(f"Cursors not supported for source: {source}")
+
+        pool, conn = await self._acquire(connection_id, source, uri)
+        session = Cursor(connection_id, owner, query, pool, conn)
+        # registered before opening so concurrent requests count it against the cap
+        self._sessions[session.cursor_id] = session
+        try:
+            await session.open()
+        except BaseException:
+            self._sessions.pop(session.cursor_id, None)
+            await pool.release(conn)
+            raise
+
+        self._ensure_reaper()
+        return session
+
+    async def _acquire(self, connection_id: str, source: str, uri: str):
+        """A connection of the read pool, unless the server's circuit breaker
+        is open or none frees up within POOL_CONNECT_TIMEOUT."""
+        breaker = breakers.get(connection_id, uri)
+        breaker.allow()
+        try:
+            pool = await pools.get(connection_id, source, uri, read_only=True)
+            try:
+                conn = await asyncio.wait_for(
+                    pool.acquire(), AppConfig.POOL_CONNECT_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                # the pool is busy, not the server gone
+                raise CursorLimitExceeded(
+                    "No connection freed up for the cursor, try again later"
+                ) from None
+        except Exception as e:
+            if is_unreachable(e):
+                breaker.failed(e)
+            else:
+                breaker.succeeded()
+            raise
+        else:
+            breaker.succeeded()
+        finally:
+            breaker.settle()
+        return pool, conn
+
+    def get(self, connection_id: str, cursor_id: str, owner: str) -> CursorSession:
+        session = self._sessions.get(cursor_id)
+        if (
+            not session
+            or session.owner != owner
+            or session.connection_id != connection_id
+        ):
+            raise CursorNotFound(f"Cursor {cursor_id} not found or expired")
+        session.last_used = time.monotonic()
+        return session
+
+    async def fetch(
+        self, connection_id: str, cursor_id: str, owner: str, offset: int, limit: int
+    ) -> tuple[CursorSession, list, bool]:
+        session = self.get(connection_id, cursor_id, owner)
+        # a pinned connection can only run one statement at a time
+        async with session.lock:
+            rows, exhausted = await session.fetch(offset, limit)
+        session.last_used = time.monotonic()
+        return session, rows, exhausted
+
+    async def close(self, cursor_id: str):
+        session = self._sessions.pop(cursor_id, None)
+        if session:
+            async with session.lock:
+                await session.close()
+
+    async def close_connection(self, connection_id: str):
+        for session in list(self._sessions.values()):
+            if session.connection_id == connection_id:
+                await self.close(session.cursor_id)
+
+    async def close_all(self):
+        for cursor_id in list(self._sessions):
+            await self.close(cursor_id)
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+
+    def _ensure_reaper(self):
+        loop = asyncio.get_running_loop()
+        if self._reaper and not self._reaper.done() and self._reaper.get_loop() is loop:
+            return
+        self._reaper = loop.create_task(self._reap())
+
+    async def _reap(self):
+        interval = max(1.0, AppConfig.CURSOR_IDLE_TIMEOUT / 4)
+        while self._sessions:
+            await asyncio.sleep(interval)
+            deadline = time.monotonic() - AppConfig.CURSOR_IDLE_TIMEOUT
+            for session in list(self._sessions.values()):
+                if session.last_used < deadline and not session.lock.locked():
+                    try:
+                        await self.close(session.cursor_id)
+                    except Exception:
+                        # the connection is gone already, nothing left to free
+                        pass
+
+
+cursors = CursorRegistry()
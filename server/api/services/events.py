@@ -0,0 +1,47 @@
+from .advisor import advisor
+from .breaker import breakers
+from .broadcast import broadcaster
+from .cache import result_cache
+from .cursors import cursors
+from .federation import federation
+from .pools import pools
+from .replicas import replicas
+from .supervisor import supervisor
+
+
+def data_changed(connection_id: str, propagate: bool = True):
+    """Something was written through a connection, cached results are stale."""
+    result_cache.invalidate(connection_id)
+    federation.invalidate(connection_id)
+    replicas.wrote(connection_id)
+    if propagate:
+        broadcaster.publish({"type": "data_changed", "connection_id": connection_id})
+
+
+async def connection_changed(connection_id: str, propagate: bool = True):
+    """A connection was updated or deleted, drop everything opened for it."""
+    await cursors.close_connection(connection_id)
+    await pools.discard(connection_id)
+    replicas.discard(connection_id)
+    advisor.discard(connection_id)
+    supervisor.discard(connection_id)
+    breakers.discard(connection_id)
+    result_cache.invalidate(connection_id)
+    federation.invalidate(connection_id)
+    if propagate:
+        broadcaster.publish(
+            {"type": "connection_changed", "connection_id": connection_id}
+        )
+
+
+async def handle(message: dict):
+    """Apply a message broadcast by another worker."""
+    match message.get("type"):
+        case "data_changed":
+            data_changed(message["connection_id"], propagate=False)
+        case "connection_changed":
+            await connection_changed(message["connection_id"], propagate=False)
+        case "missed":
+            # invalidations of other workers were lost while disconnected
+            result_cache.clear()
+            federation.clear()
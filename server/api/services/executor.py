@@ -0,0 +1,225 @@
+import sqlite3
+import sys
+from typing import Sequence
+from ..config import SourceConfig
+from .memory import QueryMemory, RowBuffer, memory
+from .pools import call_sqlite, pools
+from .breaker import is_unreachable
+from .replicas import ReplicaSet, is_recovery_conflict
+from .sql import Classification
+from .supervisor import supervisor
+from .tiering import bucket_store
+
+# rows read from the driver at a time
+FETCH_SIZE = 1000
+
+
+class ReadOnlyViolation(Exception):
+    """A statement classified as a read tried to write, e.g. a SELECT calling
+    a function with side effects. It has to run again as a write."""
+
+
+def _is_read_only_violation(e: Exception) -> bool:
+    if isinstance(e, sqlite3.OperationalError):
+        return "readonly database" in str(e)
+    asyncpg = sys.modules.get("asyncpg")
+    return bool(asyncpg) and isinstance(
+        e, asyncpg.exceptions.ReadOnlySQLTransactionError
+    )
+
+
+def _fetch_sqlite(
+    conn, query: str, params: Sequence = (), usage: QueryMemory | None = None
+):
+    cursor = conn.execute(query, params)
+    try:
+        columns = [
+            {"name": column[0], "type": None} for column in cursor.description or []
+        ]
+        rows = RowBuffer(usage)
+        while batch := cursor.fetchmany(FETCH_SIZE):
+            rows.extend(batch)
+        return columns, rows.result()
+    finally:
+        cursor.close()
+
+
+def _run_sqlite(
+    conn,
+    statements: list[str],
+    params: Sequence,
+    transaction: bool,
+    usage: QueryMemory | None = None,
+):
+    """Run the statements in order, the result is the one of the last."""
+    if len(statements) == 1:
+        return _fetch_sqlite(conn, statements[0], params, usage)
+    if transaction:
+        conn.execute("BEGIN")
+    try:
+        for statement in statements[:-1]:
+            conn.execute(statement).close()
+        result = _fetch_sqlite(conn, statements[-1], usage=usage)
+    except BaseException:
+        if transaction and conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    if transaction:
+        conn.execute("COMMIT")
+    return result
+
+
+async def _fetch_rows(conn, statement, args: list, usage: QueryMemory | None):
+    rows = RowBuffer(usage)
+    if usage is None or not statement.get_attributes():
+        rows.extend(await statement.fetch(*args))
+        return rows.result()
+
+    # batch by batch through a portal so every batch is accounted for before
+    # the next one is read, portals only live inside a transaction
+    async def read():
+        cursor = await statement.cursor(*args)
+        while batch := await cursor.fetch(FETCH_SIZE):
+            rows.extend(batch)
+
+    if conn.is_in_transaction():
+        await read()
+    else:
+        async with conn.transaction():
+            await read()
+    return rows.result()
+
+
+async def _fetch_postgres(
+    conn, query: str, params: Sequence = (), usage: QueryMemory | None = None
+):
+    from .statements import STALE_STATEMENT_ERRORS, coerce_parameters
+
+    for attempt in range(2):
+        statement = await conn.prepare_cached(query)
+        try:
+            rows = await _fetch_rows(
+                conn, statement, coerce_parameters(statement, params), usage
+            )
+        except STALE_STATEMENT_ERRORS:
+            # the schema changed under the cached statement, prepare it again
+            conn.evict_statement(query)
+            if attempt:
+                raise
+            continue
+        columns = [
+            {"name": attribute.name, "type": attribute.type.name}
+            for attribute in statement.get_attributes()
+        ]
+        return columns, rows
+
+
+async def _run_postgres(
+    conn,
+    statements: list[str],
+    params: Sequence,
+    transaction: bool,
+    usage: QueryMemory | None = None,
+):
+    if len(statements) == 1:
+        return await _fetch_postgres(conn, statements[0], params, usage)
+
+    async def run():
+        for statement in statements[:-1]:
+            await conn.execute(statement)
+        return await _fetch_postgres(conn, statements[-1], usage=usage)
+
+    if not transaction:
+        return await run()
+    async with conn.transaction():
+        return await run()
+
+
+async def _execute(
+    connection_id: str,
+    source: str,
+    uri: str,
+    statements: list[str],
+    params: Sequence,
+    read_only: bool,
+    transaction: bool,
+    account: bool,
+):
+    usage = memory.open(connection_id, statements[-1]) if account else None
+    if source == SourceConfig.SQLITE.value:
+        bucket_store.touch(uri)
+    async with pools.acquire(connection_id, source, uri, read_only) as conn:
+        try:
+            match SourceConfig(source):
+                case SourceConfig.POSTGRES:
+                    return await _run_postgres(
+                        conn, statements, params, transaction, usage
+                    )
+                case SourceConfig.SQLITE:
+                    # interrupted when cancelled, e.g. a shared query nobody awaits anymore
+                    return await call_sqlite(
+                        conn, _run_sqlite, statements, params, transaction, usage
+                    )
+                case _:
+                    raise ValueError(f"Unsupported source: {source}")
+        except Exception as e:
+            if read_only and _is_read_only_violation(e):
+                raise ReadOnlyViolation(str(e)) from e
+            raise
+
+
+async def run_query(
+    connection_id: str,
+    source: str,
+    uri: str,
+    classification: Classification,
+    params: Sequence = (),
+    replicas: ReplicaSet | None = None,
+    account: bool = False,
+):
+    """Run classified statements on a pooled connection.
+
+    Reads go to the read only pool, outside of any transaction and without a
+    commit, on one of the `replicas` when the connection has any. A replica
+    that cannot be reached is marked unhealthy and the read runs on the
+    primary. Several statements that write run in one transaction. `params`
+    are bound to the placeholders of a single statement ($1 on postgres, ? on
+    sqlite). Returns the column definitions and the rows of the last statement
+    exactly as the driver produced them (sqlite tuples or asyncpg records),
+    encoding is left to the caller. With `account` the rows are fetched in
+    batches charged to the memory budget, and may come back spilled to disk.
+    """
+    statements = classification.statements or [""]
+    if params and len(statements) > 1:
+        raise ValueError("Bound parameters need a single statement")
+    supervisor.watch(connection_id, source, uri)
+    read_only = classification.read_only
+    # statements that write run atomically unless they manage it themselves
+    transaction = (
+        not read_only
+        and len(statements) > 1
+        and not classification.controls_transaction
+    )
+
+    if read_only and replicas is not None and (replica := await replicas.choose()):
+        try:
+            with replicas.use(replica):
+                return await _execute(
+                    connection_id,
+                    source,
+                    replica.uri,
+                    statements,
+                    params,
+                    True,
+                    False,
+                    account,
+                )
+        except Exception as e:
+            if is_unreachable(e):
+                replicas.failed(replica, e)
+            elif not is_recovery_conflict(e):
+                raise
+
+    return await _execute(
+        connection_id, source, uri, statements, params, read_only, transaction, account
+    )
@@ -0,0 +1,812 @@
+import asyncio
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import date, datetime, time as time_of_day
+from decimal import Decimal
+from urllib.parse import quote as quote_path
+import orjson
+from ..config import AppConfig, SourceConfig
+from .advisor import quote, shape
+from .cache import result_cache
+from .executor import FETCH_SIZE
+from .pools import pools
+from .singleflight import singleflight
+from .sql import classify, tokens
+from .tiering import bucket_store
+
+# databases sqlite lets a connection attach, every sqlite connection and
+# every pulled table takes one
+MAX_ATTACHED = 10
+# schema the n-th pulled table is attached as
+REMOTE_SCHEMA = "_remote{}"
+ALIAS = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# postgres types a literal may be compared with on the server; numeric is
+# left out as it becomes a float in the engine and may compare differently
+NUMBER_TYPES = ("smallint", "integer", "bigint", "real", "double precision")
+TEXT_TYPES = ("text", "character varying")
+# engine column affinity by postgres type prefix
+AFFINITIES = {
+    "smallint": "INTEGER",
+    "integer": "INTEGER",
+    "bigint": "INTEGER",
+    "boolean": "INTEGER",
+    "numeric": "NUMERIC",
+    "real": "REAL",
+    "double precision": "REAL",
+    "bytea": "BLOB",
+}
+# words that may follow a table in FROM where an alias would go
+_AFTER_TABLE = {
+    "where",
+    "join",
+    "inner",
+    "left",
+    "right",
+    "full",
+    "cross",
+    "natural",
+    "on",
+    "using",
+    "group",
+    "order",
+    "limit",
+    "window",
+    "having",
+    "union",
+    "intersect",
+    "except",
+    "indexed",
+    "not",
+}
+# words ending the WHERE clause of a select
+_WHERE_END = {"group", "order", "limit", "offset", "window", "having", "fetch"}
+_COMPOUND = {"union", "intersect", "except"}
+
+
+class FederationError(ValueError):
+    """The federated query cannot be planned or run."""
+
+
+@dataclass
+class FederatedSource:
+    alias: str
+    connection_id: str
+    source: str
+    uri: str
+
+
+@dataclass(eq=False)
+class RemoteTable:
+    """A postgres table a federated query reads, pulled into the engine."""
+
+    alias: str
+    # as written in the query, unquoted names lower cased
+    name: str
+    schema: str
+    relation: str = ""
+    # postgres column name -> type, in table order
+    columns: dict[str, str] = field(default_factory=dict)
+    needed: set[str] = field(default_factory=set)
+    predicates: list[str] = field(default_factory=list)
+    # times it is named in the query, and whether once in the outer FROM
+    references: int = 0
+    top_level: bool = False
+
+
+@dataclass(eq=False)
+class Pull:
+    """Rows of a remote table stored in a sqlite file for the engine."""
+
+    connection_id: str
+    relation: str
+    columns: tuple[str, ...]
+    predicates: tuple[str, ...]
+    path: str
+    rows: int
+    size: int
+    expires_at: float
+    users: int = 0
+    dropped: bool = False
+
+    def drop(self):
+        self.dropped = True
+        if not self.users:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def _identifier(kind: str, text: str) -> str | None:
+    if kind == "quoted":
+        return text[1:-1].replace('""', '"')
+    if kind == "word":
+        return text.lower()
+    return None
+
+
+def quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class _Tokens:
+    """The tokens of a query, with the positions of the significant ones."""
+
+    def __init__(self, query: str):
+        self.all = list(tokens(query))
+        self.sig = [
+            i
+            for i, (kind, _) in enumerate(self.all)
+            if kind not in ("space", "comment")
+        ]
+
+    def kind(self, i: int) -> str:
+        return self.all[self.sig[i]][0] if i < len(self.sig) else ""
+
+    def text(self, i: int) -> str:
+        return self.all[self.sig[i]][1] if i < len(self.sig) else ""
+
+    def lower(self, i: int) -> str:
+        return self.text(i).lower()
+
+    def name(self, i: int) -> str | None:
+        return _identifier(self.kind(i), self.text(i)) if i < len(self.sig) else None
+
+
+def find_remote_tables(
+    query: str, aliases: set[str]
+) -> tuple[dict, list[tuple[int, int, tuple]]]:
+    """The tables of postgres `aliases` a query names as alias.table, and the
+    token spans naming them to rewrite."""
+    toks = _Tokens(query)
+    tables: dict[tuple[str, str], RemoteTable] = {}
+    spans = []
+    depth = 0
+    for i in range(len(toks.sig)):
+        text = toks.text(i)
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        alias = toks.name(i)
+        if (
+            alias not in aliases
+            or toks.text(i + 1) != "."
+            or (i and toks.text(i - 1) == ".")
+            or (name := toks.name(i + 2)) is None
+        ):
+            continue
+        key = (alias, name)
+        if key not in tables:
+            tables[key] = RemoteTable(alias, name, REMOTE_SCHEMA.format(len(tables)))
+        table = tables[key]
+        spans.append((toks.sig[i], toks.sig[i + 2], key))
+        # alias.table.column names a column, not another use of the table
+        if toks.text(i + 3) != ".":
+            table.references += 1
+            table.top_level = (
+                depth == 0 and i > 0 and toks.lower(i - 1) in ("from", "join", ",")
+            )
+    return tables, spans
+
+
+def rewrite(query: str, tables: dict, spans: list) -> str:
+    """Point alias.table at the schema the pulled table is attached as."""
+    parts = [text for _, text in tokens(query)]
+    for start, end, key in reversed(spans):
+        table = tables[key]
+        parts[start : end + 1] = [
+            f"{quote_ident(table.schema)}.{quote_ident(table.name)}"
+        ]
+    return "".join(parts)
+
+
+def _where_conjuncts(toks: _Tokens) -> list[list[int]] | None:
+    """Token positions of the AND-ed terms of the outer WHERE, None when it
+    cannot be split safely."""
+    depth, start, end = 0, None, len(toks.sig)
+    for i in range(len(toks.sig)):
+        text = toks.lower(i)
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and toks.kind(i) == "word":
+            if text in _COMPOUND:
+                return None
+            if text == "where" and start is None:
+                start = i + 1
+            elif start is not None and end == len(toks.sig) and text in _WHERE_END:
+                end = i
+    if start is None:
+        return []
+    conjuncts, current, depth, between = [], [], 0, False
+    for i in range(start, end):
+        text = toks.lower(i)
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth == 0 and toks.kind(i) == "word":
+            if text == "or":
+                return None
+            if text == "between":
+                between = True
+            elif text == "and":
+                if not between:
+                    conjuncts.append(current)
+                    current = []
+                    continue
+                between = False
+        current.append(i)
+    conjuncts.append(current)
+    return conjuncts
+
+
+def _literal(toks: _Tokens, i: int) -> tuple[str | None, str, int]:
+    """(kind, text, next position) of a number or plain string literal."""
+    sign = ""
+    if toks.text(i) == "-" and toks.kind(i + 1) == "number":
+        sign, i = "-", i + 1
+    kind, text = toks.kind(i), toks.text(i)
+    if kind == "number":
+        return "number", sign + text, i + 1
+    if kind == "string" and text.startswith("'") and not sign:
+        return "string", text, i + 1
+    return None, "", i
+
+
+def _operator(toks: _Tokens, i: int) -> tuple[str, int]:
+    pair = toks.text(i) + toks.text(i + 1)
+    if toks.kind(i) == toks.kind(i + 1) == "punct" and pair in (
+        "<=",
+        ">=",
+        "<>",
+        "!=",
+        "==",
+    ):
+        return ("=" if pair == "==" else pair), i + 2
+    return toks.lower(i), i + 1
+
+
+def _accepts(column_type: str, literal: str, op: str) -> bool:
+    if literal == "number":
+        return column_type.startswith(NUMBER_TYPES)
+    # equality is the same on both sides, ordering depends on the collation
+    return column_type.startswith(TEXT_TYPES) and op in ("=", "<>", "!=", "in")
+
+
+def push_down(query: str, tables: dict):
+    """Give each remote table the terms of the outer WHERE that compare one
+    of its columns with literals, to be applied when it is pulled.
+
+    Only plain comparisons that reject nulls are pushed, the engine still
+    applies every term afterwards, so pulling more rows than needed is the
+    worst case.
+    """
+    toks = _Tokens(query)
+    conjuncts = _where_conjuncts(toks)
+    if not conjuncts:
+        return
+    # a table used once in the outer FROM can be filtered on its own
+    eligible = {
+        key: table
+        for key, table in tables.items()
+        if table.references == 1 and table.top_level
+    }
+    if not eligible:
+        return
+    # what columns of the outer WHERE are qualified with: the alias of a
+    # table, or its name when it has none
+    names: dict[str, RemoteTable] = {}
+    for i in range(len(toks.sig)):
+        if (
+            toks.text(i + 1) == "."
+            and (key := (toks.name(i), toks.name(i + 2))) in eligible
+        ):
+            after = i + 3 + (toks.lower(i + 3) == "as")
+            alias = toks.name(after)
+            if toks.text(after - 1) == "." or toks.text(after) == ".":
+                continue
+            if alias is None or (toks.kind(after) == "word" and alias in _AFTER_TABLE):
+                alias = key[1]
+            names[alias] = eligible[key]
+    # unqualified columns belong to the table when it is the only one
+    only = None
+    if len(eligible) == 1 and len(set(shape(query).tables.values())) == 1:
+        only = next(iter(eligible.values()))
+
+    def column_at(i: int) -> tuple[RemoteTable | None, str | None, int]:
+        parts = []
+        while toks.kind(i) in ("word", "quoted"):
+            parts.append(toks.name(i))
+            i += 1
+            if toks.text(i) != ".":
+                break
+            i += 1
+        if not parts or toks.text(i) == "(":
+            return None, None, i
+        if len(parts) == 1:
+            table = only
+        elif len(parts) == 2:
+            table = names.get(parts[0])
+        else:
+            table = eligible.get((parts[-3], parts[-2]))
+        if table is None or parts[-1] not in table.columns:
+            return None, None, i
+        return table, parts[-1], i
+
+    for conjunct in conjuncts:
+        if not conjunct:
+            continue
+        first, last = conjunct[0], conjunct[-1] + 1
+        table, column, i = column_at(first)
+        reverse = False
+        if table is None:
+            # 5 < t.a
+            kind, value, i = _literal(toks, first)
+            if kind is None:
+                continue
+            op, i = _operator(toks, i)
+            table, column, end = column_at(i)
+            if (
+                table is None
+                or end != last
+                or op not in ("=", "<", ">", "<=", ">=", "<>", "!=")
+            ):
+                continue
+            flipped = {"<": ">", ">": "<", "<=": ">=", ">=": "<="}.get(op, op)
+            if _accepts(table.columns[column], kind, flipped):
+                table.predicates.append(f"{quote_ident(column)} {flipped} {value}")
+            continue
+        column_type = table.columns[column]
+        op, i = _operator(toks, i)
+        if op in ("=", "<", ">", "<=", ">=", "<>", "!="):
+            kind, value, end = _literal(toks, i)
+            if kind and end == last and _accepts(column_type, kind, op):
+                table.predicates.append(f"{quote_ident(column)} {op} {value}")
+        elif op == "in" and toks.text(i) == "(":
+            values, kinds, i = [], set(), i + 1
+            while True:
+                kind, value, i = _literal(toks, i)
+                if kind is None:
+                    break
+                values.append(value)
+                kinds.add(kind)
+                if toks.text(i) == ")":
+                    i += 1
+                    break
+                if toks.text(i) != ",":
+                    kind = None
+                    break
+                i += 1
+            if (
+                kind
+                and i == last
+                and len(kinds) == 1
+                and _accepts(column_type, kinds.pop(), "in")
+            ):
+                table.predicates.append(
+                    f"{quote_ident(column)} IN ({', '.join(values)})"
+                )
+        elif op == "between":
+            low_kind, low, i = _literal(toks, i)
+            if toks.lower(i) != "and":
+                continue
+            high_kind, high, i = _literal(toks, i + 1)
+            if (
+                low_kind == high_kind == "number"
+                and i == last
+                and _accepts(column_type, "number", op)
+            ):
+                table.predicates.append(
+                    f"{quote_ident(column)} BETWEEN {low} AND {high}"
+                )
+
+
+def affinity(column_type: str) -> str:
+    for prefix, affinity in AFFINITIES.items():
+        if column_type.startswith(prefix):
+            return affinity
+    return "TEXT"
+
+
+def _engine_value(value):
+    """A value sqlite can store, in the form the query results show it."""
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return int(value) if isinstance(value, bool) else value
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime, date, time_of_day)):
+        return value.isoformat()
+    if isinstance(value, memoryview):
+        return bytes(value)
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value).decode()
+    return str(value)
+
+
+def _attach_uri(path: str) -> str:
+    return f"file:{quote_path(str(path))}?mode=ro"
+
+
+def _engine(sqlite_sources: dict[str, str]) -> sqlite3.Connection:
+    # uri filenames let the attached databases be opened read only
+    conn = sqlite3.connect("file::memory:", uri=True, check_same_thread=False)
+    for alias, path in sqlite_sources.items():
+        conn.execute(f"ATTACH DATABASE ? AS {quote_ident(alias)}", (_attach_uri(path),))
+    return conn
+
+
+def _needed_columns(
+    query: str, sqlite_sources: dict[str, str], tables: list[RemoteTable]
+):
+    """Compile the query against empty copies of the remote tables, sqlite
+    reports every column it reads to the authorizer."""
+    reads: set[tuple[str, str, str]] = set()
+
+    def authorizer(action, table, column, schema, _):
+        if action == sqlite3.SQLITE_READ:
+            reads.add((schema, table, column))
+        return sqlite3.SQLITE_OK
+
+    with closing(_engine(sqlite_sources)) as conn:
+        for table in tables:
+            conn.execute(f"ATTACH DATABASE ':memory:' AS {quote_ident(table.schema)}")
+            columns = ", ".join(
+                f"{quote_ident(name)} {affinity(column_type)}"
+                for name, column_type in table.columns.items()
+            )
+            conn.execute(
+                f"CREATE TABLE {quote_ident(table.schema)}.{quote_ident(table.name)} ({columns})"
+            )
+        conn.set_authorizer(authorizer)
+        try:
+            conn.execute(f"EXPLAIN {query}").fetchall()
+        except sqlite3.Error as e:
+            raise FederationError(str(e)) from e
+    for table in tables:
+        table.needed = {
+            column
+            for schema, name, column in reads
+            if schema == table.schema
+            and name.lower() == table.name.lower()
+            and column in table.columns
+        }
+
+
+def _execute(
+    query: str,
+    sqlite_sources: dict[str, str],
+    pulls: list[tuple[RemoteTable, Pull]],
+    page: int,
+):
+    deadline = time.monotonic() + AppConfig.FEDERATED_TIMEOUT
+    with closing(_engine(sqlite_sources)) as conn:
+        for table, pull in pulls:
+            conn.execute(
+                f"ATTACH DATABASE ? AS {quote_ident(table.schema)}",
+                (_attach_uri(pull.path),),
+            )
+        conn.execute("PRAGMA query_only = 1")
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, 10_000)
+        try:
+            cursor = conn.execute(query)
+            columns = [
+                {"name": column[0], "type": None} for column in cursor.description or []
+            ]
+            rows = cursor.fetchmany(page + 1)
+        except sqlite3.OperationalError as e:
+            if time.monotonic() > deadline:
+                raise FederationError(
+                    f"The federated query ran longer than {AppConfig.FEDERATED_TIMEOUT}s"
+                ) from e
+            raise FederationError(str(e)) from e
+        except sqlite3.Error as e:
+            raise FederationError(str(e)) from e
+    return columns, rows
+
+
+def _create_pull_file(
+    path: str, name: str, columns: dict[str, str]
+) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    # a throwaway file, written once and rebuilt when lost
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    definition = ", ".join(
+        f"{quote_ident(column)} {affinity(column_type)}"
+        for column, column_type in columns.items()
+    )
+    conn.execute(f"CREATE TABLE {quote_ident(name)} ({definition})")
+    conn.execute("BEGIN")
+    return conn
+
+
+def _insert(conn: sqlite3.Connection, name: str, width: int, batch):
+    conn.executemany(
+        f"INSERT INTO {quote_ident(name)} VALUES ({', '.join('?' * width)})",
+        [tuple(_engine_value(value) for value in row) for row in batch],
+    )
+
+
+def _finish_pull_file(conn: sqlite3.Connection, commit: bool):
+    if commit:
+        conn.execute("COMMIT")
+    conn.close()
+
+
+class Federation:
+    """Runs a query over several connections in an embedded sqlite engine.
+
+    SQLite bucket files are attached read only under their alias. Postgres
+    tables named as alias.table are pulled into temporary sqlite files, only
+    the columns the query reads and only the rows matching the literal
+    comparisons of its WHERE clause. Pulls are kept for FEDERATED_CACHE_TTL
+    seconds, up to FEDERATED_CACHE_MAX_BYTES, and dropped when something is
+    written through their connection.
+    """
+
+    def __init__(self):
+        self._pulls: OrderedDict[tuple, Pull] = OrderedDict()
+        self._size = 0
+        # (connection id, table name) -> (expires at, relation, columns)
+        self._schemas: dict[tuple[str, str], tuple[float, str, dict[str, str]]] = {}
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [key for key, pull in self._pulls.items() if pull.expires_at < now]:
+            self._remove(key)
+        self._schemas = {
+            key: value for key, value in self._schemas.items() if value[0] >= now
+        }
+
+    def _remove(self, key: tuple):
+        pull = self._pulls.pop(key, None)
+        if pull:
+            self._size -= pull.size
+            pull.drop()
+
+    def invalidate(self, connection_id: str):
+        for key in [key for key in self._pulls if key[0] == connection_id]:
+            self._remove(key)
+        self._schemas = {
+            key: value
+            for key, value in self._schemas.items()
+            if key[0] != connection_id
+        }
+
+    def clear(self):
+        for key in list(self._pulls):
+            self._remove(key)
+        self._schemas.clear()
+
+    def _cached(
+        self, connection_id: str, table: RemoteTable, columns: tuple
+    ) -> Pull | None:
+        """A pull holding the columns and at least the rows a table needs."""
+        predicates = tuple(table.predicates)
+        for key, pull in reversed(self._pulls.items()):
+            if (
+                pull.connection_id == connection_id
+                and pull.relation == table.relation
+                and set(columns) <= set(pull.columns)
+                and pull.predicates in (predicates, ())
+            ):
+                self._pulls.move_to_end(key)
+                return pull
+        return None
+
+    def _store(self, pull: Pull) -> bool:
+        key = (pull.connection_id, pull.relation, pull.columns, pull.predicates)
+        if pull.size > AppConfig.FEDERATED_CACHE_MAX_BYTES:
+            return False
+        self._remove(key)
+        self._pulls[key] = pull
+        self._size += pull.size
+        while self._size > AppConfig.FEDERATED_CACHE_MAX_BYTES and self._pulls:
+            self._remove(next(iter(self._pulls)))
+        return True
+
+    async def _describe(self, source: FederatedSource, table: RemoteTable):
+        key = (source.connection_id, table.name)
+        if cached := self._schemas.get(key):
+            _, table.relation, table.columns = cached
+            return
+        async with pools.acquire(
+            source.connection_id, source.source, source.uri, read_only=True
+        ) as conn:
+            rows = await conn.fetch(
+                "SELECT c.oid::regclass::text, a.attname, format_type(a.atttypid, a.atttypmod) "
+                "FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid "
+                "WHERE a.attrelid = to_regclass($1) AND a.attnum > 0 AND NOT a.attisdropped "
+                "ORDER BY a.attnum",
+                quote(table.name),
+            )
+        if not rows:
+            raise FederationError(f"Table {table.name} not found on {table.alias}")
+        table.relation = rows[0][0]
+        table.columns = {row[1]: row[2] for row in rows}
+        self._schemas[key] = (
+            time.monotonic() + AppConfig.FEDERATED_CACHE_TTL,
+            table.relation,
+            table.columns,
+        )
+
+    async def _pull(
+        self, source: FederatedSource, table: RemoteTable
+    ) -> tuple[Pull, bool]:
+        """A pull for a table, held for the caller until it releases it."""
+        # a table read for its row count alone still needs a column to count
+        columns = tuple(name for name in table.columns if name in table.needed) or (
+            next(iter(table.columns)),
+        )
+        if pull := self._cached(source.connection_id, table, columns):
+            pull.users += 1
+            return pull, True
+        key = (
+            "federated",
+            source.connection_id,
+            table.relation,
+            columns,
+            tuple(table.predicates),
+        )
+        pull = await singleflight.do(key, lambda: self._fetch(source, table, columns))
+        if not os.path.exists(pull.path):
+            # not cached and already released by the request it was shared with
+            pull = await self._fetch(source, table, columns)
+        pull.users += 1
+        return pull, False
+
+    async def _fetch(
+        self, source: FederatedSource, table: RemoteTable, columns: tuple
+    ) -> Pull:
+        generation = result_cache.generation(source.connection_id)
+        statement = (
+            f"SELECT {', '.join(map(quote_ident, columns))} FROM {table.relation}"
+        )
+        if table.predicates:
+            statement += " WHERE " + " AND ".join(table.predicates)
+        fd, path = tempfile.mkstemp(
+            prefix="datapilot-federated-", suffix=".db", dir=AppConfig.MEMORY_SPILL_DIR
+        )
+        os.close(fd)
+        os.remove(path)
+        store = await asyncio.to_thread(
+            _create_pull_file,
+            path,
+            table.name,
+            {name: table.columns[name] for name in columns},
+        )
+        rows, complete = 0, False
+        try:
+            async with pools.acquire(
+                source.connection_id, source.source, source.uri, read_only=True
+            ) as conn:
+                # portals only live inside a transaction
+                async with conn.transaction():
+                    cursor = await conn.cursor(statement)
+                    while batch := await cursor.fetch(FETCH_SIZE):
+                        rows += len(batch)
+                        if rows > AppConfig.FEDERATED_MAX_ROWS:
+                            raise FederationError(
+                                f"{table.alias}.{table.name} has more than "
+                                f"{AppConfig.FEDERATED_MAX_ROWS} matching rows, filter it further"
+                            )
+                        await asyncio.to_thread(
+                            _insert, store, table.name, len(columns), batch
+                        )
+            complete = True
+        finally:
+            await asyncio.to_thread(_finish_pull_file, store, complete)
+            if not complete:
+                os.remove(path)
+        pull = Pull(
+            source.connection_id,
+            table.relation,
+            columns,
+            tuple(table.predicates),
+            path,
+            rows,
+            os.path.getsize(path),
+            time.monotonic() + AppConfig.FEDERATED_CACHE_TTL,
+        )
+        # written to meanwhile, the rows may already be stale
+        if generation != result_cache.generation(
+            source.connection_id
+        ) or not self._store(pull):
+            pull.dropped = True
+        return pull
+
+    async def run(self, sources: list[FederatedSource], query: str, page: int):
+        """Run a read over the sources, returns the columns, up to page + 1
+        rows and what was pulled for every remote table."""
+        classification = classify(query)
+        if len(classification.statements) != 1 or not classification.read_only:
+            raise FederationError("A federated query must be a single read statement")
+        aliases = {}
+        for source in sources:
+            alias = source.alias.lower()
+            if (
+                not ALIAS.fullmatch(alias)
+                or alias in ("main", "temp")
+                or alias.startswith("_remote")
+            ):
+                raise FederationError(f"{source.alias} cannot be used as an alias")
+            if alias in aliases:
+                raise FederationError(f"The alias {source.alias} is used twice")
+            aliases[alias] = source
+
+        self._expire()
+        sqlite_sources = {}
+        remote_aliases = set()
+        for alias, source in aliases.items():
+            match SourceConfig(source.source):
+                case SourceConfig.SQLITE:
+                    bucket_store.touch(source.uri)
+                    await bucket_store.ensure_hot(source.uri)
+                    if not os.path.exists(source.uri):
+                        raise FederationError(
+                            f"The database file of {alias} is missing"
+                        )
+                    sqlite_sources[alias] = source.uri
+                case SourceConfig.POSTGRES:
+                    remote_aliases.add(alias)
+        tables, spans = find_remote_tables(query, remote_aliases)
+        if len(sqlite_sources) + len(tables) > MAX_ATTACHED:
+            raise FederationError(
+                f"A federated query can read at most {MAX_ATTACHED} sqlite databases and postgres tables"
+            )
+        await asyncio.gather(
+            *(self._describe(aliases[t.alias], t) for t in tables.values())
+        )
+        rewritten = rewrite(query, tables, spans)
+        await asyncio.to_thread(
+            _needed_columns, rewritten, sqlite_sources, list(tables.values())
+        )
+        push_down(query, tables)
+
+        pulls: list[tuple[RemoteTable, Pull]] = []
+        report = []
+        try:
+            results = await asyncio.gather(
+                *(self._pull(aliases[table.alias], table) for table in tables.values()),
+                return_exceptions=True,
+            )
+            for table, result in zip(tables.values(), results):
+                if isinstance(result, BaseException):
+                    continue
+                pull, cached = result
+                pulls.append((table, pull))
+                report.append(
+                    {
+                        "alias": table.alias,
+                        "table": table.relation,
+                        "columns": list(pull.columns),
+                        "predicates": list(pull.predicates),
+                        "rows": pull.rows,
+                        "cached": cached,
+                    }
+                )
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            columns, rows = await asyncio.to_thread(
+                _execute, rewritten, sqlite_sources, pulls, page
+            )
+        finally:
+            for _, pull in pulls:
+                pull.users -= 1
+                if pull.dropped:
+                    pull.drop()
+        return columns, rows, report
+
+
+federation = Federation()
@@ -0,0 +1,257 @@
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from itertools import count
+from ..config import AppConfig
+
+# dict, tuple and bookkeeping around the values of a row
+ROW_OVERHEAD = 64
+
+
+def estimate_row(row) -> int:
+    """Rough in memory size of a row, values are measured shallowly."""
+    return ROW_OVERHEAD + sum(map(sys.getsizeof, row))
+
+
+class MemoryBudgetExceeded(Exception):
+    """A result outgrew the memory of its query or of the worker and could not
+    be spilled to disk."""
+
+    def __init__(self, message: str, worker: bool = False):
+        super().__init__(message)
+        # the worker budget clears up once other queries finish
+        self.worker = worker
+
+
+@dataclass(eq=False)
+class QueryMemory:
+    connection_id: str
+    query: str
+    id: int = 0
+    bytes: int = 0
+    peak: int = 0
+    rows: int = 0
+    spilled_bytes: int = 0
+    started: float = field(default_factory=time.time)
+
+
+class MemoryAccountant:
+    """Accounts for the query results a worker holds in memory.
+
+    Every batch of rows is estimated as it arrives and charged to its query
+    and to the worker. A query that would go over either budget moves its rows
+    to a file on disk when spilling is enabled, and fails otherwise. Results
+    are released once nothing references them any more.
+    """
+
+    def __init__(self):
+        self.used = 0
+        self.peak = 0
+        self.spilled = 0
+        self.aborted = 0
+        self._queries: dict[int, QueryMemory] = {}
+        self._ids = count(1)
+        # sqlite results are fetched in worker threads
+        self._lock = threading.Lock()
+
+    def open(self, connection_id: str, query: str) -> QueryMemory:
+        usage = QueryMemory(connection_id, query, next(self._ids))
+        with self._lock:
+            self._queries[usage.id] = usage
+        return usage
+
+    def charge(self, usage: QueryMemory, size: int) -> bool:
+        """Charge a batch, False when it has to go to disk instead."""
+        with self._lock:
+            over_query = usage.bytes + size > AppConfig.MEMORY_QUERY_BUDGET
+            over_worker = self.used + size > AppConfig.MEMORY_WORKER_BUDGET
+            if not over_query and not over_worker:
+                usage.bytes += size
+                usage.peak = max(usage.peak, usage.bytes)
+                self.used += size
+                self.peak = max(self.peak, self.used)
+                return True
+            if not AppConfig.MEMORY_SPILL:
+                self.aborted += 1
+                raise self._exceeded(over_worker)
+            return False
+
+    def spill(self, usage: QueryMemory, size: int):
+        """Rows of `size` bytes went to disk, they no longer count as memory."""
+        with self._lock:
+            if usage.spilled_bytes + size > AppConfig.MEMORY_SPILL_MAX_BYTES:
+                self.aborted += 1
+                raise MemoryBudgetExceeded(
+                    "Query result exceeds the spill limit of "
+                    f"{AppConfig.MEMORY_SPILL_MAX_BYTES // 2**20} MB, "
+                    "add a LIMIT or select fewer columns"
+                )
+            if not usage.spilled_bytes:
+                self.spilled += 1
+            usage.spilled_bytes += size
+
+    def uncharge(self, usage: QueryMemory, size: int):
+        with self._lock:
+            usage.bytes -= size
+            self.used -= size
+
+    def release(self, usage: QueryMemory):
+        with self._lock:
+            self.used -= usage.bytes
+            usage.bytes = 0
+            self._queries.pop(usage.id, None)
+
+    def _exceeded(self, worker: bool) -> MemoryBudgetExceeded:
+        if worker:
+            return MemoryBudgetExceeded(
+                "The server is low on memory for query results, retry shortly",
+                worker=True,
+            )
+        return MemoryBudgetExceeded(
+            "Query result exceeds the memory budget of "
+            f"{AppConfig.MEMORY_QUERY_BUDGET // 2**20} MB, "
+            "add a LIMIT or select fewer columns"
+        )
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            queries = sorted(self._queries.values(), key=lambda usage: -usage.bytes)
+            return {
+                "used_bytes": self.used,
+                "peak_bytes": self.peak,
+                "worker_budget_bytes": AppConfig.MEMORY_WORKER_BUDGET,
+                "query_budget_bytes": AppConfig.MEMORY_QUERY_BUDGET,
+                "spill": AppConfig.MEMORY_SPILL,
+                "spilled_queries": self.spilled,
+                "aborted_queries": self.aborted,
+                "queries": [
+                    {
+                        "connection_id": usage.connection_id,
+                        "query": usage.query,
+                        "bytes": usage.bytes,
+                        "peak_bytes": usage.peak,
+                        "rows": usage.rows,
+                        "spilled_bytes": usage.spilled_bytes,
+                        "started": usage.started,
+                    }
+                    for usage in queries
+                ],
+            }
+
+
+class Rows(list):
+    """Rows held in memory, `truncate` drops the tail in place."""
+
+    spilled = False
+
+    def truncate(self, size: int):
+        del self[size:]
+
+
+class SpilledRows:
+    """Rows kept in a temporary file as pickled batches.
+
+    Batches are read back with pread, so several responses sharing a result
+    (coalesced reads) can stream it at the same time. The file goes away with
+    the object.
+    """
+
+    spilled = True
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(
+            prefix="datapilot-spill-", dir=AppConfig.MEMORY_SPILL_DIR
+        )
+        # (offset, length) of every batch
+        self._batches: list[tuple[int, int]] = []
+        self._size = 0
+        self._length = 0
+        self._limit: int | None = None
+
+    def append(self, batch: list) -> int:
+        data = pickle.dumps(
+            [tuple(row) for row in batch], protocol=pickle.HIGHEST_PROTOCOL
+        )
+        self._file.write(data)
+        self._batches.append((self._size, len(data)))
+        self._size += len(data)
+        self._length += len(batch)
+        return len(data)
+
+    def finish(self):
+        self._file.flush()
+
+    def truncate(self, size: int):
+        self._limit = size if self._limit is None else min(size, self._limit)
+
+    def __len__(self) -> int:
+        return self._length if self._limit is None else min(self._length, self._limit)
+
+    def batches(self):
+        remaining = len(self)
+        for offset, length in self._batches:
+            if remaining <= 0:
+                return
+            batch = pickle.loads(os.pread(self._file.fileno(), length, offset))
+            yield batch[:remaining]
+            remaining -= len(batch)
+
+
+class RowBuffer:
+    """Collects the rows of a result batch by batch, charging them to the
+    query's memory budget when it has one."""
+
+    def __init__(self, usage: QueryMemory | None = None):
+        self.usage = usage
+        self.rows: Rows | SpilledRows = Rows()
+        self._charged = 0
+        # a fetch that fails gives the budget back with the buffer
+        self._release = weakref.finalize(self, memory.release, usage) if usage else None
+
+    def extend(self, batch):
+        if not batch:
+            return
+        usage = self.usage
+        if usage is None:
+            self.rows.extend(batch)
+            return
+        usage.rows += len(batch)
+        if not self.rows.spilled:
+            size = sum(map(estimate_row, batch))
+            if memory.charge(usage, size):
+                self._charged += size
+                self.rows.extend(batch)
+                return
+            # over budget, everything so far moves to disk
+            rows, self.rows = self.rows, SpilledRows()
+            if rows:
+                memory.spill(usage, self.rows.append(rows))
+            memory.uncharge(usage, self._charged)
+            self._charged = 0
+        memory.spill(usage, self.rows.append(batch))
+
+    def result(self) -> Rows | SpilledRows:
+        if self.rows.spilled:
+            self.rows.finish()
+        if self._release is not None:
+            # the budget is given back when the last response using the rows is done
+            self._release.detach()
+            weakref.finalize(self.rows, memory.release, self.usage)
+        return self.rows
+
+
+def row_batches(rows, size: int):
+    """Iterate over the rows of a result in batches, in memory or spilled."""
+    if isinstance(rows, SpilledRows):
+        yield from rows.batches()
+        return
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+memory = MemoryAccountant()
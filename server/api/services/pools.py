@@ -0,0 +1,263 @@
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass
+from ..config import AppConfig, SourceConfig
+from .breaker import breakers, is_unreachable
+
+
+class SQLitePool:
+    """Small pool of sqlite3 connections.
+
+    sqlite3 is blocking so every call on a pooled connection has to go through
+    asyncio.to_thread. Connections are opened in autocommit mode, statements
+    that write are committed as soon as they finish. Read only pools refuse
+    writes with PRAGMA query_only.
+    """
+
+    def __init__(self, path: str, max_size: int, read_only: bool = False):
+        self.path = str(path)
+        self.max_size = max_size
+        self.read_only = read_only
+        self._idle: list[sqlite3.Connection] = []
+        self._semaphore = asyncio.Semaphore(max_size)
+        self._in_use = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 keeps compiled statements per connection keyed by SQL text,
+        # parameterized queries reuse them
+        conn = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=AppConfig.STATEMENT_CACHE_SIZE,
+        )
+        if self.read_only:
+            conn.execute("PRAGMA query_only = 1")
+        return conn
+
+    async def acquire(self) -> sqlite3.Connection:
+        await self._semaphore.acquire()
+        if self._idle:
+            conn = self._idle.pop()
+        else:
+            try:
+                conn = await asyncio.to_thread(self._connect)
+            except BaseException:
+                self._semaphore.release()
+                raise
+        self._in_use += 1
+        return conn
+
+    async def release(self, conn: sqlite3.Connection):
+        self._in_use -= 1
+        self._idle.append(conn)
+        self._semaphore.release()
+
+    # same accessors as asyncpg.Pool
+    def get_size(self) -> int:
+        return self._in_use + len(self._idle)
+
+    def get_idle_size(self) -> int:
+        return len(self._idle)
+
+    def get_max_size(self) -> int:
+        return self.max_size
+
+    async def expire_connections(self):
+        # connections in use are kept, the idle ones are opened again
+        while self._idle:
+            self._idle.pop().close()
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+    def terminate(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+async def call_sqlite(conn: sqlite3.Connection, fn, *args):
+    """Run `fn(conn, *args)` in a thread.
+
+    Cancelling the caller does not stop the thread, so the connection would
+    go back to the pool while a statement is still running on it. Instead
+    the statement is interrupted and the thread waited for, and a
+    transaction it left open is rolled back before the connection is
+    released.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(fn, conn, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        conn.interrupt()
+        while not future.done():
+            try:
+                await asyncio.wait({future})
+            except asyncio.CancelledError:
+                conn.interrupt()
+        if not future.cancelled():
+            # interrupted, the caller is gone and does not need the error
+            future.exception()
+        if conn.in_transaction:
+            with suppress(sqlite3.Error):
+                conn.execute("ROLLBACK")
+        raise
+
+
+@dataclass
+class _PoolEntry:
+    loop: asyncio.AbstractEventLoop
+    source: str
+    uri: str
+    pool: "asyncpg.Pool | SQLitePool"
+
+
+class PoolManager:
+    """Keeps driver pools per registered connection and server (the primary
+    and its read replicas), one for writes and one whose connections refuse
+    writes for statements classified as reads.
+
+    Pools are bound to the event loop that created them (asyncpg requires it),
+    so a pool requested from a different loop is dropped and recreated.
+    """
+
+    def __init__(self):
+        self._pools: dict[tuple[str, str, bool], _PoolEntry] = {}
+
+    async def _create(self, source: str, uri: str, read_only: bool):
+        match SourceConfig(source):
+            case SourceConfig.POSTGRES:
+                import asyncpg
+                from .statements import StatementCachingConnection
+
+                # a session default, RESET ALL on release keeps it
+                settings = (
+                    {"default_transaction_read_only": "on"} if read_only else None
+                )
+                return await asyncpg.create_pool(
+                    dsn=uri,
+                    timeout=AppConfig.POOL_CONNECT_TIMEOUT,
+                    min_size=0,
+                    max_size=AppConfig.POOL_MAX_SIZE,
+                    connection_class=StatementCachingConnection,
+                    server_settings=settings,
+                )
+            case SourceConfig.SQLITE:
+                from .tiering import bucket_store
+
+                # connecting to a file moved to the cold tier would create an
+                # empty database in its place
+                await bucket_store.ensure_hot(uri)
+                return SQLitePool(uri, AppConfig.POOL_MAX_SIZE, read_only)
+            case _:
+                raise ValueError(f"Pooling not supported for source: {source}")
+
+    async def _close(self, entry: _PoolEntry):
+        if entry.loop is asyncio.get_running_loop():
+            await entry.pool.close()
+        else:
+            entry.pool.terminate()
+
+    async def get(
+        self, connection_id: str, source: str, uri: str, read_only: bool = False
+    ):
+        loop = asyncio.get_running_loop()
+        uri = str(uri)
+        key = (connection_id, uri, read_only)
+        entry = self._pools.get(key)
+        if entry and entry.loop is loop:
+            return entry.pool
+        if entry:
+            self._pools.pop(key, None)
+            await self._close(entry)
+
+        pool = await self._create(source, uri, read_only)
+        # another request may have created the pool while we were connecting
+        existing = self._pools.get(key)
+        if existing and existing.loop is loop:
+            await pool.close()
+            return existing.pool
+        self._pools[key] = _PoolEntry(loop, source, uri, pool)
+        return pool
+
+    @asynccontextmanager
+    async def acquire(
+        self, connection_id: str, source: str, uri: str, read_only: bool = False
+    ):
+        """A pooled connection, unless the server's circuit breaker is open."""
+        breaker = breakers.get(connection_id, uri)
+        breaker.allow()
+        try:
+            pool = await self.get(connection_id, source, uri, read_only)
+            conn = await pool.acquire()
+            try:
+                yield conn
+            finally:
+                await pool.release(conn)
+        except Exception as e:
+            if is_unreachable(e):
+                breaker.failed(e)
+            else:
+                # the server answered, even if with an error
+                breaker.succeeded()
+            raise
+        else:
+            breaker.succeeded()
+        finally:
+            breaker.settle()
+
+    async def expire(self, connection_id: str, uri: str):
+        """Reconnect the pooled connections to a server, e.g. after it went
+        away and the sockets the pools hold are broken."""
+        loop = asyncio.get_running_loop()
+        for read_only in (False, True):
+            entry = self._pools.get((connection_id, str(uri), read_only))
+            if entry and entry.loop is loop:
+                await entry.pool.expire_connections()
+
+    def uris(self, idle: bool = False) -> set[str]:
+        """Servers and database files with open pools, with `idle` only the
+        ones none of whose connections are in use."""
+        busy = {
+            uri
+            for (_, uri, _), entry in self._pools.items()
+            if idle and entry.pool.get_idle_size() < entry.pool.get_size()
+        }
+        return {uri for (_, uri, _) in self._pools} - busy
+
+    def stats(self, connection_id: str) -> list[dict]:
+        """Size of every pool opened for a connection."""
+        return [
+            {
+                "uri": entry.uri,
+                "read_only": read_only,
+                "size": entry.pool.get_size(),
+                "idle": entry.pool.get_idle_size(),
+                "max_size": entry.pool.get_max_size(),
+            }
+            for (owner, _, read_only), entry in self._pools.items()
+            if owner == connection_id
+        ]
+
+    async def discard(self, connection_id: str):
+        for key in [key for key in self._pools if key[0] == connection_id]:
+            entry = self._pools.pop(key, None)
+            if entry:
+                await self._close(entry)
+
+    async def discard_uri(self, uri: str):
+        """Close the pools opened on a server or database file, whatever the
+        connection, e.g. after the file was replaced."""
+        for key in [key for key in self._pools if key[1] == str(uri)]:
+            entry = self._pools.pop(key, None)
+            if entry:
+                await self._close(entry)
+
+    async def close_all(self):
+        for connection_id in {key[0] for key in self._pools}:
+            await self.discard(connection_id)
+
+
+pools = PoolManager()
@@ -0,0 +1,120 @@
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from statistics import quantiles
+from ..config import AppConfig
+from .sql import fingerprint, fingerprint_id
+
+# durations kept per fingerprint for the rolling p95
+SAMPLE_SIZE = 512
+
+ORDERINGS = {
+    "total": lambda stats: stats.total_ms,
+    "mean": lambda stats: stats.mean_ms,
+    "p95": lambda stats: stats.p95_ms,
+    "calls": lambda stats: stats.calls,
+    "rows": lambda stats: stats.rows,
+}
+
+
+@dataclass(eq=False)
+class QueryStats:
+    connection_id: str
+    fingerprint: str
+    # the latest statement with this fingerprint, literals included
+    query: str
+    # values bound to the latest statement, to explain it again later
+    params: list | None = None
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+    slow_calls: int = 0
+    last_seen: float = 0.0
+    plan_logged_at: float | None = None
+    durations: deque = field(default_factory=lambda: deque(maxlen=SAMPLE_SIZE))
+
+    @property
+    def id(self) -> str:
+        return fingerprint_id(self.fingerprint)
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+    @property
+    def p95_ms(self) -> float:
+        if len(self.durations) < 2:
+            return self.max_ms
+        return quantiles(self.durations, n=20, method="inclusive")[-1]
+
+
+class QueryStatsRegistry:
+    """Rolling aggregates of executed statements per connection and
+    fingerprint, like pg_stat_statements but for every source.
+
+    At most QUERY_STATS_MAX fingerprints are kept per worker, the one seen
+    least recently makes room for a new one.
+    """
+
+    def __init__(self):
+        self._stats: OrderedDict[tuple[str, str], QueryStats] = OrderedDict()
+
+    def record(
+        self,
+        connection_id: str,
+        query: str,
+        duration_ms: float,
+        rows: int,
+        params: list | None = None,
+    ) -> QueryStats:
+        shape = fingerprint(query)
+        key = (connection_id, shape)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = QueryStats(connection_id, shape, query, params)
+            while len(self._stats) > AppConfig.QUERY_STATS_MAX:
+                self._stats.popitem(last=False)
+        else:
+            self._stats.move_to_end(key)
+            stats.query = query
+        stats.params = params
+        stats.calls += 1
+        stats.total_ms += duration_ms
+        stats.max_ms = max(stats.max_ms, duration_ms)
+        stats.rows += rows
+        stats.last_seen = time.time()
+        stats.durations.append(duration_ms)
+        if duration_ms >= AppConfig.SLOW_QUERY_MS:
+            stats.slow_calls += 1
+        return stats
+
+    def plan_due(self, stats: QueryStats, duration_ms: float) -> bool:
+        """Whether a slow call should have its plan logged, at most once per
+        SLOW_QUERY_PLAN_INTERVAL for a fingerprint."""
+        if duration_ms < AppConfig.SLOW_QUERY_MS:
+            return False
+        now = time.time()
+        if (
+            stats.plan_logged_at
+            and now - stats.plan_logged_at < AppConfig.SLOW_QUERY_PLAN_INTERVAL
+        ):
+            return False
+        stats.plan_logged_at = now
+        return True
+
+    def top(
+        self,
+        connection_id: str | None = None,
+        order_by: str = "total",
+        limit: int | None = 20,
+    ) -> list[QueryStats]:
+        stats = [
+            stats
+            for stats in self._stats.values()
+            if connection_id is None or stats.connection_id == connection_id
+        ]
+        return sorted(stats, key=ORDERINGS[order_by], reverse=True)[:limit]
+
+
+query_stats = QueryStatsRegistry()
@@ -0,0 +1,180 @@
+import asyncio
+import itertools
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Sequence
+from urllib.parse import urlsplit
+from ..config import AppConfig, SourceConfig
+from .breaker import is_unreachable
+from .pools import pools
+
+# a standby that replayed everything it received is not behind, however long
+# ago the last transaction was; a server not in recovery is not a replica
+LAG_QUERY = """
+SELECT
+    pg_is_in_recovery() AS in_recovery,
+    CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::float8 AS lag
+"""
+
+
+def describe_uri(uri: str) -> str:
+    """host:port/database of a connection uri, without the credentials."""
+    parts = urlsplit(uri)
+    return f"{parts.hostname}:{parts.port or 5432}{parts.path}"
+
+
+def is_recovery_conflict(e: Exception) -> bool:
+    """A standby cancelled the query to replay changes it conflicted with."""
+    asyncpg = sys.modules.get("asyncpg")
+    return bool(asyncpg) and isinstance(e, asyncpg.exceptions.SerializationError)
+
+
+@dataclass(eq=False)
+class Replica:
+    uri: str
+    healthy: bool = True
+    lag: float | None = None
+    error: str | None = None
+    # monotonic time of the last check, wall clock time for the api
+    checked: float | None = None
+    checked_at: float | None = None
+    in_flight: int = 0
+    served: int = 0
+    _check: asyncio.Task | None = None
+
+
+class ReplicaSet:
+    """The read replicas of a postgres connection.
+
+    Reads go to the least busy healthy replica, taking turns between equally
+    busy ones, and to the primary when none is within `max_lag` seconds of it.
+    Replicas are checked on first use and again in the background every
+    REPLICA_CHECK_INTERVAL, an unhealthy one comes back once a check passes.
+    """
+
+    def __init__(self, connection_id: str, uris: Sequence[str], max_lag: float | None):
+        self.connection_id = connection_id
+        self.uris = list(uris)
+        self.max_lag = max_lag
+        self.replicas = [Replica(uri) for uri in self.uris]
+        self._turn = itertools.count()
+        self._primary_until = 0.0
+
+    async def _run_check(self, replica: Replica):
+        try:
+            async with pools.acquire(
+                self.connection_id, SourceConfig.POSTGRES.value, replica.uri, True
+            ) as conn:
+                row = await asyncio.wait_for(
+                    conn.fetchrow(LAG_QUERY), AppConfig.REPLICA_CHECK_TIMEOUT
+                )
+            if not row["in_recovery"]:
+                raise RuntimeError("server is not in recovery, it is not a replica")
+            replica.lag = row["lag"]
+            replica.healthy = True
+            replica.error = None
+        except Exception as e:
+            replica.healthy = False
+            replica.error = str(e) or type(e).__name__
+        finally:
+            replica.checked = time.monotonic()
+            replica.checked_at = time.time()
+
+    def _schedule_check(self, replica: Replica) -> asyncio.Task:
+        task = replica._check
+        # a task left over from another event loop cannot be awaited here
+        if (
+            task is None
+            or task.done()
+            or task.get_loop() is not asyncio.get_running_loop()
+        ):
+            task = replica._check = asyncio.create_task(self._run_check(replica))
+        return task
+
+    async def check(self):
+        """Check every replica now."""
+        await asyncio.gather(
+            *(self._schedule_check(replica) for replica in self.replicas)
+        )
+
+    def _usable(self, replica: Replica) -> bool:
+        if not replica.healthy:
+            return False
+        return self.max_lag is None or (
+            replica.lag is not None and replica.lag <= self.max_lag
+        )
+
+    async def choose(self) -> Replica | None:
+        """The replica to send a read to, None for the primary."""
+        if time.monotonic() < self._primary_until:
+            return None
+        unchecked = [replica for replica in self.replicas if replica.checked is None]
+        if unchecked:
+            await asyncio.gather(
+                *(self._schedule_check(replica) for replica in unchecked)
+            )
+        now = time.monotonic()
+        for replica in self.replicas:
+            if now - replica.checked >= AppConfig.REPLICA_CHECK_INTERVAL:
+                self._schedule_check(replica)
+
+        usable = [replica for replica in self.replicas if self._usable(replica)]
+        if not usable:
+            return None
+        start = next(self._turn) % len(usable)
+        return min(
+            usable[start:] + usable[:start], key=lambda replica: replica.in_flight
+        )
+
+    @contextmanager
+    def use(self, replica: Replica):
+        replica.in_flight += 1
+        try:
+            yield
+        finally:
+            replica.in_flight -= 1
+        replica.served += 1
+
+    def failed(self, replica: Replica, e: Exception):
+        replica.healthy = False
+        replica.error = str(e) or type(e).__name__
+
+    def wrote(self):
+        # replicas replay a write some time after the primary committed it,
+        # reads right after one stay on the primary so they see it
+        self._primary_until = time.monotonic() + AppConfig.REPLICA_READ_AFTER_WRITE
+
+
+class ReplicaRegistry:
+    """One ReplicaSet per connection, rebuilt when its replicas change."""
+
+    def __init__(self):
+        self._sets: dict[str, ReplicaSet] = {}
+
+    def get(
+        self, connection_id: str, uris: Sequence[str], max_lag: float | None = None
+    ) -> ReplicaSet | None:
+        if not uris:
+            self._sets.pop(connection_id, None)
+            return None
+        current = self._sets.get(connection_id)
+        if current is None or current.uris != list(uris) or current.max_lag != max_lag:
+            current = self._sets[connection_id] = ReplicaSet(
+                connection_id, uris, max_lag
+            )
+        return current
+
+    def wrote(self, connection_id: str):
+        if replica_set := self._sets.get(connection_id):
+            replica_set.wrote()
+
+    def discard(self, connection_id: str):
+        self._sets.pop(connection_id, None)
+
+
+replicas = ReplicaRegistry()
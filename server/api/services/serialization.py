@@ -0,0 +1,80 @@
+from decimal import Decimal
+from typing import Iterator
+import orjson
+from pydantic_core import to_jsonable_python
+from .memory import row_batches
+
+# rows are turned into objects one batch at a time so a large result never
+# exists twice in memory
+ROW_BATCH_SIZE = 1000
+
+
+def default(value):
+    """Encode the driver types orjson does not know, the same way pydantic did."""
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            # same text form postgres uses for bytea
+            return "\\x" + value.hex()
+    try:
+        return to_jsonable_python(value)
+    except Exception:
+        return str(value)
+
+
+def dumps(value) -> bytes:
+    return orjson.dumps(value, default=default)
+
+
+def iter_query_result(
+    meta: dict,
+    columns: list,
+    rows,
+    max_bytes: int | None = None,
+    truncated: bool = False,
+) -> Iterator[bytes]:
+    """Yield the QueryResult document straight from driver records.
+
+    `rows` can be sqlite tuples or asyncpg records, both iterate over values in
+    column order, held in memory or spilled to disk. Rows stop before the encoded document grows past
+    `max_bytes`, the "truncated" flag written after them says whether any
+    rows were left out.
+    """
+    head = dumps({**meta, "columns": columns})
+    yield head[:-1] + b',"rows":['
+    budget = max_bytes - len(head) if max_bytes else None
+    names = [column["name"] for column in columns]
+    written = False
+    for batch in row_batches(rows, ROW_BATCH_SIZE):
+        batch = [dict(zip(names, row)) for row in batch]
+        chunk = dumps(batch)[1:-1]
+        if budget is not None and len(chunk) + 1 > budget:
+            # the batch does not fit, take the rows that still do one by one
+            truncated = True
+            for row in batch:
+                chunk = dumps(row)
+                if len(chunk) + 1 > budget:
+                    break
+                budget -= len(chunk) + 1
+                yield b"," + chunk if written else chunk
+                written = True
+            break
+        if budget is not None:
+            budget -= len(chunk) + 1
+        yield b"," + chunk if written else chunk
+        written = True
+    yield b'],"truncated":' + (b"true" if truncated else b"false") + b"}"
+
+
+def encode_query_result(
+    meta: dict,
+    columns: list,
+    rows,
+    max_bytes: int | None = None,
+    truncated: bool = False,
+) -> bytes:
+    return b"".join(iter_query_result(meta, columns, rows, max_bytes, truncated))
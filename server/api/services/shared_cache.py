@@ -0,0 +1,112 @@
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(repr(value).encode()).hexdigest()[:32]
+
+
+class SharedCache:
+    """Cache tier shared by the workers of one host.
+
+    Entries are plain files under a directory that should live on tmpfs
+    (/dev/shm) so reads are served from shared memory by the page cache:
+
+        <dir>/entries/<connection digest>/<key digest>.json
+        <dir>/entries/<connection digest>/<key digest>.<encoding>
+
+    Files are written to a temp name and renamed, so readers never see a
+    partial entry. Invalidating a connection renames its directory away, which
+    every worker on the host observes at once.
+    """
+
+    def __init__(self, directory: str, ttl: float, max_bytes: int):
+        self.root = Path(directory) / "entries"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._writes = 0
+
+    def _path(self, key: tuple, suffix: str) -> Path:
+        return self.root / _digest(key[0]) / f"{_digest(key)}.{suffix}"
+
+    def get(self, key: tuple) -> tuple[bytes, dict[str, bytes], float] | None:
+        """Return the body, the stored encodings and the remaining ttl."""
+        path = self._path(key, "json")
+        try:
+            age = time.time() - path.stat().st_mtime
+            if age > self.ttl:
+                return None
+            body = path.read_bytes()
+        except OSError:
+            return None
+
+        encoded = {}
+        for variant in path.parent.glob(f"{path.stem}.*"):
+            encoding = variant.suffix[1:]
+            if encoding not in ("json", "tmp"):
+                try:
+                    encoded[encoding] = variant.read_bytes()
+                except OSError:
+                    pass
+        return body, encoded, self.ttl - age
+
+    def put(self, key: tuple, body: bytes, encoded: dict[str, bytes] | None = None):
+        self._write(self._path(key, "json"), body)
+        for encoding, data in (encoded or {}).items():
+            self.add_encoding(key, encoding, data)
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.sweep()
+
+    def add_encoding(self, key: tuple, encoding: str, data: bytes):
+        self._write(self._path(key, encoding), data)
+
+    def _write(self, path: Path, data: bytes):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError:
+            # the connection was invalidated while writing, or the disk is full
+            pass
+
+    def invalidate(self, connection_id: str):
+        directory = self.root / _digest(connection_id)
+        stale = directory.with_name(f"{directory.name}.{uuid.uuid4().hex}.stale")
+        try:
+            os.rename(directory, stale)
+        except OSError:
+            return
+        shutil.rmtree(stale, ignore_errors=True)
+
+    def clear(self):
+        for directory in self.root.iterdir():
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def sweep(self):
+        """Drop expired entries, then the least recently written ones until the
+        tier is back under max_bytes."""
+        files = []
+        now = time.time()
+        for path in self.root.glob("*/*"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+            else:
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
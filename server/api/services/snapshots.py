@@ -0,0 +1,570 @@
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+from ..config import AppConfig, SourceConfig
+from .federation import affinity, quote_ident
+from .pools import pools
+from .sql import classify
+from .tiering import bucket_store, bucket_uid
+
+logger = logging.getLogger(__name__)
+
+# rows written to the snapshot per insert
+BATCH_ROWS = 10_000
+# finished snapshot jobs kept around for polling
+JOBS_KEPT = 100
+# primary key types a table can be split into ranges on
+RANGE_TYPES = ("smallint", "integer", "bigint")
+# backslash escapes postgres writes in COPY text output
+_ESCAPES = {"b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+_ESCAPE = re.compile(r"\\(.)")
+
+
+class SnapshotError(ValueError):
+    """The snapshot cannot be taken or refreshed as asked."""
+
+
+@dataclass
+class SnapshotTable:
+    """A table of a snapshot, copied from a postgres table or query."""
+
+    # table in the snapshot file
+    name: str
+    table: str | None = None
+    query: str | None = None
+    # column whose largest copied value is kept, a refresh only copies rows
+    # from there on
+    watermark: str | None = None
+    high_water: str | None = None
+    # postgres column name -> type, in table order
+    columns: dict[str, str] = field(default_factory=dict)
+    # primary key, refreshed rows replace the ones with the same key
+    key: list[str] = field(default_factory=list)
+    rows: int = 0
+
+
+@dataclass(eq=False)
+class SnapshotJob:
+    # the postgres connection copied from
+    connection_id: str
+    # bucket uid of the snapshot file
+    snapshot_id: str
+    kind: str
+    tables: list[SnapshotTable]
+    name: str = ""
+    # the sqlite connection registered for the snapshot
+    snapshot_connection_id: str | None = None
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    status: str = "pending"
+    error: str | None = None
+    rows: int = 0
+    created: float = field(default_factory=time.time)
+    finished: float | None = None
+
+
+# registers a new snapshot file as a bucket entry and a connection, returns the connection uid
+Register = Callable[[SnapshotJob, dict], Awaitable[str]]
+# saves the tables of a refreshed snapshot to its bucket entry
+Save = Callable[[SnapshotJob, dict], Awaitable[None]]
+
+
+def _unescape(value: str):
+    if value == "\\N":
+        return None
+    if "\\" not in value:
+        return value
+    return _ESCAPE.sub(lambda m: _ESCAPES.get(m[1], m[1]), value)
+
+
+def _bytea(value: str | None):
+    # bytea_output = hex
+    return None if value is None else bytes.fromhex(value[2:])
+
+
+class CopyReader:
+    """Rows of `COPY ... TO STDOUT` text output, fed in chunks as they
+    arrive. Rows never span lines, newlines in values are escaped."""
+
+    def __init__(self, columns: dict[str, str]):
+        self._rest = b""
+        self._bytea = [
+            i
+            for i, column_type in enumerate(columns.values())
+            if column_type == "bytea"
+        ]
+
+    def feed(self, data: bytes) -> list[list]:
+        data = self._rest + data
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._rest = data
+            return []
+        self._rest = data[end + 1 :]
+        rows = []
+        for line in data[:end].decode().split("\n"):
+            row = [_unescape(value) for value in line.split("\t")]
+            for i in self._bytea:
+                row[i] = _bytea(row[i])
+            rows.append(row)
+        return rows
+
+    def finish(self):
+        if self._rest:
+            raise SnapshotError("The COPY output ended in the middle of a row")
+
+
+def _select_list(columns: dict[str, str]) -> str:
+    # booleans are stored as 0 and 1, as sqlite has none
+    return ", ".join(
+        f"{quote_ident(name)}::int" if column_type == "boolean" else quote_ident(name)
+        for name, column_type in columns.items()
+    )
+
+
+def _partitions(low: int | None, high: int | None, count: int) -> list[tuple[int, int]]:
+    """Split a key range into up to `count` ranges of whole keys, inclusive."""
+    if low is None or high is None:
+        return []
+    count = max(1, min(count, high - low + 1))
+    step = (high - low + 1) // count
+    bounds = [low + step * i for i in range(count)] + [high + 1]
+    return [(start, end - 1) for start, end in zip(bounds, bounds[1:])]
+
+
+def _create_snapshot_file(path: str, tables: list[SnapshotTable]) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    # the file only replaces its final name once complete
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("BEGIN")
+    for table in tables:
+        definition = ", ".join(
+            f"{quote_ident(column)} {affinity(column_type)}"
+            for column, column_type in table.columns.items()
+        )
+        conn.execute(f"CREATE TABLE {quote_ident(table.name)} ({definition})")
+    return conn
+
+
+def _open_snapshot_file(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 5000")
+    # readers of the snapshot keep reading the rows from before the refresh
+    conn.execute("BEGIN IMMEDIATE")
+    return conn
+
+
+def _index_snapshot_file(
+    conn: sqlite3.Connection,
+    table: SnapshotTable,
+    indexes: list[tuple[bool, list[str]]],
+):
+    """Build the indexes of a copied table once its rows are in."""
+    if table.watermark and not any(
+        columns[0] == table.watermark for _, columns in indexes
+    ):
+        indexes = indexes + [(False, [table.watermark])]
+    built = set()
+    for unique, columns in indexes:
+        if tuple(columns) in built or not set(columns) <= set(table.columns):
+            continue
+        built.add(tuple(columns))
+        name = quote_ident(f"{table.name}_{'_'.join(columns)}")
+        conn.execute(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {quote_ident(table.name)} "
+            f"({', '.join(map(quote_ident, columns))})"
+        )
+
+
+def _finish_snapshot_file(conn: sqlite3.Connection, commit: bool, create: bool):
+    try:
+        if not commit:
+            conn.execute("ROLLBACK")
+            return
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE" if create else "PRAGMA optimize")
+        if create:
+            conn.execute("PRAGMA journal_mode = WAL").fetchone()
+    finally:
+        conn.close()
+
+
+class Snapshots:
+    """Copies postgres tables, or the rows of a query, into sqlite files in
+    the bucket for exploring them without going to the server.
+
+    A table with an integer primary key is read in SNAPSHOT_PARTITIONS key
+    ranges at once, every range a COPY over its own pooled connection. All
+    ranges read the same exported transaction snapshot, so the copy is
+    consistent. Rows are inserted in batches of BATCH_ROWS and the indexes of
+    the table are built once it is complete. A snapshot is refreshed from
+    its watermark column when it has one, rows from the largest value copied
+    on replace the ones with the same primary key; without a watermark the
+    table is copied again.
+    """
+
+    def __init__(self):
+        self._jobs: dict[str, SnapshotJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+        # one job per postgres connection at a time, the ranges of a job
+        # take at most SNAPSHOT_PARTITIONS pooled connections
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _start(self, job: SnapshotJob, coro) -> SnapshotJob:
+        self._jobs[job.id] = job
+        finished = [job for job in self._jobs.values() if job.finished]
+        for old in sorted(finished, key=lambda job: job.finished)[
+            : len(finished) - JOBS_KEPT
+        ]:
+            self._jobs.pop(old.id, None)
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def create(
+        self,
+        connection_id: str,
+        source: str,
+        uri: str,
+        name: str,
+        tables: list[SnapshotTable],
+        path: str,
+        register: Register,
+    ) -> SnapshotJob:
+        """Copy the tables into a new sqlite file at `path` in the background."""
+        if source != SourceConfig.POSTGRES.value:
+            raise SnapshotError("Snapshots can only be taken of postgres connections")
+        if not tables:
+            raise SnapshotError("A snapshot needs at least one table or query")
+        names = set()
+        for table in tables:
+            if (table.table is None) == (table.query is None):
+                raise SnapshotError(
+                    "Give each snapshot table either a table or a query"
+                )
+            if table.query is not None:
+                classification = classify(table.query)
+                if len(classification.statements) != 1 or not classification.read_only:
+                    raise SnapshotError(
+                        "A snapshot query must be a single read statement"
+                    )
+            if not table.name or table.name.lower().startswith("sqlite_"):
+                raise SnapshotError(f"{table.name!r} cannot be used as a table name")
+            if table.name.lower() in names:
+                raise SnapshotError(f"The table name {table.name} is used twice")
+            names.add(table.name.lower())
+        job = SnapshotJob(
+            connection_id, bucket_uid(os.path.basename(path)), "create", tables, name
+        )
+        return self._start(job, self._create(job, source, uri, path, register))
+
+    def refresh(
+        self,
+        connection_id: str,
+        source: str,
+        uri: str,
+        snapshot_connection_id: str,
+        name: str,
+        tables: list[SnapshotTable],
+        path: str,
+        save: Save,
+    ) -> SnapshotJob:
+        """Bring a snapshot up to date in the background."""
+        if source != SourceConfig.POSTGRES.value:
+            raise SnapshotError(
+                "The snapshot was taken of a connection that is no longer postgres"
+            )
+        snapshot_id = bucket_uid(os.path.basename(path))
+        for job in self._jobs.values():
+            if job.snapshot_id == snapshot_id and job.status in ("pending", "running"):
+                return job
+        job = SnapshotJob(
+            connection_id, snapshot_id, "refresh", tables, name, snapshot_connection_id
+        )
+        return self._start(job, self._refresh(job, source, uri, path, save))
+
+    def job(self, job_id: str) -> SnapshotJob | None:
+        return self._jobs.get(job_id)
+
+    async def _create(
+        self, job: SnapshotJob, source: str, uri: str, path: str, register: Register
+    ):
+        partial = f"{path}.part"
+        try:
+            async with self._locks.setdefault(job.connection_id, asyncio.Lock()):
+                job.status = "running"
+                await self._copy(job, source, uri, partial, create=True)
+            os.replace(partial, path)
+            job.snapshot_connection_id = await register(job, self.metadata(job))
+        except Exception as e:
+            logger.warning("Snapshot of %s failed: %s", job.connection_id, e)
+            job.status = "failed"
+            job.error = str(e)
+            # nothing refers to the file until it is registered
+            for leftover in (partial, path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        else:
+            job.status = "done"
+        finally:
+            job.finished = time.time()
+
+    async def _refresh(
+        self, job: SnapshotJob, source: str, uri: str, path: str, save: Save
+    ):
+        try:
+            async with self._locks.setdefault(job.connection_id, asyncio.Lock()):
+                job.status = "running"
+                bucket_store.touch(path)
+                await bucket_store.ensure_hot(path)
+                if not os.path.exists(path):
+                    raise SnapshotError("The snapshot file is missing")
+                await self._copy(job, source, uri, path, create=False)
+            await save(job, self.metadata(job))
+        except Exception as e:
+            logger.warning("Refresh of snapshot %s failed: %s", job.snapshot_id, e)
+            job.status = "failed"
+            job.error = str(e)
+        else:
+            job.status = "done"
+        finally:
+            job.finished = time.time()
+
+    def metadata(self, job: SnapshotJob) -> dict:
+        """What a snapshot keeps in its bucket entry to be refreshed."""
+        return {
+            "connection_id": job.connection_id,
+            "name": job.name,
+            "tables": [
+                {
+                    "name": table.name,
+                    "table": table.table,
+                    "query": table.query,
+                    "watermark": table.watermark,
+                    "high_water": table.high_water,
+                    "columns": table.columns,
+                    "key": table.key,
+                    "rows": table.rows,
+                }
+                for table in job.tables
+            ],
+            "refreshed_at": time.time(),
+        }
+
+    async def _copy(
+        self, job: SnapshotJob, source: str, uri: str, path: str, create: bool
+    ):
+        store = None
+        complete = False
+        async with pools.acquire(
+            job.connection_id, source, uri, read_only=True
+        ) as leader:
+            # the ranges read in other transactions see what this one sees
+            async with leader.transaction(isolation="repeatable_read", readonly=True):
+                exported = await leader.fetchval("SELECT pg_export_snapshot()")
+                plans = [
+                    await self._plan(leader, table, create) for table in job.tables
+                ]
+                try:
+                    if create:
+                        store = await asyncio.to_thread(
+                            _create_snapshot_file, path, job.tables
+                        )
+                    else:
+                        store = await asyncio.to_thread(_open_snapshot_file, path)
+                    write = asyncio.Lock()
+                    for table, plan in zip(job.tables, plans):
+                        if not create and not table.watermark:
+                            await asyncio.to_thread(
+                                store.execute, f"DELETE FROM {quote_ident(table.name)}"
+                            )
+                        ranges = plan.pop("ranges")
+                        await asyncio.gather(
+                            *(
+                                self._copy_range(
+                                    job,
+                                    source,
+                                    uri,
+                                    leader if i == 0 else None,
+                                    exported,
+                                    table,
+                                    key_range,
+                                    store,
+                                    write,
+                                    create,
+                                    **plan,
+                                )
+                                for i, key_range in enumerate(ranges)
+                            )
+                        )
+                        if create:
+                            await asyncio.to_thread(
+                                _index_snapshot_file, store, table, plan["indexes"]
+                            )
+                        table.rows = await asyncio.to_thread(
+                            lambda: store.execute(
+                                f"SELECT count(*) FROM {quote_ident(table.name)}"
+                            ).fetchone()[0]
+                        )
+                    complete = True
+                finally:
+                    if store is not None:
+                        await asyncio.to_thread(
+                            _finish_snapshot_file, store, complete, create
+                        )
+
+    async def _plan(self, conn, table: SnapshotTable, create: bool) -> dict:
+        """Describe a table or query within the exported snapshot, returns
+        what to select it from, the filter and the key ranges to copy it in."""
+        if table.table is not None:
+            relation = await conn.fetchval("SELECT to_regclass($1)::text", table.table)
+            if relation is None:
+                raise SnapshotError(f"Table {table.table} not found")
+            source_sql = f"SELECT * FROM {relation}"
+        else:
+            relation = None
+            source_sql = table.query.strip().rstrip(";")
+        statement = await conn.prepare(f"SELECT * FROM ({source_sql}) q")
+        attributes = statement.get_attributes()
+        types = dict(
+            await conn.fetch(
+                "SELECT t, format_type(t, NULL) FROM unnest($1::oid[]) t",
+                [attribute.type.oid for attribute in attributes],
+            )
+        )
+        columns = {
+            attribute.name: types[attribute.type.oid] for attribute in attributes
+        }
+        if len(columns) != len(attributes) or not columns:
+            raise SnapshotError(f"The columns of {table.name} need distinct names")
+        if create:
+            table.columns = columns
+        elif columns != table.columns:
+            raise SnapshotError(
+                f"The columns of {table.name} changed, take a new snapshot"
+            )
+        if table.watermark and table.watermark not in columns:
+            raise SnapshotError(
+                f"{table.name} has no column {table.watermark} to refresh by"
+            )
+
+        indexes = []
+        if relation is not None and create:
+            rows = await conn.fetch(
+                "SELECT i.indisprimary, i.indisunique, array_agg(a.attname ORDER BY k.n) "
+                "FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid JOIN pg_am am ON am.oid = c.relam "
+                "CROSS JOIN unnest(i.indkey) WITH ORDINALITY k(attnum, n) "
+                "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum "
+                "WHERE i.indrelid = $1::regclass AND am.amname = 'btree' "
+                "AND i.indexprs IS NULL AND i.indpred IS NULL "
+                "GROUP BY i.indexrelid, i.indisprimary, i.indisunique "
+                "ORDER BY i.indisprimary DESC",
+                relation,
+            )
+            if rows and rows[0][0]:
+                table.key = list(rows[0][2])
+            indexes = [(row[1], list(row[2])) for row in rows]
+
+        where, args = "", []
+        if table.watermark:
+            watermark = quote_ident(table.watermark)
+            if table.high_water is not None and not create:
+                # rows at the high water may have changed since, they replace
+                # the copied ones by their key
+                op = ">=" if table.key else ">"
+                where = f" WHERE {watermark} {op} $1::{columns[table.watermark]}"
+                args = [table.high_water]
+            table.high_water = (
+                await conn.fetchval(
+                    f"SELECT max({watermark})::text FROM ({source_sql}) q{where}", *args
+                )
+                or table.high_water
+            )
+
+        ranges = []
+        if len(table.key) == 1 and columns[table.key[0]] in RANGE_TYPES:
+            key = quote_ident(table.key[0])
+            low, high = await conn.fetchrow(
+                f"SELECT min({key}), max({key}) FROM ({source_sql}) q{where}", *args
+            )
+            # the leader reads one range, the others take a pooled connection each
+            count = min(AppConfig.SNAPSHOT_PARTITIONS, AppConfig.POOL_MAX_SIZE)
+            ranges = _partitions(low, high, count)
+        return {
+            "source_sql": source_sql,
+            "where": where,
+            "args": args,
+            "indexes": indexes,
+            "ranges": ranges or [None],
+        }
+
+    async def _copy_range(
+        self,
+        job: SnapshotJob,
+        source: str,
+        uri: str,
+        leader,
+        exported: str,
+        table: SnapshotTable,
+        key_range: tuple[int, int] | None,
+        store: sqlite3.Connection,
+        write: asyncio.Lock,
+        create: bool,
+        source_sql: str,
+        where: str,
+        args: list,
+        indexes: list,
+    ):
+        """COPY the rows of a table in a key range, None for all of them,
+        into the snapshot file."""
+        if key_range is not None:
+            where += " AND " if where else " WHERE "
+            where += f"{quote_ident(table.key[0])} BETWEEN {int(key_range[0])} AND {int(key_range[1])}"
+        query = f"SELECT {_select_list(table.columns)} FROM ({source_sql}) q{where}"
+        # refreshed rows replace the copied ones with the same key, the
+        # snapshot has a unique index on it
+        insert = (
+            f"INSERT {'OR REPLACE ' if table.key and not create else ''}"
+            f"INTO {quote_ident(table.name)} VALUES ({', '.join('?' * len(table.columns))})"
+        )
+        reader = CopyReader(table.columns)
+        pending: list[list] = []
+
+        async def flush():
+            batch = pending[:]
+            pending.clear()
+            async with write:
+                await asyncio.to_thread(store.executemany, insert, batch)
+            job.rows += len(batch)
+
+        async def output(data: bytes):
+            pending.extend(await asyncio.to_thread(reader.feed, data))
+            if len(pending) >= BATCH_ROWS:
+                await flush()
+
+        async def read(conn):
+            await conn.copy_from_query(query, *args, output=output, format="text")
+            reader.finish()
+            if pending:
+                await flush()
+
+        if leader is not None:
+            await read(leader)
+            return
+        async with pools.acquire(
+            job.connection_id, source, uri, read_only=True
+        ) as conn:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                await conn.execute(f"SET TRANSACTION SNAPSHOT '{exported}'")
+                await read(conn)
+
+
+snapshots = Snapshots()
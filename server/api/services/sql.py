@@ -0,0 +1,309 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from enum import Enum
+from typing import Iterator
+
+# a small lexer, just enough to tell literals, identifiers and comments apart
+# from the rest of a statement for postgres and sqlite
+_TOKEN = re.compile(
+    r"""
+      (?P<space>\s+)
+    | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+    | (?P<string>[eE]'(?:[^'\\]|\\.|'')*(?:'|\Z)|'(?:[^']|'')*(?:'|\Z))
+    | (?P<quoted>"(?:[^"]|"")*(?:"|\Z)|`[^`]*(?:`|\Z))
+    | (?P<dollar>\$\$.*?(?:\$\$|\Z)|\$(?P<dollar_tag>[A-Za-z_]\w*)\$.*?(?:\$(?P=dollar_tag)\$|\Z))
+    | (?P<param>\$\d+|\?\d*)
+    | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    | (?P<word>[A-Za-z_][A-Za-z_0-9$]*)
+    | (?P<punct>.)
+    """,
+    re.S | re.X,
+)
+
+
+def tokens(query: str) -> Iterator[tuple[str, str]]:
+    """Yield (kind, text) pairs, kind being one of the group names above."""
+    for match in _TOKEN.finditer(query):
+        kind = match.lastgroup
+        if kind == "dollar_tag":
+            kind = "dollar"
+        yield kind, match.group()
+
+
+def normalize(query: str) -> str:
+    """Collapse whitespace and drop comments outside of literals so that
+    equivalent statements compare equal."""
+    parts: list[str] = []
+    for kind, text in tokens(query):
+        if kind in ("space", "comment"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        else:
+            parts.append(text)
+    return "".join(parts).strip().rstrip(";").rstrip()
+
+
+class StatementKind(Enum):
+    READ = "read"
+    WRITE = "write"
+    DDL = "ddl"
+
+
+WRITE_KEYWORDS = {"insert", "update", "delete", "merge", "replace", "upsert", "copy"}
+DDL_KEYWORDS = {
+    "create",
+    "alter",
+    "drop",
+    "truncate",
+    "rename",
+    "comment",
+    "grant",
+    "revoke",
+    "reindex",
+    "vacuum",
+    "analyze",
+    "analyse",
+    "cluster",
+    "refresh",
+    "attach",
+    "detach",
+}
+READ_KEYWORDS = {"select", "values", "table", "show", "with", "pragma", "explain"}
+# words that turn a statement starting like a read into a write: data modifying
+# CTEs, SELECT ... INTO and SELECT ... FOR UPDATE/SHARE
+MODIFYING_WORDS = {"insert", "update", "delete", "merge", "into", "share"}
+# functions with side effects that are commonly called from a SELECT
+VOLATILE_FUNCTIONS = {
+    "nextval",
+    "setval",
+    "pg_notify",
+    "set_config",
+    "txid_current",
+    "pg_current_xact_id",
+    "pg_terminate_backend",
+    "pg_cancel_backend",
+    "pg_reload_conf",
+    "pg_switch_wal",
+    "lo_import",
+    "lo_export",
+    "lo_unlink",
+    "lo_create",
+    "dblink_exec",
+}
+VOLATILE_PREFIXES = ("pg_advisory", "pg_try_advisory")
+# pragmas that write even without an assignment
+WRITE_PRAGMAS = {"optimize", "wal_checkpoint", "incremental_vacuum", "shrink_memory"}
+# statements that open or close a transaction themselves
+TRANSACTION_KEYWORDS = {
+    "begin",
+    "start",
+    "commit",
+    "end",
+    "rollback",
+    "savepoint",
+    "release",
+    "abort",
+}
+EXPLAIN_OPTIONS = {
+    "verbose",
+    "costs",
+    "buffers",
+    "timing",
+    "summary",
+    "settings",
+    "wal",
+    "format",
+    "text",
+    "json",
+    "xml",
+    "yaml",
+    "true",
+    "false",
+    "on",
+    "off",
+    "query",
+    "plan",
+    "generic_plan",
+    "memory",
+    "serialize",
+}
+
+
+@dataclass(frozen=True)
+class Classification:
+    statements: list[str]
+    kinds: list[StatementKind]
+
+    @property
+    def kind(self) -> StatementKind:
+        """READ only when every statement reads, DDL when any changes the schema."""
+        if StatementKind.DDL in self.kinds:
+            return StatementKind.DDL
+        if self.kinds and all(kind == StatementKind.READ for kind in self.kinds):
+            return StatementKind.READ
+        return StatementKind.WRITE
+
+    @property
+    def read_only(self) -> bool:
+        return self.kind == StatementKind.READ
+
+    @property
+    def controls_transaction(self) -> bool:
+        """Whether the statements begin or end a transaction on their own."""
+        for statement in self.statements:
+            first = next(
+                (text for kind, text in tokens(statement) if kind == "word"), ""
+            )
+            if first.lower() in TRANSACTION_KEYWORDS:
+                return True
+        return False
+
+
+def split_statements(query: str) -> list[list[tuple[str, str]]]:
+    """Tokens of each statement, split on semicolons outside of literals.
+
+    The BEGIN ... END body of a sqlite CREATE TRIGGER is kept in one piece.
+    """
+    statements: list[list[tuple[str, str]]] = []
+    current: list[tuple[str, str]] = []
+    words: list[str] = []
+    depth = 0
+    for kind, text in tokens(query):
+        if kind == "punct" and text == ";" and depth == 0:
+            statements.append(current)
+            current, words = [], []
+            continue
+        current.append((kind, text))
+        if kind != "word":
+            continue
+        word = text.lower()
+        words.append(word)
+        if words[0] == "create" and "trigger" in words:
+            if word == "begin" or (word == "case" and depth):
+                depth += 1
+            elif word == "end" and depth:
+                depth -= 1
+    statements.append(current)
+    # drop the empty pieces left by blank input, comments or a trailing ;
+    return [
+        statement
+        for statement in statements
+        if any(kind not in ("space", "comment") for kind, _ in statement)
+    ]
+
+
+def _classify_words(
+    words: list[str], statement: list[tuple[str, str]]
+) -> StatementKind:
+    if not words:
+        return StatementKind.WRITE
+    first = words[0]
+    if first == "explain":
+        rest = words[1:]
+        analyze = False
+        while rest and (
+            rest[0] in EXPLAIN_OPTIONS or rest[0] in ("analyze", "analyse")
+        ):
+            analyze = analyze or rest[0] in ("analyze", "analyse")
+            rest = rest[1:]
+        # EXPLAIN ANALYZE executes the statement
+        return _classify_words(rest, statement) if analyze else StatementKind.READ
+    if first == "pragma":
+        if any(kind == "punct" and text == "=" for kind, text in statement):
+            return StatementKind.WRITE
+        # the pragma name may be qualified by a schema: PRAGMA main.optimize
+        if WRITE_PRAGMAS & set(words[1:3]):
+            return StatementKind.WRITE
+        return StatementKind.READ
+    if first in READ_KEYWORDS:
+        for word in words[1:]:
+            if (
+                word in MODIFYING_WORDS
+                or word in VOLATILE_FUNCTIONS
+                or word.startswith(VOLATILE_PREFIXES)
+            ):
+                return StatementKind.WRITE
+        return StatementKind.READ
+    if first in DDL_KEYWORDS:
+        return StatementKind.DDL
+    # writes, and everything unknown (BEGIN, SET, DO, CALL, ...) to be safe
+    return StatementKind.WRITE
+
+
+def classify(query: str) -> Classification:
+    """Tell reads from writes and DDL, statement by statement."""
+    statements, kinds = [], []
+    for statement in split_statements(query):
+        words = [text.lower() for kind, text in statement if kind == "word"]
+        kinds.append(_classify_words(words, statement))
+        statements.append("".join(text for _, text in statement).strip())
+    return Classification(statements, kinds)
+
+
+# statements that return rows and can be used as a subquery
+ROW_QUERY_KEYWORDS = {"select", "values", "table", "with"}
+
+
+def paginate(statement: str, limit: int, offset: int | None = None) -> str | None:
+    """Wrap a query as a subquery returning at most `limit` rows after `offset`.
+
+    The limit applies whatever LIMIT, ORDER BY or subqueries the statement has
+    itself. None when the statement cannot be wrapped, e.g. a PRAGMA, SHOW or
+    EXPLAIN.
+    """
+    first = next(
+        (text.lower() for kind, text in tokens(statement) if kind == "word"), None
+    )
+    if first not in ROW_QUERY_KEYWORDS:
+        return None
+    # the line break ends a trailing -- comment of the statement
+    query = f"SELECT * FROM ({statement}\n) AS _page LIMIT {int(limit)}"
+    if offset:
+        query += f" OFFSET {int(offset)}"
+    return query
+
+
+# statements EXPLAIN (and sqlite's EXPLAIN QUERY PLAN) accept
+EXPLAINABLE_KEYWORDS = ROW_QUERY_KEYWORDS | {
+    "insert",
+    "update",
+    "delete",
+    "merge",
+    "replace",
+}
+_LITERALS = ("string", "number", "dollar", "param")
+_LIST = re.compile(r"\(\?(?:, \?)+\)")
+
+
+def explainable(statement: str) -> bool:
+    first = next(
+        (text.lower() for kind, text in tokens(statement) if kind == "word"), None
+    )
+    return first in EXPLAINABLE_KEYWORDS
+
+
+def fingerprint(query: str) -> str:
+    """The shape of a statement: literals and placeholders become ?, lists of
+    them (?, ...), words are lower cased and spacing is canonical, so the same
+    statement with other values has the same fingerprint."""
+    parts: list[str] = []
+    for kind, text in tokens(query):
+        if kind in ("space", "comment"):
+            continue
+        if kind in _LITERALS:
+            text = "?"
+        elif kind == "word":
+            text = text.lower()
+        if (
+            parts
+            and parts[-1] not in ("(", ".", ":")
+            and text not in (",", ")", ".", ":", ";")
+        ):
+            parts.append(" ")
+        parts.append(text)
+    return _LIST.sub("(?, ...)", "".join(parts).rstrip(";").rstrip())
+
+
+def fingerprint_id(fingerprint: str) -> str:
+    return hashlib.blake2b(fingerprint.encode(), digest_size=8).hexdigest()
@@ -0,0 +1,149 @@
+import datetime
+import json
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+import asyncpg
+from asyncpg.prepared_stmt import PreparedStatement
+from ..config import AppConfig
+
+# raised when a cached statement no longer matches the schema, e.g. after an
+# ALTER TABLE changed the result type, the statement has to be prepared again
+STALE_STATEMENT_ERRORS = (
+    asyncpg.exceptions.InvalidCachedStatementError,
+    asyncpg.exceptions.OutdatedSchemaCacheError,
+)
+
+
+class StatementCachingConnection(asyncpg.Connection):
+    """asyncpg connection keeping an LRU of prepared statements by SQL text.
+
+    Connection.prepare always parses and plans again, statements prepared
+    through `prepare_cached` are reused for as long as the pooled connection
+    lives, so a hot query only pays for bind and execute.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prepared: OrderedDict[str, PreparedStatement] = OrderedDict()
+
+    async def prepare_cached(self, query: str) -> PreparedStatement:
+        statement = self._prepared.get(query)
+        if statement is not None:
+            self._prepared.move_to_end(query)
+            return statement
+        statement = await self.prepare(query)
+        self._prepared[query] = statement
+        # dropped statements are deallocated by asyncpg on a later call
+        while len(self._prepared) > AppConfig.STATEMENT_CACHE_SIZE:
+            self._prepared.popitem(last=False)
+        return statement
+
+    def evict_statement(self, query: str):
+        self._prepared.pop(query, None)
+
+
+def _to_int(value):
+    return int(value) if isinstance(value, str) else value
+
+
+def _to_float(value):
+    return float(value) if isinstance(value, str) else value
+
+
+def _to_decimal(value):
+    return Decimal(str(value)) if isinstance(value, (str, int, float)) else value
+
+
+def _to_text(value):
+    return (
+        str(value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+        else value
+    )
+
+
+# spellings postgres accepts for booleans
+BOOLEANS = {
+    "true": True,
+    "t": True,
+    "yes": True,
+    "y": True,
+    "on": True,
+    "1": True,
+    "false": False,
+    "f": False,
+    "no": False,
+    "n": False,
+    "off": False,
+    "0": False,
+}
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return BOOLEANS.get(value.strip().lower(), value)
+    if isinstance(value, int) and not isinstance(value, bool) and value in (0, 1):
+        return bool(value)
+    return value
+
+
+def _to_json(value):
+    # asyncpg sends json and jsonb as text
+    return json.dumps(value)
+
+
+def _parse(parse):
+    return lambda value: parse(value) if isinstance(value, str) else value
+
+
+# json parameters arrive as str, number, bool, null or lists of them, the
+# postgres types asyncpg will not accept those for are converted
+COERCE = {
+    "int2": _to_int,
+    "int4": _to_int,
+    "int8": _to_int,
+    "float4": _to_float,
+    "float8": _to_float,
+    "numeric": _to_decimal,
+    "bool": _to_bool,
+    "text": _to_text,
+    "varchar": _to_text,
+    "bpchar": _to_text,
+    "json": _to_json,
+    "jsonb": _to_json,
+    "date": _parse(datetime.date.fromisoformat),
+    "time": _parse(datetime.time.fromisoformat),
+    "timestamp": _parse(datetime.datetime.fromisoformat),
+    "timestamptz": _parse(datetime.datetime.fromisoformat),
+    "uuid": _parse(uuid.UUID),
+}
+
+
+def coerce_parameters(statement: PreparedStatement, params) -> list:
+    """Convert json parameter values to what asyncpg expects for each type."""
+    types = statement.get_parameters()
+    if len(types) != len(params):
+        raise asyncpg.exceptions.DataError(
+            f"the query expects {len(types)} parameters, {len(params)} were given"
+        )
+    values = []
+    for position, (param_type, value) in enumerate(zip(types, params), start=1):
+        try:
+            values.append(_coerce(param_type, value))
+        except (TypeError, ValueError) as e:
+            raise asyncpg.exceptions.DataError(
+                f"invalid value for ${position} ({param_type.name}): {e}"
+            ) from e
+    return values
+
+
+def _coerce(param_type, value):
+    if value is None:
+        return None
+    if param_type.kind == "array" and isinstance(value, list):
+        # array types are named after their element with a leading _
+        coerce = COERCE.get(param_type.name.lstrip("_"))
+        return [coerce(item) if coerce and item is not None else item for item in value]
+    coerce = COERCE.get(param_type.name)
+    return coerce(value) if coerce else value
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from ..config import AppConfig, SourceConfig
+from .breaker import breakers, is_unreachable
+from .pools import pools
+from .tiering import bucket_store
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class ConnectionHealth:
+    connection_id: str
+    source: str
+    uri: str
+    # None until the first check
+    healthy: bool | None = None
+    latency_ms: float | None = None
+    error: str | None = None
+    checked_at: float | None = None
+    last_used_at: float | None = None
+    failures: int = 0
+
+
+# (connection id, source, uri) of connections to open pools for at startup
+Loader = Callable[[], Awaitable[list[tuple[str, str, str]]]]
+# saves when connections were last used, by connection id
+Saver = Callable[[dict[str, float]], Awaitable[None]]
+
+
+class PoolSupervisor:
+    """Keeps the pools of the connections a worker serves ready.
+
+    Connections used recently are warmed at startup, so the first query after
+    a restart does not pay for connecting; when each was last used is saved
+    every POOL_CHECK_INTERVAL. Every connection that ran a query
+    is pinged every POOL_CHECK_INTERVAL: all idle pooled connections are
+    exercised so broken sockets are found before a query gets them, and the
+    pools of a server that failed the check are reconnected.
+
+    Sqlite files are only pinged while they have pools open and cold files
+    are not warmed: neither counts as a use, so files nobody queries can still
+    be moved to the cold tier and stay there.
+    """
+
+    def __init__(self):
+        self._connections: dict[str, ConnectionHealth] = {}
+        self._task: asyncio.Task | None = None
+        self._save: Saver | None = None
+        # last uses saved, by connection id
+        self._saved: dict[str, float] = {}
+        self.started_at = time.time()
+
+    def watch(self, connection_id: str, source: str, uri: str):
+        """A query ran on a connection, keep its pools checked."""
+        health = self._connections.get(connection_id)
+        if health is None or health.uri != str(uri):
+            health = self._connections[connection_id] = ConnectionHealth(
+                connection_id, source, str(uri)
+            )
+        health.last_used_at = time.time()
+
+    def discard(self, connection_id: str):
+        self._connections.pop(connection_id, None)
+
+    async def start(self, recent: Loader, save: Saver | None = None):
+        self.started_at = time.time()
+        self._save = save
+        self._task = asyncio.get_running_loop().create_task(self._run(recent))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Save when the connections were last used, they are warmed after a
+        restart."""
+        updates = {
+            health.connection_id: health.last_used_at
+            for health in self._connections.values()
+            if health.last_used_at
+            and health.last_used_at > self._saved.get(health.connection_id, 0)
+        }
+        if not updates or not self._save:
+            return
+        try:
+            await self._save(updates)
+        except Exception as e:
+            logger.warning("Could not save when connections were used: %s", e)
+            return
+        self._saved.update(updates)
+
+    async def _run(self, recent: Loader):
+        try:
+            for connection_id, source, uri in await recent():
+                self._connections.setdefault(
+                    connection_id, ConnectionHealth(connection_id, source, str(uri))
+                )
+            await asyncio.gather(
+                *(self.warm(health) for health in list(self._connections.values()))
+            )
+        except Exception as e:
+            logger.warning("Could not warm connection pools: %s", e)
+        while True:
+            await asyncio.sleep(AppConfig.POOL_CHECK_INTERVAL)
+            await self.check()
+            await self.flush()
+
+    def _failed(self, health: ConnectionHealth, e: Exception):
+        health.healthy = False
+        health.error = str(e) or type(e).__name__
+        health.failures += 1
+
+    def _ensure_exists(self, health: ConnectionHealth):
+        if health.source == SourceConfig.SQLITE.value and not bucket_store.exists(
+            health.uri
+        ):
+            # connecting would create an empty database in its place
+            raise FileNotFoundError(
+                f"database file {os.path.basename(health.uri)} is missing"
+            )
+
+    async def warm(self, health: ConnectionHealth):
+        """Open POOL_WARM_SIZE connections in the pools queries use."""
+        if health.source == SourceConfig.SQLITE.value and not os.path.exists(
+            health.uri
+        ):
+            if bucket_store.exists(health.uri):
+                # restored by the first query that needs it
+                return
+        try:
+            self._ensure_exists(health)
+            # reads and writes go to separate pools
+            for read_only in (True, False):
+                pool = await pools.get(
+                    health.connection_id, health.source, health.uri, read_only
+                )
+                size = max(0, AppConfig.POOL_WARM_SIZE - pool.get_size())
+                await asyncio.gather(
+                    *(self._ping(health, read_only) for _ in range(size))
+                )
+        except Exception as e:
+            self._failed(health, e)
+        else:
+            health.healthy = True
+            health.error = None
+        health.checked_at = time.time()
+
+    async def _ping(self, health: ConnectionHealth, read_only: bool):
+        async with pools.acquire(
+            health.connection_id, health.source, health.uri, read_only
+        ) as conn:
+            match SourceConfig(health.source):
+                case SourceConfig.POSTGRES:
+                    await asyncio.wait_for(
+                        conn.fetchval("SELECT 1"), AppConfig.POOL_CHECK_TIMEOUT
+                    )
+                case SourceConfig.SQLITE:
+                    await asyncio.to_thread(lambda: conn.execute("SELECT 1").close())
+
+    async def check_connection(self, health: ConnectionHealth):
+        started = time.perf_counter()
+        try:
+            self._ensure_exists(health)
+            checks = []
+            for pool_stats in pools.stats(health.connection_id):
+                if pool_stats["uri"] == health.uri:
+                    checks += [pool_stats["read_only"]] * max(1, pool_stats["idle"])
+            if not checks and health.source != SourceConfig.SQLITE.value:
+                # a server without pools is still checked for being reachable
+                checks = [True]
+            results = await asyncio.gather(
+                *(self._ping(health, read_only) for read_only in checks),
+                return_exceptions=True,
+            )
+            errors = [result for result in results if isinstance(result, BaseException)]
+            if errors:
+                # some pooled sockets are dead, reconnect them all
+                await pools.expire(health.connection_id, health.uri)
+                if len(errors) == len(results) or not all(map(is_unreachable, errors)):
+                    raise errors[0]
+            health.healthy = True
+            health.error = None
+            health.failures = 0
+        except Exception as e:
+            self._failed(health, e)
+        finally:
+            health.latency_ms = (time.perf_counter() - started) * 1000
+            health.checked_at = time.time()
+
+    async def check(self):
+        """Check every watched connection now."""
+        await asyncio.gather(
+            *(
+                self.check_connection(health)
+                for health in list(self._connections.values())
+            )
+        )
+
+    def snapshot(self) -> dict:
+        connections = [
+            {
+                "connection_id": health.connection_id,
+                "source": health.source,
+                "healthy": health.healthy,
+                "latency_ms": health.latency_ms,
+                "error": health.error,
+                "checked_at": health.checked_at,
+                "last_used_at": health.last_used_at,
+                "failures": health.failures,
+                "breaker": breakers.get(health.connection_id, health.uri).state,
+                "pools": pools.stats(health.connection_id),
+            }
+            for health in self._connections.values()
+        ]
+        unhealthy = any(connection["healthy"] is False for connection in connections)
+        return {
+            "status": "degraded" if unhealthy else "ok",
+            "uptime": time.time() - self.started_at,
+            "connections": connections,
+        }
+
+
+supervisor = PoolSupervisor()
@@ -0,0 +1,362 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Awaitable, Callable
+from ..config import AppConfig
+from .compression import ENCODINGS, OUTPUT_CHUNK, StreamCompressor, StreamDecompressor
+from .optimizer import is_sqlite_file
+from .pools import pools
+
+logger = logging.getLogger(__name__)
+
+# once over the quota, files are tiered until usage is back under this share
+QUOTA_TARGET = 0.9
+# cold copies by suffix, the first available encoding is used for new ones
+COLD_SUFFIXES = {".zst": "zstd", ".gz": "gzip"}
+# files next to bucket entries that are never tiered on their own
+TRANSIENT = ("-wal", "-shm", "-journal", ".part", ".restoring", ".optimizing")
+
+# last access time of every bucket entry by uid, 0 when never accessed
+Loader = Callable[[], Awaitable[dict[str, float]]]
+# metadata to merge into bucket entries by uid
+Saver = Callable[[dict[str, dict]], Awaitable[None]]
+
+
+class QuotaExceeded(Exception):
+    """BUCKET_DIR is over BUCKET_QUOTA_BYTES and nothing in it can be tiered."""
+
+
+def bucket_uid(name: str) -> str:
+    # entries are stored as {uid}{ext}
+    return name.partition(".")[0]
+
+
+class BucketStore:
+    """Keeps BUCKET_DIR under BUCKET_QUOTA_BYTES by moving the files used
+    least recently into BUCKET_COLD_DIR, compressed.
+
+    A file is only tiered once it went unused for BUCKET_MIN_IDLE seconds in
+    every worker: uses are recorded in memory and flushed to the bucket
+    metadata every BUCKET_SWEEP_INTERVAL, and files a worker has pools open
+    on count as used right now. Pools left idle for BUCKET_MIN_IDLE are
+    closed so their files can go cold. Opening a pool on a cold file, or
+    downloading it, restores it first.
+
+    Tiering and restoring a file hold its lock, which opening a pool waits
+    for, so a pool is never opened on a file that is being moved.
+    """
+
+    def __init__(self):
+        self._accessed: dict[str, float] = {}
+        self._persisted: dict[str, float] = {}
+        # metadata changes not saved yet, by uid
+        self._pending: dict[str, dict] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._load: Loader | None = None
+        self._save: Saver | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def hot_dir(self) -> Path:
+        return Path(AppConfig.BUCKET_DIR)
+
+    @property
+    def cold_dir(self) -> Path:
+        return Path(AppConfig.BUCKET_COLD_DIR or self.hot_dir / "cold")
+
+    def _name(self, path) -> str | None:
+        # only files directly in BUCKET_DIR are managed
+        if not AppConfig.BUCKET_DIR:
+            return None
+        directory, name = os.path.split(str(path))
+        return name if directory == str(self.hot_dir) else None
+
+    def _cold_copy(self, name: str) -> Path | None:
+        for suffix in COLD_SUFFIXES:
+            path = self.cold_dir / f"{name}{suffix}"
+            if path.exists():
+                return path
+        return None
+
+    def touch(self, path):
+        """Record a use of a file: queries, downloads and the like, not the
+        health checks of the supervisor."""
+        if name := self._name(path):
+            self._accessed[name] = time.time()
+
+    def lock(self, path) -> asyncio.Lock:
+        """The lock held while a file is moved between tiers, opening a pool
+        on the file waits for it."""
+        name = self._name(path)
+        if name is None:
+            return asyncio.Lock()
+        return self._locks.setdefault(name, asyncio.Lock())
+
+    def exists(self, path) -> bool:
+        """Whether a bucket file exists, in either tier."""
+        if os.path.exists(path):
+            return True
+        name = self._name(path)
+        return bool(name and self._cold_copy(name))
+
+    def _last_accessed(self, name: str, mtime: float) -> float:
+        return max(
+            self._accessed.get(name, 0), self._persisted.get(bucket_uid(name), 0), mtime
+        )
+
+    async def ensure_hot(self, path) -> bool:
+        """Bring a file back from the cold tier, True when it was restored."""
+        name = self._name(path)
+        if name is None:
+            return False
+        # also when the file exists, it may be on its way to the cold tier
+        async with self._locks.setdefault(name, asyncio.Lock()):
+            cold = self._cold_copy(name)
+            if os.path.exists(path) or cold is None:
+                return False
+            started = time.perf_counter()
+            await asyncio.to_thread(self._restore, cold, Path(path))
+        self._pending.setdefault(bucket_uid(name), {}).update(
+            tier="hot", restored_at=time.time()
+        )
+        logger.info(
+            "Restored %s from the cold tier in %.0f ms",
+            name,
+            (time.perf_counter() - started) * 1000,
+        )
+        return True
+
+    def _restore(self, cold: Path, path: Path):
+        partial = path.with_name(f"{path.name}.restoring")
+        try:
+            with open(cold, "rb") as source, open(partial, "wb") as target:
+                # our own copy, not an upload to limit
+                decompressor = StreamDecompressor(
+                    COLD_SUFFIXES[cold.suffix], target.write, float("inf"), float("inf")
+                )
+                while chunk := source.read(OUTPUT_CHUNK):
+                    decompressor.decompress(chunk)
+                decompressor.finish()
+            os.replace(partial, path)
+        finally:
+            partial.unlink(missing_ok=True)
+        cold.unlink()
+
+    def _in_use(self, name: str, mtime: float) -> bool:
+        return (
+            str(self.hot_dir / name) in pools.uris()
+            or time.time() - self._last_accessed(name, mtime)
+            < AppConfig.BUCKET_MIN_IDLE
+        )
+
+    async def tier(self, name: str) -> int | None:
+        """Move a file into the cold tier unless it is in use, returns the
+        size of the cold copy."""
+        path = self.hot_dir / name
+        async with self._locks.setdefault(name, asyncio.Lock()):
+            if not path.exists() or self._in_use(name, path.stat().st_mtime):
+                return None
+            before = path.stat()
+            size, cold = await asyncio.to_thread(self._tier, path)
+            after = path.stat()
+            if str(path) in pools.uris() or (after.st_size, after.st_mtime_ns) != (
+                before.st_size,
+                before.st_mtime_ns,
+            ):
+                # used while it was compressed, the copy may miss writes
+                await asyncio.to_thread(cold.unlink, True)
+                logger.info("Kept %s hot, it was used while being tiered", name)
+                return None
+            await asyncio.to_thread(self._remove_hot, path)
+            cold_size = cold.stat().st_size
+        self._accessed.pop(name, None)
+        self._pending.setdefault(bucket_uid(name), {}).update(
+            tier="cold", file_size=size, cold_size=cold_size, tiered_at=time.time()
+        )
+        logger.info("Moved %s to the cold tier, %d -> %d bytes", name, size, cold_size)
+        return cold_size
+
+    def _tier(self, path: Path) -> tuple[int, Path]:
+        """Write the cold copy of a file, the hot one is left in place."""
+        if Path(f"{path}-journal").exists():
+            # a transaction was cut short, the journal is needed to roll it back
+            raise RuntimeError("the database has a hot journal")
+        if Path(f"{path}-wal").exists() and is_sqlite_file(path):
+            # the cold copy has to hold what is still in the -wal file
+            with closing(sqlite3.connect(path)) as conn:
+                busy = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+            if busy:
+                raise RuntimeError("the database is in use")
+
+        encoding = "zstd" if "zstd" in ENCODINGS else "gzip"
+        suffix = next(
+            suffix for suffix, name in COLD_SUFFIXES.items() if name == encoding
+        )
+        self.cold_dir.mkdir(parents=True, exist_ok=True)
+        cold = self.cold_dir / f"{path.name}{suffix}"
+        partial = cold.with_name(f"{cold.name}.part")
+        size = path.stat().st_size
+        try:
+            compressor = StreamCompressor(encoding)
+            with open(path, "rb") as source, open(partial, "wb") as target:
+                while chunk := source.read(OUTPUT_CHUNK):
+                    target.write(compressor.compress(chunk))
+                target.write(compressor.flush())
+                # the hot file is removed next, the copy has to be on disk
+                target.flush()
+                os.fsync(target.fileno())
+            os.replace(partial, cold)
+        finally:
+            partial.unlink(missing_ok=True)
+        return size, cold
+
+    def _remove_hot(self, path: Path):
+        path.unlink()
+        for sidecar in ("-wal", "-shm"):
+            Path(f"{path}{sidecar}").unlink(missing_ok=True)
+
+    def _files(self, directory: Path) -> dict[str, os.stat_result]:
+        try:
+            with os.scandir(directory) as entries:
+                return {
+                    entry.name: entry.stat() for entry in entries if entry.is_file()
+                }
+        except FileNotFoundError:
+            return {}
+
+    async def sweep(self):
+        """Close idle pools, tier files while over the quota and save the
+        access times and tier changes."""
+        now = time.time()
+        for uri in pools.uris(idle=True):
+            name = self._name(uri)
+            if name and now - self._accessed.get(name, 0) >= AppConfig.BUCKET_MIN_IDLE:
+                await pools.discard_uri(uri)
+
+        if self._load:
+            self._persisted = await self._load()
+        files = await asyncio.to_thread(self._files, self.hot_dir)
+        used = sum(stat.st_size for stat in files.values())
+        quota = AppConfig.BUCKET_QUOTA_BYTES
+        if quota and used > quota:
+            candidates = sorted(
+                (
+                    name
+                    for name in files
+                    if bucket_uid(name) in self._persisted
+                    and not name.endswith(TRANSIENT)
+                ),
+                key=lambda name: self._last_accessed(name, files[name].st_mtime),
+            )
+            for name in candidates:
+                if used <= quota * QUOTA_TARGET:
+                    break
+                try:
+                    if await self.tier(name) is not None:
+                        used -= files[name].st_size
+                except Exception as e:
+                    logger.warning("Could not move %s to the cold tier: %s", name, e)
+        await self._flush(now)
+
+    async def _flush(self, now: float):
+        updates, self._pending = self._pending, {}
+        for name, accessed_at in self._accessed.items():
+            uid = bucket_uid(name)
+            if accessed_at > self._persisted.get(uid, 0):
+                updates.setdefault(uid, {})["last_accessed_at"] = accessed_at
+        # files with open pools are in use, whenever this worker last used them
+        for uri in pools.uris():
+            if name := self._name(uri):
+                updates.setdefault(bucket_uid(name), {})["last_accessed_at"] = now
+        if not updates or not self._save:
+            return
+        try:
+            await self._save(updates)
+        except Exception as e:
+            logger.warning("Could not save bucket access times: %s", e)
+            for uid, changes in updates.items():
+                self._pending[uid] = {**changes, **self._pending.get(uid, {})}
+            return
+        for uid, changes in updates.items():
+            if "last_accessed_at" in changes:
+                self._persisted[uid] = changes["last_accessed_at"]
+
+    async def reserve(self):
+        """Make sure there is room under the quota for an upload, tiering
+        idle files when needed."""
+        quota = AppConfig.BUCKET_QUOTA_BYTES
+        if not quota:
+            return
+        files = await asyncio.to_thread(self._files, self.hot_dir)
+        if sum(stat.st_size for stat in files.values()) < quota:
+            return
+        await self.sweep()
+        files = await asyncio.to_thread(self._files, self.hot_dir)
+        if sum(stat.st_size for stat in files.values()) >= quota:
+            raise QuotaExceeded(
+                f"The bucket is over its quota of {quota} bytes and every file in it is in use"
+            )
+
+    async def start(self, load: Loader, save: Saver):
+        self._load, self._save = load, save
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._save:
+            await self._flush(time.time())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(AppConfig.BUCKET_SWEEP_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.warning("Bucket sweep failed: %s", e)
+
+    def snapshot(self) -> dict:
+        hot = self._files(self.hot_dir)
+        cold = self._files(self.cold_dir)
+        pooled = pools.uris()
+        files = []
+        for name, stat in hot.items():
+            if not name.endswith(TRANSIENT):
+                files.append(
+                    {
+                        "uid": bucket_uid(name),
+                        "name": name,
+                        "tier": "hot",
+                        "size": stat.st_size,
+                        "last_accessed_at": self._last_accessed(name, stat.st_mtime),
+                        "pooled": str(self.hot_dir / name) in pooled,
+                    }
+                )
+        for cold_name, stat in cold.items():
+            name, suffix = os.path.splitext(cold_name)
+            if suffix in COLD_SUFFIXES:
+                files.append(
+                    {
+                        "uid": bucket_uid(name),
+                        "name": name,
+                        "tier": "cold",
+                        "size": stat.st_size,
+                        "last_accessed_at": self._last_accessed(name, stat.st_mtime),
+                        "pooled": False,
+                    }
+                )
+        files.sort(key=lambda file: file["last_accessed_at"])
+        return {
+            "quota": AppConfig.BUCKET_QUOTA_BYTES or None,
+            "hot_bytes": sum(stat.st_size for stat in hot.values()),
+            "cold_bytes": sum(stat.st_size for stat in cold.values()),
+            "files": files,
+        }
+
+
+bucket_store = BucketStore()
@@ -0,0 +1,419 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator
+from ..config import AppConfig, SourceConfig
+from .pools import pools
+
+IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_$]*$")
+
+# xmin is a 32 bit transaction id
+XID_MODULO = 4294967296
+
+Batch = tuple[object, list, list]
+
+
+class WatchLimitExceeded(Exception):
+    pass
+
+
+def quote_identifier(name: str) -> str:
+    """Quote a (schema qualified) table or column name for interpolation."""
+    parts = name.split(".")
+    if not all(IDENTIFIER.match(part) for part in parts):
+        raise ValueError(f"Invalid identifier: {name}")
+    return ".".join(f'"{part}"' for part in parts)
+
+
+def parse_watermark(value: str | None):
+    """Watermarks travel as json in the SSE event id, plain values are kept as text."""
+    if value is None or value == "":
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+class TableWatcher(ABC):
+    """Follows the rows of a table that are new or changed since a watermark.
+
+    `changed` is a cheap check that does not read the table, the table is only
+    queried by `poll` once it says something was committed.
+    """
+
+    def __init__(
+        self, connection_id: str, uri: str, table: str, key: str | None, since
+    ):
+        self.connection_id = connection_id
+        self.uri = uri
+        self.table = quote_identifier(table)
+        self.key_name = key
+        self.key = quote_identifier(key) if key else None
+        self.watermark = since
+        self.batch_size = AppConfig.WATCH_BATCH_SIZE
+
+    @abstractmethod
+    async def start(self):
+        """Check the table and key, and set the watermark when not resuming."""
+
+    @abstractmethod
+    async def changed(self) -> bool:
+        """Whether something was committed since the last call."""
+
+    @abstractmethod
+    def poll(self) -> AsyncIterator[Batch]:
+        """Yield (watermark, columns, rows) batches, advancing the watermark."""
+
+    async def wait(self):
+        await asyncio.sleep(AppConfig.WATCH_POLL_INTERVAL)
+
+    async def close(self):
+        pass
+
+    @property
+    def event_id(self) -> str:
+        return json.dumps(self.watermark, separators=(",", ":"), default=str)
+
+
+class SQLiteWatcher(TableWatcher):
+    """Watches the database file, confirmed by PRAGMA data_version.
+
+    A stat of the database and its -wal file decides whether it is worth asking
+    sqlite at all, with a check every heartbeat in case a same sized write
+    landed within the mtime resolution of the filesystem. data_version only
+    changes when another connection commits,
+    so this watcher keeps a connection of its own. Rows are followed by a
+    monotonic key, rowid by default; a column like updated_at also catches
+    updated rows.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.key = self.key or "rowid"
+        self.path = Path(self.uri)
+        self._conn: sqlite3.Connection | None = None
+        self._signature = None
+        self._data_version = None
+        self._checked = 0.0
+
+    def _file_signature(self):
+        signature = []
+        for path in (self.path, Path(f"{self.path}-wal")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                signature.append(None)
+                continue
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _open(self):
+        conn = sqlite3.connect(
+            f"{self.path.resolve().as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        try:
+            self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if self.watermark is None:
+                self.watermark = conn.execute(
+                    f"SELECT MAX({self.key}) FROM {self.table}"
+                ).fetchone()[0]
+            else:
+                # fails early on a missing table or key
+                conn.execute(f"SELECT {self.key} FROM {self.table} LIMIT 0")
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    async def start(self):
+        if not self.path.exists():
+            raise FileNotFoundError(f"Database file not found: {self.path.name}")
+        self._signature = self._file_signature()
+        self._checked = time.monotonic()
+        self._conn = await asyncio.to_thread(self._open)
+
+    async def changed(self) -> bool:
+        signature = self._file_signature()
+        now = time.monotonic()
+        if (
+            signature == self._signature
+            and now - self._checked < AppConfig.WATCH_HEARTBEAT_INTERVAL
+        ):
+            return False
+        self._signature = signature
+        self._checked = now
+        version = await asyncio.to_thread(
+            lambda: self._conn.execute("PRAGMA data_version").fetchone()[0]
+        )
+        if version == self._data_version:
+            return False
+        self._data_version = version
+        return True
+
+    def _fetch(self, watermark):
+        query = f"SELECT {self.key} AS __watermark, * FROM {self.table}"
+        params: tuple = ()
+        if watermark is not None:
+            query += f" WHERE {self.key} > ?"
+            params = (watermark,)
+        query += f" ORDER BY {self.key} LIMIT {self.batch_size}"
+        cursor = self._conn.execute(query, params)
+        try:
+            columns = [
+                {"name": column[0], "type": None} for column in cursor.description[1:]
+            ]
+            return columns, cursor.fetchall()
+        finally:
+            cursor.close()
+
+    async def poll(self) -> AsyncIterator[Batch]:
+        while True:
+            columns, rows = await asyncio.to_thread(self._fetch, self.watermark)
+            if not rows:
+                return
+            self.watermark = rows[-1][0]
+            yield self.watermark, columns, [row[1:] for row in rows]
+            if len(rows) < self.batch_size:
+                return
+
+    async def close(self):
+        if self._conn:
+            await asyncio.to_thread(self._conn.close)
+            self._conn = None
+
+
+class PostgresWatcher(TableWatcher):
+    """Follows a table through the xmin of its rows, or a monotonic key.
+
+    Without a key every row inserted or updated by a transaction that committed
+    since the last poll is sent. The watermark is the oldest transaction still
+    running at the last poll, plus the transactions at or above it that were
+    already sent, so a transaction committing late is not skipped.
+
+    xmin has no index, so every poll without a key scans the whole table.
+    Only tables up to WATCH_XMIN_MAX_BYTES can be watched that way, by at most
+    WATCH_XMIN_MAX_WATCHERS streams of a worker at once; larger tables need a
+    key, whose index the poll uses.
+
+    Changes are noticed through a NOTIFY on `channel` when one is given,
+    otherwise through the table's insert/update/delete counters in
+    pg_stat_all_tables, which are cheap to read and lag about a second.
+    """
+
+    # streams of this worker watching by xmin
+    xmin_watchers = 0
+
+    def __init__(self, *args, channel: str | None = None):
+        super().__init__(*args)
+        if channel:
+            quote_identifier(channel)
+        self.channel = channel
+        self._counters = None
+        self._listener = None
+        self._notified = asyncio.Event()
+        self._key_type = None
+        self._counted = False
+
+    @property
+    def _by_xmin(self) -> bool:
+        return self.key is None
+
+    async def _snapshot_xmin(self, conn) -> int:
+        return await conn.fetchval(
+            "SELECT (txid_snapshot_xmin(txid_current_snapshot()) % $1)::bigint",
+            XID_MODULO,
+        )
+
+    async def _read_counters(self, conn):
+        return await conn.fetchval(
+            "SELECT n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_all_tables "
+            "WHERE relid = $1::regclass",
+            self.table,
+        )
+
+    async def start(self):
+        async with pools.acquire(
+            self.connection_id, SourceConfig.POSTGRES.value, self.uri
+        ) as conn:
+            if self._by_xmin:
+                if PostgresWatcher.xmin_watchers >= AppConfig.WATCH_XMIN_MAX_WATCHERS:
+                    raise WatchLimitExceeded(
+                        f"At most {AppConfig.WATCH_XMIN_MAX_WATCHERS} tables can be watched "
+                        "without a key at once, pass a key column"
+                    )
+                size = await conn.fetchval(
+                    "SELECT pg_relation_size($1::regclass)", self.table
+                )
+                if size > AppConfig.WATCH_XMIN_MAX_BYTES:
+                    raise ValueError(
+                        f"{self.table} is too large to scan for changed rows on every commit, "
+                        "watch it by a monotonic key column, e.g. key=id or key=updated_at"
+                    )
+                if not isinstance(self.watermark, dict):
+                    self.watermark = {
+                        "xmin": await self._snapshot_xmin(conn),
+                        "seen": [],
+                    }
+            else:
+                # watermarks travel as text and are cast back to the key's type
+                self._key_type = await conn.fetchval(
+                    "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+                    "WHERE attrelid = $1::regclass AND attname = $2 AND NOT attisdropped",
+                    self.table,
+                    self.key_name,
+                )
+                if self._key_type is None:
+                    raise ValueError(f"Column {self.key_name} not found")
+                if self.watermark is None:
+                    self.watermark = await conn.fetchval(
+                        f"SELECT MAX({self.key})::text FROM {self.table}"
+                    )
+            self._counters = await self._read_counters(conn)
+
+        if self.channel:
+            import asyncpg
+
+            self._listener = await asyncpg.connect(self.uri)
+            try:
+                await self._listener.add_listener(
+                    self.channel, lambda *_: self._notified.set()
+                )
+            except BaseException:
+                await self.close()
+                raise
+        # counted once nothing can fail anymore, close() is only called on a
+        # watcher that started
+        if self._by_xmin:
+            PostgresWatcher.xmin_watchers += 1
+            self._counted = True
+
+    async def changed(self) -> bool:
+        if self._listener:
+            if not self._notified.is_set():
+                return False
+            self._notified.clear()
+            return True
+        async with pools.acquire(
+            self.connection_id, SourceConfig.POSTGRES.value, self.uri
+        ) as conn:
+            counters = await self._read_counters(conn)
+        if counters == self._counters:
+            return False
+        self._counters = counters
+        return True
+
+    async def wait(self):
+        if not self._listener:
+            return await super().wait()
+        try:
+            await asyncio.wait_for(
+                self._notified.wait(), AppConfig.WATCH_HEARTBEAT_INTERVAL
+            )
+        except asyncio.TimeoutError:
+            pass
+
+    async def poll(self) -> AsyncIterator[Batch]:
+        async with pools.acquire(
+            self.connection_id, SourceConfig.POSTGRES.value, self.uri
+        ) as conn:
+            if self._by_xmin:
+                async for batch in self._poll_xmin(conn):
+                    yield batch
+            else:
+                async for batch in self._poll_key(conn):
+                    yield batch
+
+    async def _poll_key(self, conn):
+        while True:
+            query = f"SELECT {self.key}::text AS __watermark, * FROM {self.table}"
+            params = []
+            if self.watermark is not None:
+                query += f" WHERE {self.key} > $1::text::{self._key_type}"
+                # resumed watermarks are parsed, ints included
+                params.append(str(self.watermark))
+            query += f" ORDER BY {self.key} LIMIT {self.batch_size}"
+            statement = await conn.prepare(query)
+            columns = [
+                {"name": attribute.name, "type": attribute.type.name}
+                for attribute in statement.get_attributes()[1:]
+            ]
+            rows = await statement.fetch(*params)
+            if not rows:
+                return
+            self.watermark = rows[-1][0]
+            yield self.watermark, columns, [tuple(row)[1:] for row in rows]
+            if len(rows) < self.batch_size:
+                return
+
+    async def _poll_xmin(self, conn):
+        previous = self.watermark
+        seen = set(previous["seen"])
+        # one snapshot for the horizon and the rows, every transaction below
+        # the horizon has finished and all of its rows are visible in it
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            horizon = await self._snapshot_xmin(conn)
+            statement = await conn.prepare(
+                f"SELECT t.xmin::text::bigint AS __xmin, t.* FROM {self.table} t "
+                "WHERE t.xmin::text::bigint >= $1 "
+                "AND NOT (t.xmin::text::bigint = ANY($2::bigint[]))"
+            )
+            columns = [
+                {"name": attribute.name, "type": attribute.type.name}
+                for attribute in statement.get_attributes()[1:]
+            ]
+            batch = []
+            async for row in statement.cursor(
+                previous["xmin"], list(seen), prefetch=self.batch_size
+            ):
+                seen.add(row[0])
+                batch.append(tuple(row)[1:])
+                if len(batch) >= self.batch_size:
+                    yield self.watermark, columns, batch
+                    batch = []
+        self.watermark = {
+            "xmin": horizon,
+            "seen": sorted(xid for xid in seen if xid >= horizon),
+        }
+        if batch:
+            yield self.watermark, columns, batch
+
+    async def close(self):
+        if self._counted:
+            PostgresWatcher.xmin_watchers -= 1
+            self._counted = False
+        if self._listener:
+            await self._listener.close()
+            self._listener = None
+
+
+def create_watcher(
+    connection_id: str,
+    source: str,
+    uri: str,
+    table: str,
+    key: str | None = None,
+    since=None,
+    channel: str | None = None,
+) -> TableWatcher:
+    match SourceConfig(source):
+        case SourceConfig.SQLITE:
+            if channel:
+                raise ValueError(
+                    "Notification channels are only supported for postgres"
+                )
+            return SQLiteWatcher(connection_id, uri, table, key, since)
+        case SourceConfig.POSTGRES:
+            return PostgresWatcher(
+                connection_id, uri, table, key, since, channel=channel
+            )
+        case _:
+            raise ValueError(f"Watching not supported for source: {source}")
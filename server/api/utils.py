@@ -2,11 +2,13 @@ from laserorm.storage.storage import StorageSession
 from .config import SourceConfig
 
 
-async def get_columns(session: StorageSession, source: SourceConfig, entity_name: str, schema_name: str = None):
+def get_columns_query(
+    source: SourceConfig, entity_name: str, schema_name: str = None
+) -> str:
     source = SourceConfig(source)
     match source:
         case SourceConfig.SQLITE:
-            return await session.execute(f"PRAGMA table_info({entity_name})")
+            return f"PRAGMA table_info({entity_name})"
         case SourceConfig.POSTGRES:
             # If entity_name contains schema (format: schema.table), parse it
             if '.' in entity_name:
@@ -15,7 +17,7 @@ async def get_columns(session: StorageSession, source: SourceConfig, entity_name
                 table_name = entity_name
                 schema_name = schema_name or 'public'
             
-            query = f"""
+            return f"""
                 SELECT 
                     column_name as name,
                     data_type as type,
@@ -26,4 +28,12 @@ async def get_columns(session: StorageSession, source: SourceConfig, entity_name
                 WHERE table_schema = '{schema_name}' AND table_name = '{table_name}'
                 ORDER BY ordinal_position
             """
-            return await session.execute(query)
+
+
+async def get_columns(
+    session: StorageSession,
+    source: SourceConfig,
+    entity_name: str,
+    schema_name: str = None,
+):
+    return await session.execute(get_columns_query(source, entity_name, schema_name))
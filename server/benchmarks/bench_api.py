@@ -0,0 +1,441 @@
+"""Benchmark the HTTP API in-process against generated SQLite fixtures.
+
+    python -m benchmarks.bench_api --scales 10k,1m
+    python -m benchmarks.bench_api --scales 10k --save-baseline laptop
+    python -m benchmarks.bench_api --scales 10k --compare laptop
+
+Requests go through httpx.ASGITransport, so the numbers cover routing,
+validation, the drivers and serialization without a socket in between. The
+config database and bucket live in a temporary directory and the fixtures are
+linked into it, nothing is written to the configured DB_PATH or BUCKET_DIR.
+
+Every scenario reports latency percentiles, throughput and the process peak
+RSS. A short second pass runs under tracemalloc for the peak Python
+allocations of a single request, tracing is too slow to leave on while timing.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable
+from .fixtures import FIXTURE_DIR, ensure_fixture, parse_scale, user_count
+
+BASELINE_DIR = Path(__file__).resolve().parent / "baselines"
+
+# latency metrics compared against a baseline, throughput is derived from them
+COMPARED = ("p50_ms", "p95_ms", "p99_ms")
+
+NO_CACHE = {"cache-control": "no-cache"}
+
+Request = Callable[["httpx.AsyncClient"], Awaitable["httpx.Response"]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    request: Request
+    # scenarios that scan a whole table stop early on the big fixtures
+    heavy: bool = False
+
+
+@dataclass
+class Result:
+    samples: list[float] = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    if len(ordered) == 1:
+        return ordered[0]
+    return statistics.quantiles(ordered, n=100, method="inclusive")[q - 1]
+
+
+def summarize(result: Result, concurrency: int) -> dict:
+    ordered = sorted(result.samples)
+    summary = {
+        "requests": len(ordered),
+        "errors": result.errors,
+        "concurrency": concurrency,
+        "throughput_rps": len(ordered) / result.elapsed if result.elapsed else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    if ordered:
+        summary |= {
+            "min_ms": ordered[0] * 1000,
+            "p50_ms": percentile(ordered, 50) * 1000,
+            "p95_ms": percentile(ordered, 95) * 1000,
+            "p99_ms": percentile(ordered, 99) * 1000,
+            "max_ms": ordered[-1] * 1000,
+        }
+    return summary
+
+
+async def timed(client, request: Request, result: Result):
+    start = time.perf_counter()
+    try:
+        response = await request(client)
+        ok = response.status_code < 400
+    except Exception:
+        ok = False
+    if ok:
+        result.samples.append(time.perf_counter() - start)
+    else:
+        result.errors += 1
+
+
+async def run_scenario(
+    client, scenario: Scenario, iterations: int, duration: float, concurrency: int
+) -> Result:
+    """Run until `iterations` requests completed or `duration` seconds passed."""
+    result = Result()
+    deadline = time.perf_counter() + duration
+    remaining = iterations
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0 and time.perf_counter() < deadline:
+            remaining -= 1
+            await timed(client, scenario.request, result)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+async def trace_allocations(client, scenario: Scenario, runs: int) -> int:
+    """Peak bytes allocated by Python while serving a single request."""
+    peak = 0
+    tracemalloc.start()
+    try:
+        for _ in range(runs):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            await scenario.request(client)
+            _, request_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, request_peak - baseline)
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+async def register_fixture(client, scale: str) -> str:
+    response = await client.post(
+        "/connections",
+        json={
+            "source": "sqlite",
+            "name": f"bench {scale}",
+            "connection_uri": ensure_fixture(scale).name,
+        },
+    )
+    response.raise_for_status()
+    return response.json()["uid"]
+
+
+def query_scenarios(connection_id: str, scale: str) -> list[Scenario]:
+    rows = parse_scale(scale)
+    users = user_count(rows)
+    # fixed seed so every run pages and filters through the same rows
+    rng = random.Random(0)
+    base = f"/connection/{connection_id}/entitities/events"
+
+    def query(sql: Callable[[], str], headers: dict | None = NO_CACHE) -> Request:
+        return lambda client: client.get(
+            f"{base}/queries", params={"query": sql()}, headers=headers
+        )
+
+    return [
+        Scenario(
+            "query_page",
+            query(
+                lambda: "SELECT * FROM events LIMIT 100 "
+                f"OFFSET {rng.randrange(max(1, rows - 100))}"
+            ),
+        ),
+        Scenario(
+            "query_filter",
+            query(
+                lambda: f"SELECT * FROM events WHERE user_id = {rng.randint(1, users)}"
+            ),
+        ),
+        Scenario(
+            "query_large_result",
+            query(lambda: "SELECT * FROM events LIMIT 10000"),
+        ),
+        Scenario(
+            "query_aggregate",
+            query(
+                lambda: "SELECT kind, COUNT(*), SUM(amount) FROM events GROUP BY kind"
+            ),
+            heavy=True,
+        ),
+        Scenario(
+            "query_cached",
+            query(lambda: "SELECT * FROM events LIMIT 100", headers=None),
+        ),
+        Scenario(
+            "get_tables",
+            lambda client: client.get(
+                f"/connection/{connection_id}/table", headers=NO_CACHE
+            ),
+        ),
+        Scenario(
+            "get_columns",
+            lambda client: client.get(f"{base}/columns", headers=NO_CACHE),
+        ),
+    ]
+
+
+def api_scenarios(upload: bytes, fixture_name: str) -> list[Scenario]:
+    """Scenarios that do not depend on the fixture size."""
+    created: list[str] = []
+
+    async def upload_file(client):
+        return await client.post(
+            "/bucket",
+            files={"file": ("bench.db", upload, "application/octet-stream")},
+        )
+
+    async def create_connection(client):
+        response = await client.post(
+            "/connections",
+            json={"source": "sqlite", "name": "crud", "connection_uri": fixture_name},
+        )
+        if response.status_code < 400:
+            created.append(response.json()["uid"])
+        return response
+
+    def with_connection(call):
+        async def request(client):
+            # reuse the newest connection, create one when the create
+            # scenario was skipped or the deletes used them all up
+            if not created:
+                await create_connection(client)
+            return await call(client, created[-1])
+
+        return request
+
+    async def update_connection(client, uid):
+        return await client.put(f"/connections/{uid}", json={"name": "crud renamed"})
+
+    async def delete_connection(client, uid):
+        if uid in created:
+            created.remove(uid)
+        return await client.delete(f"/connections/{uid}")
+
+    return [
+        Scenario("upload_file", upload_file),
+        Scenario("connection_create", create_connection),
+        Scenario("connection_list", lambda client: client.get("/connections")),
+        Scenario(
+            "connection_get",
+            with_connection(lambda client, uid: client.get(f"/connections/{uid}")),
+        ),
+        Scenario("connection_update", with_connection(update_connection)),
+        Scenario("connection_delete", with_connection(delete_connection)),
+    ]
+
+
+async def run_suite(args) -> dict:
+    import httpx
+    from main import api
+
+    results: dict[str, dict[str, dict]] = {}
+    transport = httpx.ASGITransport(app=api)
+    async with api.router.lifespan_context(api):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as client:
+            groups = []
+            for scale in args.scales:
+                connection_id = await register_fixture(client, scale)
+                groups.append((scale, query_scenarios(connection_id, scale)))
+            # uploads and connection crud use the smallest fixture
+            smallest = ensure_fixture(min(args.scales, key=parse_scale))
+            groups.append(("api", api_scenarios(smallest.read_bytes(), smallest.name)))
+
+            for group, scenarios in groups:
+                results[group] = {}
+                for scenario in scenarios:
+                    if args.only and scenario.name not in args.only:
+                        continue
+                    iterations = args.iterations
+                    if (
+                        scenario.heavy
+                        and group != "api"
+                        and parse_scale(group) > 100_000
+                    ):
+                        iterations = max(5, iterations // 20)
+                    for _ in range(args.warmup):
+                        await scenario.request(client)
+                    result = await run_scenario(
+                        client, scenario, iterations, args.duration, args.concurrency
+                    )
+                    summary = summarize(result, args.concurrency)
+                    if args.alloc_runs:
+                        summary["alloc_peak_kb"] = (
+                            await trace_allocations(client, scenario, args.alloc_runs)
+                            / 1024
+                        )
+                    results[group][scenario.name] = summary
+                    print(format_row(group, scenario.name, summary), flush=True)
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_header() -> str:
+    return (
+        f"{'group':<6} {'scenario':<20} {'reqs':>6} {'err':>4} {'p50 ms':>9} "
+        f"{'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'rss MB':>8} {'alloc KB':>9}"
+    )
+
+
+def format_row(group: str, name: str, summary: dict) -> str:
+    def number(key, spec):
+        value = summary.get(key)
+        if value is None:
+            return f"{'-':>{spec.split('.')[0]}}"
+        return format(value, spec)
+
+    return (
+        f"{group:<6} {name:<20} {summary['requests']:>6} {summary['errors']:>4} "
+        f"{number('p50_ms', '9.2f')} {number('p95_ms', '9.2f')} "
+        f"{number('p99_ms', '9.2f')} {number('throughput_rps', '9.1f')} "
+        f"{number('peak_rss_mb', '8.1f')} {number('alloc_peak_kb', '9.0f')}"
+    )
+
+
+def baseline_path(name: str) -> Path:
+    path = Path(name)
+    if path.suffix == ".json" or path.parent != Path("."):
+        return path
+    return BASELINE_DIR / f"{name}.json"
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Print the change against a baseline, returns the regressed metrics."""
+    regressions = []
+    print(
+        f"\ncompared with baseline {baseline.get('revision') or ''} "
+        f"(regression threshold {threshold:.0%})"
+    )
+    for group, scenarios in current["results"].items():
+        for name, summary in scenarios.items():
+            before = baseline["results"].get(group, {}).get(name)
+            if not before:
+                continue
+            changes = []
+            for metric in COMPARED:
+                if metric not in summary or not before.get(metric):
+                    continue
+                change = summary[metric] / before[metric] - 1
+                flag = ""
+                if change > threshold:
+                    flag = " !"
+                    regressions.append(f"{group}/{name} {metric}")
+                changes.append(f"{metric[:-3]} {change:+7.1%}{flag}")
+            if changes:
+                print(f"{group:<6} {name:<20} " + "  ".join(changes))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--scales", default="10k,1m", help="comma separated, e.g. 10k,1m,10m"
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument(
+        "--duration", type=float, default=30.0, help="seconds per scenario at most"
+    )
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--alloc-runs", type=int, default=3, help="0 disables allocation tracing"
+    )
+    parser.add_argument("--only", default="", help="comma separated scenario names")
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--save-baseline", metavar="NAME")
+    parser.add_argument("--compare", metavar="NAME")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+    args.scales = [scale.strip() for scale in args.scales.split(",") if scale.strip()]
+    args.only = {name.strip() for name in args.only.split(",") if name.strip()}
+
+    with tempfile.TemporaryDirectory(prefix="datapilot-bench-") as tmp:
+        bucket = Path(tmp) / "bucket"
+        bucket.mkdir()
+        for scale in args.scales:
+            path = ensure_fixture(scale)
+            (bucket / path.name).symlink_to(path)
+        # read by AppConfig when the app is imported, set before .env is
+        # loaded so they win over it
+        os.environ["MODE"] = "BENCHMARK"
+        os.environ["CONFIG_STORE"] = "sqlite"
+        os.environ["DB_PATH"] = str(Path(tmp) / "config.db")
+        os.environ["BUCKET_DIR"] = str(bucket)
+        os.environ["SHARED_CACHE_DIR"] = ""
+
+        print(format_header())
+        results = asyncio.run(run_suite(args))
+
+    report = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fixtures": str(FIXTURE_DIR),
+        "settings": {
+            "iterations": args.iterations,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if args.save_baseline:
+        path = baseline_path(args.save_baseline)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2))
+        print(f"\nsaved baseline to {path}")
+    if args.compare:
+        baseline = json.loads(baseline_path(args.compare).read_text())
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions: " + ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
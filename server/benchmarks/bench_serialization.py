@@ -0,0 +1,93 @@
+"""Compare the pydantic response path with the raw encoder used by execute_query.
+
+python -m benchmarks.bench_serialization --rows 100000
+"""
+
+import argparse
+import datetime
+import json
+import time
+import uuid
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+from api.models import QueryResult
+from api.services.serialization import encode_query_result
+
+COLUMNS = [
+    {"name": "id", "type": "int4"},
+    {"name": "name", "type": "text"},
+    {"name": "price", "type": "numeric"},
+    {"name": "created_at", "type": "timestamp"},
+    {"name": "uid", "type": "uuid"},
+    {"name": "payload", "type": "bytea"},
+]
+
+
+def make_rows(count: int) -> list[tuple]:
+    created = datetime.datetime(2024, 1, 1)
+    return [
+        (
+            i,
+            f"user {i}",
+            Decimal(i) / 100,
+            created + datetime.timedelta(seconds=i),
+            uuid.UUID(int=i),
+            b"payload",
+        )
+        for i in range(count)
+    ]
+
+
+def pydantic_path(meta: dict, rows: list[tuple]) -> bytes:
+    # what FastAPI did with response_model=QueryResult and dict rows
+    names = [column["name"] for column in COLUMNS]
+    result = QueryResult(
+        **meta, columns=COLUMNS, rows=[dict(zip(names, row)) for row in rows]
+    )
+    return json.dumps(jsonable_encoder(result)).encode()
+
+
+def raw_path(meta: dict, rows: list[tuple]) -> bytes:
+    return encode_query_result(meta, COLUMNS, rows)
+
+
+def measure(fn, meta: dict, rows: list[tuple], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(meta, rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    meta = {
+        "query": "SELECT * FROM users",
+        "connection_id": "bench",
+        "entity_name": "users",
+        "limit": None,
+        "offset": None,
+        "params": None,
+        "total_rows": None,
+        "total_rows_estimated": False,
+    }
+    assert json.loads(pydantic_path(meta, rows[:10])) == json.loads(
+        raw_path(meta, rows[:10])
+    ), "raw encoder changed the wire shape"
+
+    pydantic_time = measure(pydantic_path, meta, rows, args.repeat)
+    raw_time = measure(raw_path, meta, rows, args.repeat)
+    print(f"rows:     {args.rows}")
+    print(f"pydantic: {pydantic_time * 1000:.1f} ms")
+    print(f"raw:      {raw_time * 1000:.1f} ms")
+    print(f"speedup:  {pydantic_time / raw_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
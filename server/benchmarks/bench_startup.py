@@ -0,0 +1,73 @@
+"""Measure how long a fresh worker takes to become ready.
+
+    python -m benchmarks.bench_startup --runs 5
+
+Each run starts a new interpreter, imports the app and runs the lifespan
+startup, the way uvicorn does before it accepts the first request.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+# runs inside the fresh interpreter
+PROBE = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+from main import api
+imported = time.perf_counter()
+
+async def startup():
+    async with api.router.lifespan_context(api):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+print(json.dumps({
+    "import": imported - start,
+    "startup": ready - imported,
+    "total": ready - start,
+    "asyncpg_loaded": "asyncpg" in sys.modules,
+}))
+"""
+
+
+def measure_once() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=SERVER_DIR,
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(runs: int) -> dict:
+    samples = [measure_once() for _ in range(runs)]
+    return {
+        key: statistics.median(sample[key] for sample in samples)
+        for key in ("import", "startup", "total")
+    } | {"asyncpg_loaded": any(sample["asyncpg_loaded"] for sample in samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    print(f"import:   {result['import'] * 1000:.0f} ms")
+    print(f"startup:  {result['startup'] * 1000:.0f} ms")
+    print(f"total:    {result['total'] * 1000:.0f} ms (median of {args.runs})")
+    print(f"asyncpg imported at startup: {result['asyncpg_loaded']}")
+
+
+if __name__ == "__main__":
+    main()
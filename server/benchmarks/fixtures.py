@@ -0,0 +1,153 @@
+"""Deterministic SQLite databases used by the API benchmarks.
+
+    python -m benchmarks.fixtures 10k 1m
+
+Fixtures are generated once into benchmarks/.fixtures and reused, the same
+scale and seed always produce the same rows so runs on different machines or
+commits query identical data.
+"""
+
+import argparse
+import datetime
+import random
+import sqlite3
+import time
+from pathlib import Path
+
+FIXTURE_DIR = Path(__file__).resolve().parent / ".fixtures"
+# bump when the generated schema or data changes so stale fixtures are rebuilt
+FIXTURE_VERSION = 1
+SEED = 42
+
+SCALES = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+KINDS = ["view", "click", "signup", "purchase", "refund", "logout"]
+BATCH_SIZE = 50_000
+
+SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE events (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    kind TEXT NOT NULL,
+    amount REAL,
+    created_at TEXT NOT NULL,
+    payload TEXT
+);
+"""
+# created after the rows are loaded, building an index once is much faster
+# than maintaining it on every insert
+INDEXES = """
+CREATE INDEX events_user_id ON events(user_id);
+"""
+
+EPOCH = datetime.datetime(2024, 1, 1)
+
+
+def parse_scale(scale: str) -> int:
+    """Row count for a named scale ("10k", "1m") or a plain number."""
+    scale = scale.strip().lower()
+    if scale in SCALES:
+        return SCALES[scale]
+    return int(scale.replace("_", ""))
+
+
+def user_count(rows: int) -> int:
+    return max(1, rows // 100)
+
+
+def fixture_path(scale: str) -> Path:
+    return FIXTURE_DIR / f"events-{scale}-v{FIXTURE_VERSION}.db"
+
+
+def _users(count: int, rng: random.Random):
+    for i in range(1, count + 1):
+        created = EPOCH + datetime.timedelta(seconds=rng.randrange(31_536_000))
+        yield (i, f"user {i}", f"user{i}@example.com", created.isoformat())
+
+
+def _events(rows: int, users: int, rng: random.Random):
+    for i in range(1, rows + 1):
+        kind = rng.choice(KINDS)
+        amount = (
+            round(rng.uniform(1, 500), 2) if kind in ("purchase", "refund") else None
+        )
+        created = EPOCH + datetime.timedelta(seconds=i * 3)
+        yield (
+            i,
+            rng.randint(1, users),
+            kind,
+            amount,
+            created.isoformat(),
+            f'{{"session": {rng.getrandbits(32)}, "page": "/p/{rng.randrange(1000)}"}}',
+        )
+
+
+def _insert(conn: sqlite3.Connection, sql: str, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(sql, batch)
+
+
+def generate(path: Path, rows: int, seed: int = SEED):
+    """Write a fixture with `rows` events to path."""
+    rng = random.Random(seed)
+    users = user_count(rows)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.unlink(missing_ok=True)
+
+    conn = sqlite3.connect(tmp, isolation_level=None)
+    try:
+        # the file is thrown away if generation fails, durability is not needed
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript(SCHEMA)
+        conn.execute("BEGIN")
+        _insert(conn, "INSERT INTO users VALUES (?, ?, ?, ?)", _users(users, rng))
+        _insert(
+            conn,
+            "INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)",
+            _events(rows, users, rng),
+        )
+        conn.execute("COMMIT")
+        conn.executescript(INDEXES)
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    tmp.replace(path)
+
+
+def ensure_fixture(scale: str) -> Path:
+    """Path of the fixture for scale, generating it on first use."""
+    path = fixture_path(scale)
+    if not path.exists():
+        rows = parse_scale(scale)
+        print(f"generating {scale} fixture ({rows:,} rows)...", flush=True)
+        start = time.perf_counter()
+        generate(path, rows)
+        print(
+            f"generated {path.name} in {time.perf_counter() - start:.1f}s", flush=True
+        )
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scales", nargs="*", default=list(SCALES))
+    args = parser.parse_args()
+    for scale in args.scales:
+        ensure_fixture(scale)
+
+
+if __name__ == "__main__":
+    main()
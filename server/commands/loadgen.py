@@ -0,0 +1,460 @@
+"""Replay playground traffic against a running DataPilot instance.
+
+    python commands/loadgen.py --url http://localhost:8000 --concurrency 1,4,16,64
+    python commands/loadgen.py --rate 20,50,100,200 --duration 60 --output load.json
+    python commands/loadgen.py --mix sidebar=1,preview=3,search=1,browse=4,upload=0
+
+A seeded SQLite dataset is built with the seeder (reused from --fixture when
+it exists), uploaded through the bucket and registered as a connection, then
+every step of the run replays a weighted mix of what the console does:
+
+* sidebar: list the connections and the tables of one
+* preview: first page of a table, as when a table is opened
+* search: the LIKE search over every column of the table tab
+* browse: a random page of a table
+* upload: upload a small database and register it (the connection is removed
+  again so the connection list does not grow during the run)
+
+--concurrency runs a closed loop of that many virtual analysts, --rate an open
+loop that starts actions on a fixed schedule. In open loop the latency is taken
+from the time an action was due, not when it could actually start, so a
+saturated server shows up in the percentiles instead of being hidden by the
+generator slowing down (coordinated omission).
+
+Each step prints throughput, error rate and latency percentiles, together they
+form the saturation curve. Uploaded files stay in the bucket.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+
+import seeder
+
+ACTIONS = ("sidebar", "preview", "search", "browse", "upload")
+DEFAULT_MIX = "sidebar=15,preview=25,search=15,browse=40,upload=5"
+PAGE_SIZE = 100
+PERCENTILES = (50, 75, 90, 95, 99, 99.9, 99.99)
+
+
+class Histogram:
+    """Latency histogram in the spirit of HdrHistogram.
+
+    Values are counted in microsecond buckets that are exact below 128us and
+    log-linear above, 64 buckets per power of two, so any percentile is off by
+    at most 1/64 (~1.6%) whatever the number of samples, in constant memory.
+    """
+
+    SUB_BUCKETS = 64
+
+    def __init__(self):
+        self.counts: Counter[int] = Counter()
+        self.count = 0
+        self.max = 0
+
+    @classmethod
+    def _index(cls, value: int) -> int:
+        shift = max(0, value.bit_length() - 7)
+        return shift * cls.SUB_BUCKETS + (value >> shift)
+
+    @classmethod
+    def _value(cls, index: int) -> int:
+        # middle of the bucket
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = (index - cls.SUB_BUCKETS) // cls.SUB_BUCKETS
+        low = (index - shift * cls.SUB_BUCKETS) << shift
+        return low + (1 << shift) // 2
+
+    def record(self, seconds: float):
+        value = max(1, int(seconds * 1_000_000))
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Histogram"):
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> float:
+        """Latency in milliseconds."""
+        if not self.count:
+            return 0.0
+        target = max(1, round(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._value(index), self.max) / 1000
+        return self.max / 1000
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            **{f"p{percent:g}_ms": self.percentile(percent) for percent in PERCENTILES},
+            "max_ms": self.max / 1000,
+        }
+
+
+@dataclass
+class Stats:
+    latency: Histogram = field(default_factory=Histogram)
+    by_action: dict[str, Histogram] = field(default_factory=dict)
+    errors: Counter = field(default_factory=Counter)
+    completed: int = 0
+
+    def record(self, action: str, seconds: float, error: str | None):
+        self.completed += 1
+        if error:
+            self.errors[f"{action}: {error}"] += 1
+            return
+        self.latency.record(seconds)
+        self.by_action.setdefault(action, Histogram()).record(seconds)
+
+
+@dataclass
+class Target:
+    connection_id: str
+    tables: dict[str, list[str]]
+    rows: dict[str, int]
+    words: list[str]
+    upload: bytes
+
+
+class Traffic:
+    """The requests the console sends for each action."""
+
+    def __init__(self, client: httpx.AsyncClient, target: Target):
+        self.client = client
+        self.target = target
+
+    async def _get(self, url: str, **params):
+        response = await self.client.get(url, params=params or None)
+        response.raise_for_status()
+        return response
+
+    async def _query(self, table: str, query: str, limit: int, offset: int):
+        return await self._get(
+            f"/connection/{self.target.connection_id}/entitities/{table}/queries",
+            query=query,
+            limit=limit,
+            offset=offset,
+        )
+
+    async def sidebar(self, rng: random.Random):
+        await self._get("/connections")
+        await self._get(f"/connection/{self.target.connection_id}/table")
+
+    async def preview(self, rng: random.Random):
+        table = rng.choice(list(self.target.tables))
+        await self._query(table, f"SELECT * FROM {table}", PAGE_SIZE, 0)
+
+    async def search(self, rng: random.Random):
+        table = rng.choice(list(self.target.tables))
+        columns = self.target.tables[table]
+        word = rng.choice(self.target.words)
+        where = " OR ".join(f"{column} LIKE '%{word}%'" for column in columns)
+        order = ", ".join(
+            f"CASE WHEN {column} LIKE '{word}%' THEN 0 ELSE 1 END" for column in columns
+        )
+        await self._query(
+            table,
+            f"SELECT * FROM {table} WHERE ({where}) ORDER BY {order} LIMIT {PAGE_SIZE}",
+            PAGE_SIZE,
+            0,
+        )
+
+    async def browse(self, rng: random.Random):
+        table = rng.choice(list(self.target.tables))
+        pages = max(1, self.target.rows[table] // PAGE_SIZE)
+        offset = rng.randrange(pages) * PAGE_SIZE
+        await self._query(table, f"SELECT * FROM {table}", PAGE_SIZE, offset)
+
+    async def upload(self, rng: random.Random):
+        response = await self.client.post(
+            "/bucket",
+            files={
+                "file": ("loadgen.db", self.target.upload, "application/octet-stream")
+            },
+        )
+        response.raise_for_status()
+        response = await self.client.post(
+            "/connections",
+            json={
+                "source": "sqlite",
+                "name": "loadgen upload",
+                "connection_uri": f"{response.json()['uid']}.db",
+            },
+        )
+        response.raise_for_status()
+        response = await self.client.delete(f"/connections/{response.json()['uid']}")
+        response.raise_for_status()
+
+    async def run(self, action: str, rng: random.Random, stats: Stats, started: float):
+        error = None
+        try:
+            await getattr(self, action)(rng)
+        except httpx.HTTPStatusError as e:
+            error = str(e.response.status_code)
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        stats.record(action, time.perf_counter() - started, error)
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise argparse.ArgumentTypeError(
+                f"unknown action {name!r}, pick from {ACTIONS}"
+            )
+        weights[name] = float(weight or 1)
+    if not any(weights.values()):
+        raise argparse.ArgumentTypeError("the mix needs at least one positive weight")
+    return weights
+
+
+def parse_steps(steps: str) -> list[float]:
+    return [float(step) for step in steps.split(",") if step.strip()]
+
+
+def build_fixture(path: Path, scale: float, seed: int):
+    options = seeder.Options(dialect="sqlite", scale=scale, seed=seed)
+    asyncio.run(seeder.seed(seeder.SQLiteLoader(str(path)), options, 1, 10_000))
+
+
+async def prepare(client: httpx.AsyncClient, args) -> Target:
+    """Upload the fixture and register it as a connection."""
+    fixture = Path(args.fixture or f"./loadgen-{args.scale:g}-{args.seed}.db")
+    if not fixture.exists():
+        await asyncio.to_thread(build_fixture, fixture, args.scale, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        upload = Path(tmp) / "upload.db"
+        await asyncio.to_thread(build_fixture, upload, 0.1, args.seed)
+        upload_bytes = upload.read_bytes()
+
+    response = await client.post(
+        "/bucket",
+        files={
+            "file": (fixture.name, fixture.read_bytes(), "application/octet-stream")
+        },
+    )
+    response.raise_for_status()
+    response = await client.post(
+        "/connections",
+        json={
+            "source": "sqlite",
+            "name": f"loadgen {fixture.name}",
+            "connection_uri": f"{response.json()['uid']}.db",
+        },
+    )
+    response.raise_for_status()
+
+    options = seeder.Options(dialect="sqlite", scale=args.scale, seed=args.seed)
+    tables = seeder.build_schema(options)
+    return Target(
+        connection_id=response.json()["uid"],
+        # the search covers every column, like the table tab
+        tables={
+            table.name: [column.name for column in table.columns] for table in tables
+        },
+        rows={table.name: table.rows for table in tables},
+        words=seeder.Vocabulary(args.seed).words,
+        upload=upload_bytes,
+    )
+
+
+def pick(rng: random.Random, mix: dict[str, float]) -> str:
+    return rng.choices(list(mix), weights=list(mix.values()))[0]
+
+
+async def closed_loop(
+    traffic: Traffic, mix, users: int, duration: float, warmup: float, seed: int
+) -> Stats:
+    stats, warm = Stats(), Stats()
+    start = time.perf_counter()
+    measure_from = start + warmup
+    end = measure_from + duration
+
+    async def analyst(number: int):
+        rng = random.Random(f"{seed}:{number}")
+        while (now := time.perf_counter()) < end:
+            await traffic.run(
+                pick(rng, mix), rng, stats if now >= measure_from else warm, now
+            )
+
+    await asyncio.gather(*(analyst(number) for number in range(users)))
+    return stats
+
+
+async def open_loop(
+    traffic: Traffic,
+    mix,
+    rate: float,
+    duration: float,
+    warmup: float,
+    seed: int,
+    max_in_flight: int,
+) -> Stats:
+    stats, warm = Stats(), Stats()
+    rng = random.Random(f"{seed}:open")
+    slots = asyncio.Semaphore(max_in_flight)
+    tasks = set()
+    interval = 1 / rate
+    start = time.perf_counter()
+    measure_from = start + warmup
+    total = int((warmup + duration) * rate)
+
+    async def action(due: float, name: str, action_rng: random.Random):
+        # waiting for a slot counts, the action was due at `due`
+        async with slots:
+            await traffic.run(
+                name, action_rng, stats if due >= measure_from else warm, due
+            )
+
+    for number in range(total):
+        due = start + number * interval
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.create_task(
+            action(due, pick(rng, mix), random.Random(f"{seed}:{number}"))
+        )
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def format_step(label: str, stats: Stats, elapsed: float) -> str:
+    summary = stats.latency.summary()
+    errors = sum(stats.errors.values())
+    error_rate = errors / stats.completed if stats.completed else 0.0
+    return (
+        f"{label:>10} {stats.completed / elapsed:>9.1f} {error_rate:>7.2%} "
+        f"{summary['p50_ms']:>9.1f} {summary['p90_ms']:>9.1f} "
+        f"{summary['p99_ms']:>9.1f} {summary['p99.9_ms']:>9.1f} {summary['max_ms']:>9.1f}"
+    )
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=args.timeout, limits=limits
+    ) as client:
+        target = await prepare(client, args)
+        traffic = Traffic(client, target)
+
+        mode = "rate" if args.rate else "concurrency"
+        steps = args.rate or args.concurrency
+        print(
+            f"{mode:>10} {'actions/s':>9} {'errors':>7} {'p50 ms':>9} {'p90 ms':>9} "
+            f"{'p99 ms':>9} {'p99.9 ms':>9} {'max ms':>9}"
+        )
+        results = []
+        for step in steps:
+            if args.rate:
+                stats = await open_loop(
+                    traffic,
+                    args.mix,
+                    step,
+                    args.duration,
+                    args.warmup,
+                    args.seed,
+                    args.max_in_flight,
+                )
+            else:
+                stats = await closed_loop(
+                    traffic, args.mix, int(step), args.duration, args.warmup, args.seed
+                )
+            print(format_step(f"{step:g}", stats, args.duration), flush=True)
+            results.append(
+                {
+                    mode: step,
+                    "throughput": stats.completed / args.duration,
+                    "errors": dict(stats.errors),
+                    "error_rate": (
+                        sum(stats.errors.values()) / stats.completed
+                        if stats.completed
+                        else 0.0
+                    ),
+                    "latency": stats.latency.summary(),
+                    "actions": {
+                        name: hist.summary() for name, hist in stats.by_action.items()
+                    },
+                }
+            )
+            if (
+                args.stop_on_error_rate
+                and results[-1]["error_rate"] > args.stop_on_error_rate
+            ):
+                print(f"stopping, error rate above {args.stop_on_error_rate:.0%}")
+                break
+
+        await client.delete(f"/connections/{target.connection_id}")
+
+    # the highest throughput that still met the latency objective
+    within = [
+        result
+        for result in results
+        if result["latency"]["p99_ms"] <= args.slo_p99_ms
+        and result["error_rate"] < 0.01
+    ]
+    if within:
+        best = max(within, key=lambda result: result["throughput"])
+        print(
+            f"\nsaturation: {best['throughput']:.1f} actions/s at {mode} {best[mode]:g} "
+            f"(p99 <= {args.slo_p99_ms:g} ms, errors < 1%)"
+        )
+    else:
+        print(f"\nno step met p99 <= {args.slo_p99_ms:g} ms with errors < 1%")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    steps = parser.add_mutually_exclusive_group()
+    steps.add_argument("--concurrency", type=parse_steps, default=[1, 2, 4, 8, 16, 32])
+    steps.add_argument("--rate", type=parse_steps, help="actions per second, open loop")
+    parser.add_argument(
+        "--duration", type=float, default=30.0, help="measured seconds per step"
+    )
+    parser.add_argument(
+        "--warmup", type=float, default=5.0, help="unmeasured seconds per step"
+    )
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--scale", type=float, default=10.0, help="seeder scale of the dataset"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--fixture", help="sqlite file to reuse or create")
+    parser.add_argument("--slo-p99-ms", type=float, default=1000.0)
+    parser.add_argument("--stop-on-error-rate", type=float, default=0.5)
+    parser.add_argument("--output", help="write the results to this json file")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args))
+    except httpx.HTTPError as e:
+        sys.exit(f"could not reach {args.url}: {e}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,438 @@
-from laserorm.storage.sqlite import SQLite
-from laserorm.storage.storage import StorageSession
-from laserorm.core.schema import Schema
-from faker import Faker
-from dataclasses import dataclass
-import asyncio
+"""Bulk generator for benchmark datasets.
+
+    python commands/seeder.py --db sqlite --scale 100
+    python commands/seeder.py --db postgres --uri postgresql://localhost/bench \\
+        --scale 1000 --posts-per-user 5 --comments-per-post 3 --wide-columns 40
+
+`--scale 1` is 1000 users, every other table fans out from there. Rows are
+generated in chunks by a pool of processes and bulk loaded as they arrive,
+with executemany on sqlite and COPY on postgres. Each chunk has its own RNG
+derived from the seed, so the data does not depend on the number of workers
+and the same arguments always produce the same dataset.
+
+Existing seeder tables are dropped first.
+"""
+
 import argparse
+import asyncio
+import datetime
+import multiprocessing
+import os
 import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable
+
+USERS_PER_SCALE = 1000
+# dropped before seeding, children first
+SEEDER_TABLES = ["comments", "posts", "users"]
+EPOCH = datetime.datetime(2024, 1, 1)
+YEAR_SECONDS = 365 * 24 * 3600
+
 
+@dataclass(frozen=True)
+class Options:
+    dialect: str
+    scale: float = 1.0
+    seed: int = 42
+    posts_per_user: int = 1
+    comments_per_post: int = 0
+    wide_columns: int = 0
+    indexes: bool = True
 
-@dataclass
-class User(Schema):
+
+@dataclass(frozen=True)
+class Column:
     name: str
-    location: list[float]
+    # int, float, text or timestamp
+    type: str
+    # "id", "fk:<table>" or one of the generators in GENERATORS
+    kind: str
+
+
+@dataclass(frozen=True)
+class Table:
+    name: str
+    rows: int
+    columns: list[Column]
+
+    def foreign_keys(self) -> list[tuple[str, str]]:
+        return [
+            (column.name, column.kind.split(":", 1)[1])
+            for column in self.columns
+            if column.kind.startswith("fk:")
+        ]
+
+
+def build_schema(options: Options) -> list[Table]:
+    """Tables in load order, parents before the tables referencing them."""
+    users = max(1, int(USERS_PER_SCALE * options.scale))
+    posts = users * options.posts_per_user
+    comments = posts * options.comments_per_post
+
+    # wide tables cycle through the column types
+    wide = [
+        Column(
+            f"attr_{i}", *[("int", "int"), ("float", "float"), ("text", "word")][i % 3]
+        )
+        for i in range(1, options.wide_columns + 1)
+    ]
+    tables = [
+        Table(
+            "users",
+            users,
+            [
+                Column("id", "int", "id"),
+                Column("name", "text", "name"),
+                Column("email", "text", "email"),
+                Column("latitude", "float", "latitude"),
+                Column("longitude", "float", "longitude"),
+                Column("created_at", "timestamp", "timestamp"),
+                *wide,
+            ],
+        ),
+        Table(
+            "posts",
+            posts,
+            [
+                Column("id", "int", "id"),
+                Column("user_id", "int", "fk:users"),
+                Column("title", "text", "sentence"),
+                Column("body", "text", "paragraph"),
+                Column("views", "int", "int"),
+                Column("created_at", "timestamp", "timestamp"),
+            ],
+        ),
+    ]
+    if comments:
+        tables.append(
+            Table(
+                "comments",
+                comments,
+                [
+                    Column("id", "int", "id"),
+                    Column("post_id", "int", "fk:posts"),
+                    Column("user_id", "int", "fk:users"),
+                    Column("body", "text", "sentence"),
+                    Column("created_at", "timestamp", "timestamp"),
+                ],
+            )
+        )
+    return tables
+
+
+SQL_TYPES = {
+    "sqlite": {"int": "INTEGER", "float": "REAL", "text": "TEXT", "timestamp": "TEXT"},
+    "postgres": {
+        "int": "BIGINT",
+        "float": "DOUBLE PRECISION",
+        "text": "TEXT",
+        "timestamp": "TIMESTAMP",
+    },
+}
+
+
+def create_table_sql(table: Table, dialect: str) -> str:
+    types = SQL_TYPES[dialect]
+    columns = []
+    for column in table.columns:
+        definition = f"{column.name} {types[column.type]}"
+        if column.kind == "id":
+            definition += " PRIMARY KEY"
+        elif column.kind.startswith("fk:"):
+            definition += f" NOT NULL REFERENCES {column.kind[3:]}(id)"
+        columns.append(definition)
+    return f"CREATE TABLE {table.name} ({', '.join(columns)})"
 
 
-@dataclass
-class Post(Schema):
-    title: str
-    user_id: int
+def create_index_sql(tables: list[Table]) -> list[str]:
+    statements = ["CREATE UNIQUE INDEX users_email ON users(email)"]
+    for table in tables:
+        for column, _ in table.foreign_keys():
+            statements.append(
+                f"CREATE INDEX {table.name}_{column} ON {table.name}({column})"
+            )
+    return statements
 
 
-fake = Faker()
+# generation, runs in the worker processes
 
 
-def get_adapter(source: str):
-    match source:
-        case "sqlite":
-            return SQLite("./seeder-db.db")
+class Vocabulary:
+    """Word and text pools drawn once, rows only pick from them.
 
+    Calling Faker or joining words per value is far too slow for millions of
+    rows, picking from a few thousand prepared texts keeps the sizes realistic.
+    """
 
-async def seed(session: StorageSession):
-    await asyncio.gather(*(session.init_schema(model) for model in [User, Post]))
+    def __init__(self, seed: int):
+        from faker import Faker
 
-    for i in range(1, 1000):
-        await asyncio.gather(
-            session.create(
-                User(
-                    name=fake.name(),
-                    location=[float(fake.latitude()), float(fake.longitude())],
-                )
-            ),
-            session.create(Post(title=fake.sentence(), user_id=random.randint(1, i))),
+        fake = Faker()
+        fake.seed_instance(seed)
+        rng = random.Random(seed)
+        self.first_names = [fake.first_name() for _ in range(500)]
+        self.last_names = [fake.last_name() for _ in range(500)]
+        self.words = [fake.word() for _ in range(1000)]
+        self.sentences = [self._text(rng, 4, 10) for _ in range(5000)]
+        self.paragraphs = [self._text(rng, 30, 80) for _ in range(1000)]
+
+    def _text(self, rng: random.Random, low: int, high: int) -> str:
+        return (
+            " ".join(rng.choices(self.words, k=rng.randint(low, high))).capitalize()
+            + "."
         )
 
 
-async def run(db):
-    storage = get_adapter(db)
-    async with storage.begin() as session:
-        await seed(session)
+def _below(rng: random.Random, n: int) -> int:
+    # randrange is several times slower and exact uniformity does not matter here
+    return int(rng.random() * n)
+
+
+GENERATORS: dict[str, Callable[[random.Random, Vocabulary], Any]] = {
+    "name": lambda rng, vocab: f"{rng.choice(vocab.first_names)} {rng.choice(vocab.last_names)}",
+    "word": lambda rng, vocab: rng.choice(vocab.words),
+    "sentence": lambda rng, vocab: rng.choice(vocab.sentences),
+    "paragraph": lambda rng, vocab: rng.choice(vocab.paragraphs),
+    "int": lambda rng, vocab: _below(rng, 100_000),
+    "float": lambda rng, vocab: round(rng.random() * 1000, 3),
+    "latitude": lambda rng, vocab: round(rng.random() * 180 - 90, 6),
+    "longitude": lambda rng, vocab: round(rng.random() * 360 - 180, 6),
+}
+
+# set up once per worker by _init_worker
+_worker: dict = {}
+
+
+def _init_worker(options: Options):
+    _worker["options"] = options
+    _worker["tables"] = {table.name: table for table in build_schema(options)}
+    _worker["vocab"] = Vocabulary(options.seed)
+
+
+def _value_factory(column: Column, rows: dict[str, int], options: Options):
+    vocab = _worker["vocab"]
+    if column.kind == "id":
+        return lambda rng, row_id: row_id
+    if column.kind.startswith("fk:"):
+        parents = rows[column.kind[3:]]
+        return lambda rng, row_id: _below(rng, parents) + 1
+    if column.kind == "email":
+        # unique, derived from the id
+        return (
+            lambda rng, row_id: f"{rng.choice(vocab.first_names).lower()}.{row_id}@example.com"
+        )
+    if column.kind == "timestamp":
+        if options.dialect == "postgres":
+            return lambda rng, row_id: EPOCH + datetime.timedelta(
+                seconds=_below(rng, YEAR_SECONDS)
+            )
+        return lambda rng, row_id: (
+            EPOCH + datetime.timedelta(seconds=_below(rng, YEAR_SECONDS))
+        ).isoformat(sep=" ")
+    generate = GENERATORS[column.kind]
+    return lambda rng, row_id: generate(rng, vocab)
+
+
+def generate_chunk(task: tuple[str, int, int]) -> tuple[str, list[tuple]]:
+    """Rows start..stop (1 based, exclusive stop) of a table."""
+    name, start, stop = task
+    options: Options = _worker["options"]
+    tables = _worker["tables"]
+    table = tables[name]
+    rows = {table.name: table.rows for table in tables.values()}
+    values = [_value_factory(column, rows, options) for column in table.columns]
+
+    # seeded per chunk, not per worker, so the output ignores --workers
+    rng = random.Random(f"{options.seed}:{name}:{start}")
+    return name, [
+        tuple(value(rng, row_id) for value in values) for row_id in range(start, stop)
+    ]
+
+
+def chunk_tasks(tables: list[Table], batch_size: int) -> list[tuple[str, int, int]]:
+    return [
+        (table.name, start, min(start + batch_size, table.rows + 1))
+        for table in tables
+        for start in range(1, table.rows + 1, batch_size)
+    ]
+
+
+# loading, runs in the main process
+
+
+class SQLiteLoader:
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+
+    async def connect(self):
+        import sqlite3
+
+        self._conn = sqlite3.connect(self.path, isolation_level=None)
+        # a half written dataset is regenerated anyway
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("PRAGMA journal_mode=MEMORY")
+
+    async def execute(self, sql: str):
+        self._conn.execute(sql)
+
+    async def load(self, table: Table, rows: list[tuple]):
+        placeholders = ", ".join("?" for _ in table.columns)
+        self._conn.execute("BEGIN")
+        self._conn.executemany(
+            f"INSERT INTO {table.name} VALUES ({placeholders})", rows
+        )
+        self._conn.execute("COMMIT")
+
+    async def drop(self, name: str):
+        await self.execute(f"DROP TABLE IF EXISTS {name}")
+
+    async def close(self):
+        self._conn.execute("ANALYZE")
+        self._conn.close()
+
+
+class PostgresLoader:
+    def __init__(self, uri: str):
+        self.uri = uri
+        self._conn = None
+
+    async def connect(self):
+        import asyncpg
+
+        self._conn = await asyncpg.connect(self.uri)
+
+    async def execute(self, sql: str):
+        await self._conn.execute(sql)
+
+    async def load(self, table: Table, rows: list[tuple]):
+        await self._conn.copy_records_to_table(
+            table.name, records=rows, columns=[column.name for column in table.columns]
+        )
+
+    async def drop(self, name: str):
+        await self.execute(f"DROP TABLE IF EXISTS {name} CASCADE")
+
+    async def close(self):
+        await self._conn.execute("ANALYZE")
+        await self._conn.close()
+
+
+class Progress:
+    """Single line readout of rows loaded and throughput."""
+
+    def __init__(self, tables: list[Table]):
+        self.totals = {table.name: table.rows for table in tables}
+        self.done = dict.fromkeys(self.totals, 0)
+        self.start = time.perf_counter()
+        self._printed = 0.0
+
+    @property
+    def rows(self) -> int:
+        return sum(self.done.values())
+
+    def update(self, table: str, rows: int):
+        self.done[table] += rows
+        now = time.perf_counter()
+        if now - self._printed < 0.5 and self.done[table] < self.totals[table]:
+            return
+        self._printed = now
+        elapsed = now - self.start
+        percent = self.rows / sum(self.totals.values()) * 100
+        print(
+            f"\r{table:<10} {self.done[table]:>12,}/{self.totals[table]:<12,} "
+            f"total {percent:5.1f}%  {self.rows / elapsed:>10,.0f} rows/s",
+            end="",
+            file=sys.stderr,
+            flush=True,
+        )
+        if self.done[table] == self.totals[table]:
+            print(file=sys.stderr)
+
+
+def iter_chunks(options: Options, tasks, workers: int):
+    if workers <= 1:
+        _init_worker(options)
+        yield from map(generate_chunk, tasks)
+        return
+    with multiprocessing.Pool(workers, _init_worker, (options,)) as pool:
+        # ordered so parents are complete before their children are loaded,
+        # imap keeps the workers generating ahead while a chunk is loaded
+        yield from pool.imap(generate_chunk, tasks)
+
+
+async def seed(loader, options: Options, workers: int, batch_size: int):
+    tables = build_schema(options)
+    by_name = {table.name: table for table in tables}
+
+    await loader.connect()
+    try:
+        for name in SEEDER_TABLES:
+            await loader.drop(name)
+        for table in tables:
+            await loader.execute(create_table_sql(table, options.dialect))
+
+        progress = Progress(tables)
+        for name, rows in iter_chunks(
+            options, chunk_tasks(tables, batch_size), workers
+        ):
+            await loader.load(by_name[name], rows)
+            progress.update(name, len(rows))
+
+        if options.indexes:
+            print("creating indexes...", file=sys.stderr, flush=True)
+            for statement in create_index_sql(tables):
+                await loader.execute(statement)
+    finally:
+        await loader.close()
+
+    elapsed = time.perf_counter() - progress.start
+    print(
+        f"loaded {progress.rows:,} rows into {len(tables)} tables in {elapsed:.1f}s "
+        f"({progress.rows / elapsed:,.0f} rows/s)",
+        file=sys.stderr,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", choices=["sqlite", "postgres"], required=True)
+    parser.add_argument("--path", default="./seeder-db.db", help="sqlite database file")
+    parser.add_argument(
+        "--uri", default=os.environ.get("SEEDER_DB_URI"), help="postgres dsn"
+    )
+    parser.add_argument("--scale", type=float, default=1.0, help="1 is 1000 users")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--posts-per-user", type=int, default=1)
+    parser.add_argument("--comments-per-post", type=int, default=0)
+    parser.add_argument(
+        "--wide-columns", type=int, default=0, help="extra user columns"
+    )
+    parser.add_argument("--no-indexes", dest="indexes", action="store_false")
+    args = parser.parse_args()
+
+    if args.db == "postgres":
+        if not args.uri:
+            parser.error("--uri (or SEEDER_DB_URI) is required for postgres")
+        loader = PostgresLoader(args.uri)
+    else:
+        loader = SQLiteLoader(args.path)
 
+    options = Options(
+        dialect=args.db,
+        scale=args.scale,
+        seed=args.seed,
+        posts_per_user=args.posts_per_user,
+        comments_per_post=args.comments_per_post,
+        wide_columns=args.wide_columns,
+        indexes=args.indexes,
+    )
+    asyncio.run(seed(loader, options, args.workers, args.batch_size))
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--db", choices=["sqlite", "postgres"], required=True)
-args = parser.parse_args()
 
-asyncio.run(run(args.db))
+if __name__ == "__main__":
+    main()
@@ -299,3 +299,48 @@ class TestPostgresQuery:
         assert "rows" in data
         assert "columns" in data
         assert isinstance(data["rows"], list)
+
+    def test_select_with_bound_parameters(self, client: httpx.Client):
+        """Test $n placeholders are bound and the prepared statement is reused"""
+        connection_uid = self._create_connection(client)
+        url = f"/connection/{connection_uid}/entitities/users/queries"
+        query = "SELECT * FROM users WHERE name = $1 LIMIT $2"
+
+        for name in ("Alice", "Nobody", "Alice"):
+            response = client.get(
+                url,
+                params={"query": query, "params": f'["{name}", "10"]'},
+                headers={"cache-control": "no-cache"},
+            )
+            assert response.status_code == 200
+            assert all(row["name"] == name for row in response.json()["rows"])
+
+    def test_wrong_number_of_parameters_is_rejected(self, client: httpx.Client):
+        """Test a parameter count mismatch returns 400"""
+        connection_uid = self._create_connection(client)
+
+        response = client.get(
+            f"/connection/{connection_uid}/entitities/users/queries",
+            params={"query": "SELECT * FROM users WHERE name = $1", "params": "[]"},
+        )
+
+        assert response.status_code == 400
+
+    def test_boolean_parameters_from_strings(self, client: httpx.Client):
+        """Test "true"/"false" strings are bound to boolean placeholders"""
+        connection_uid = self._create_connection(client)
+        url = f"/connection/{connection_uid}/entitities/users/queries"
+
+        response = client.get(
+            url,
+            params={"query": "SELECT $1::boolean AS flag", "params": '["true"]'},
+        )
+        assert response.status_code == 200
+        assert response.json()["rows"][0]["flag"] is True
+
+        response = client.get(
+            url,
+            params={"query": "SELECT $1::boolean AS flag", "params": '["maybe"]'},
+        )
+        assert response.status_code == 400
+        assert "Invalid query parameters" in response.json()["detail"]
@@ -0,0 +1,103 @@
+"""SQLite adapter response compression and result cache tests"""
+
+import pytest
+import httpx
+
+LARGE_QUERY = (
+    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 2000) "
+    "SELECT i, 'some padding to make the rows compressible' AS padding FROM n"
+)
+
+
+class TestSQLiteCompression:
+    """Content negotiation on query and catalog responses"""
+
+    @property
+    def source(self) -> str:
+        return "sqlite"
+
+    @property
+    def connection_uri(self) -> str:
+        if not hasattr(self, "_connection_uri") or self._connection_uri is None:
+            raise ValueError(
+                "connection_uri not set. Make sure sqlite_connection_uri fixture is used."
+            )
+        return self._connection_uri
+
+    def _create_connection(self, client: httpx.Client) -> str:
+        """Helper method to create a connection and return its UID"""
+        response = client.post(
+            "/connections",
+            json={
+                "source": self.source,
+                "name": f"Test {self.source} Connection",
+                "connection_uri": self.connection_uri,
+            },
+        )
+        assert response.status_code == 200
+        return response.json()["uid"]
+
+    @pytest.fixture(autouse=True)
+    def _setup_connection_uri(self, sqlite_connection_uri):
+        """Set the connection URI for the test instance"""
+        self._connection_uri = sqlite_connection_uri
+        yield
+        # Cleanup
+        if hasattr(self, "_connection_uri"):
+            delattr(self, "_connection_uri")
+
+    def test_large_result_is_compressed(self, client: httpx.Client):
+        """Test a large streamed result is gzip encoded when the client accepts it"""
+        connection_uid = self._create_connection(client)
+
+        response = client.get(
+            f"/connection/{connection_uid}/entitities/users/queries",
+            params={"query": LARGE_QUERY},
+            headers={"accept-encoding": "gzip"},
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert "accept-encoding" in response.headers["vary"].lower()
+        assert len(response.json()["rows"]) == 2000
+
+    def test_small_result_is_not_compressed(self, client: httpx.Client):
+        """Test payloads under the size threshold are sent as is"""
+        connection_uid = self._create_connection(client)
+
+        response = client.get(
+            f"/connection/{connection_uid}/entitities/users/queries",
+            params={"query": "SELECT name FROM users WHERE name = 'Alice'"},
+            headers={"accept-encoding": "gzip"},
+        )
+
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+
+    def test_identity_without_accept_encoding(self, client: httpx.Client):
+        """Test nothing is compressed for clients that accept no encoding"""
+        connection_uid = self._create_connection(client)
+
+        response = client.get(
+            f"/connection/{connection_uid}/entitities/users/queries",
+            params={"query": LARGE_QUERY},
+            headers={"accept-encoding": "identity"},
+        )
+
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert len(response.json()["rows"]) == 2000
+
+    def test_write_invalidates_cached_tables(self, client: httpx.Client):
+        """Test DDL through the query endpoint refreshes the cached table list"""
+        connection_uid = self._create_connection(client)
+
+        before = client.get(f"/connection/{connection_uid}/table").json()
+        client.get(
+            f"/connection/{connection_uid}/entitities/users/queries",
+            params={"query": "CREATE TABLE orders (id INTEGER PRIMARY KEY)"},
+        )
+        after = client.get(f"/connection/{connection_uid}/table").json()
+
+        assert "orders" not in [table["name"] for table in before["tables"]]
+        assert "orders" in [table["name"] for table in after["tables"]]
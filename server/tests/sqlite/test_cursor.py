@@ -0,0 +1,137 @@
+"""SQLite adapter cursor session tests"""
+
+import pytest
+import httpx
+
+
+class TestSQLiteCursor:
+    """Server side cursor sessions over an uploaded SQLite database"""
+
+    @property
+    def source(self) -> str:
+        return "sqlite"
+
+    @property
+    def connection_uri(self) -> str:
+        if not hasattr(self, "_connection_uri") or self._connection_uri is None:
+            raise ValueError(
+                "connection_uri not set. Make sure sqlite_connection_uri fixture is used."
+            )
+        return self._connection_uri
+
+    def _create_connection(self, client: httpx.Client) -> str:
+        """Helper method to create a connection and return its UID"""
+        response = client.post(
+            "/connections",
+            json={
+                "source": self.source,
+                "name": f"Test {self.source} Connection",
+                "connection_uri": self.connection_uri,
+            },
+        )
+        assert response.status_code == 200
+        return response.json()["uid"]
+
+    def _open_cursor(self, client: httpx.Client, connection_uid: str, query: str):
+        return client.post(
+            f"/connection/{connection_uid}/cursors",
+            json={"query": query},
+            headers={"x-client-id": "cursor-tests"},
+        )
+
+    @pytest.fixture(autouse=True)
+    def _setup_connection_uri(self, sqlite_connection_uri):
+        """Set the connection URI for the test instance"""
+        self._connection_uri = sqlite_connection_uri
+        yield
+        # Cleanup
+        if hasattr(self, "_connection_uri"):
+            delattr(self, "_connection_uri")
+
+    def test_open_cursor_returns_columns(self, client: httpx.Client):
+        """Test opening a cursor returns its id and column definitions"""
+        connection_uid = self._create_connection(client)
+
+        response = self._open_cursor(client, connection_uid, "SELECT * FROM users")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["cursor_id"]) > 0
+        assert [col["name"] for col in data["columns"]] == ["id", "name", "email"]
+
+        client.delete(
+            f"/connection/{connection_uid}/cursors/{data['cursor_id']}",
+            headers={"x-client-id": "cursor-tests"},
+        )
+
+    def test_fetch_pages(self, client: httpx.Client):
+        """Test paging forward and back through an open cursor"""
+        connection_uid = self._create_connection(client)
+        cursor_id = self._open_cursor(
+            client, connection_uid, "SELECT * FROM users ORDER BY id"
+        ).json()["cursor_id"]
+        url = f"/connection/{connection_uid}/cursors/{cursor_id}"
+        headers = {"x-client-id": "cursor-tests"}
+
+        first = client.get(url, params={"limit": 1, "offset": 0}, headers=headers)
+        assert first.status_code == 200
+        assert first.json()["rows"][0]["name"] == "Alice"
+        assert first.json()["exhausted"] is False
+
+        second = client.get(url, params={"limit": 1, "offset": 1}, headers=headers)
+        assert second.json()["rows"][0]["name"] == "Bob"
+
+        # going back serves the already fetched page again
+        again = client.get(url, params={"limit": 1, "offset": 0}, headers=headers)
+        assert again.json()["rows"] == first.json()["rows"]
+
+        last = client.get(url, params={"limit": 10, "offset": 1}, headers=headers)
+        assert len(last.json()["rows"]) == 1
+        assert last.json()["exhausted"] is True
+
+        client.delete(url, headers=headers)
+
+    def test_closed_cursor_is_not_found(self, client: httpx.Client):
+        """Test a closed cursor can no longer be fetched"""
+        connection_uid = self._create_connection(client)
+        cursor_id = self._open_cursor(
+            client, connection_uid, "SELECT * FROM users"
+        ).json()["cursor_id"]
+        url = f"/connection/{connection_uid}/cursors/{cursor_id}"
+        headers = {"x-client-id": "cursor-tests"}
+
+        assert client.delete(url, headers=headers).status_code == 204
+        assert client.get(url, headers=headers).status_code == 404
+
+    def test_cursor_is_private_to_client(self, client: httpx.Client):
+        """Test a cursor cannot be read with a different client id"""
+        connection_uid = self._create_connection(client)
+        cursor_id = self._open_cursor(
+            client, connection_uid, "SELECT * FROM users"
+        ).json()["cursor_id"]
+        url = f"/connection/{connection_uid}/cursors/{cursor_id}"
+
+        response = client.get(url, headers={"x-client-id": "someone-else"})
+        assert response.status_code == 404
+
+        client.delete(url, headers={"x-client-id": "cursor-tests"})
+
+    def test_cursor_cap_per_client(self, client: httpx.Client):
+        """Test opening more cursors than allowed is rejected"""
+        from api.config import AppConfig
+
+        connection_uid = self._create_connection(client)
+        opened = []
+        for _ in range(AppConfig.MAX_CURSORS_PER_USER):
+            response = self._open_cursor(client, connection_uid, "SELECT * FROM users")
+            assert response.status_code == 200
+            opened.append(response.json()["cursor_id"])
+
+        response = self._open_cursor(client, connection_uid, "SELECT * FROM users")
+        assert response.status_code == 429
+
+        for cursor_id in opened:
+            client.delete(
+                f"/connection/{connection_uid}/cursors/{cursor_id}",
+                headers={"x-client-id": "cursor-tests"},
+            )
@@ -0,0 +1,72 @@
+"""SQLite adapter index advisor tests"""
+
+import pytest
+import httpx
+
+
+class TestSQLiteIndexes:
+    """Index suggestions from the queries run against an uploaded SQLite database"""
+
+    @property
+    def source(self) -> str:
+        return "sqlite"
+
+    @property
+    def connection_uri(self) -> str:
+        if not hasattr(self, "_connection_uri") or self._connection_uri is None:
+            raise ValueError(
+                "connection_uri not set. Make sure sqlite_connection_uri fixture is used."
+            )
+        return self._connection_uri
+
+    def _create_connection(self, client: httpx.Client) -> str:
+        """Helper method to create a connection and return its UID"""
+        response = client.post(
+            "/connections",
+            json={
+                "source": self.source,
+                "name": f"Test {self.source} Connection",
+                "connection_uri": self.connection_uri,
+            },
+        )
+        assert response.status_code == 200
+        return response.json()["uid"]
+
+    @pytest.fixture(autouse=True)
+    def _setup_connection_uri(self, sqlite_connection_uri):
+        """Set the connection URI for the test instance"""
+        self._connection_uri = sqlite_connection_uri
+        yield
+        # Cleanup
+        if hasattr(self, "_connection_uri"):
+            delattr(self, "_connection_uri")
+
+    def test_repeated_filter_gets_an_index_suggestion(self, client: httpx.Client):
+        """A filter run more than once on an unindexed column is suggested"""
+        connection_uid = self._create_connection(client)
+        for _ in range(2):
+            response = client.get(
+                f"/connection/{connection_uid}/entitities/users/queries",
+                params={
+                    "query": "SELECT * FROM users WHERE email = ?",
+                    "params": '["bob@example.com"]',
+                },
+            )
+            assert response.status_code == 200
+
+        response = client.get(f"/connections/{connection_uid}/indexes/advice")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["analyzed"] == 1
+        assert [c["columns"] for c in data["candidates"]] == [["email"]]
+        assert data["candidates"][0]["statement"] == (
+            'CREATE INDEX IF NOT EXISTS "idx_users_email" ON "users" ("email")'
+        )
+
+    def test_unknown_suggestion_is_not_found(self, client: httpx.Client):
+        connection_uid = self._create_connection(client)
+
+        response = client.post(f"/connections/{connection_uid}/indexes/advice/unknown")
+
+        assert response.status_code == 404
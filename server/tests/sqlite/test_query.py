@@ -244,3 +244,83 @@ class TestSQLiteQuery:
         assert after_response.status_code == 200
         data = after_response.json()
         assert len(data["rows"]) == 0, "Record was not deleted"
+
+    def test_select_with_bound_parameters(self, client: httpx.Client):
+        """Test placeholders are bound to the json params"""
+        connection_uid = self._create_connection(client)
+        entity_name = "users"
+        url = f"/connection/{connection_uid}/entitities/{entity_name}/queries"
+        query = f"SELECT * FROM {entity_name} WHERE name = ?"
+
+        alice = client.get(url, params={"query": query, "params": '["Alice"]'})
+        nobody = client.get(url, params={"query": query, "params": '["Nobody"]'})
+
+        assert alice.status_code == 200
+        assert nobody.status_code == 200
+        assert alice.json()["params"] == ["Alice"]
+        assert all(row["name"] == "Alice" for row in alice.json()["rows"])
+        assert len(alice.json()["rows"]) > 0
+        assert nobody.json()["rows"] == []
+
+    def test_invalid_parameters_are_rejected(self, client: httpx.Client):
+        """Test malformed params and a wrong number of bindings return 400"""
+        connection_uid = self._create_connection(client)
+        url = f"/connection/{connection_uid}/entitities/users/queries"
+        query = "SELECT * FROM users WHERE name = ?"
+
+        not_json = client.get(url, params={"query": query, "params": "Alice"})
+        not_array = client.get(
+            url, params={"query": query, "params": '{"name": "Alice"}'}
+        )
+        missing = client.get(url, params={"query": query, "params": "[]"})
+
+        assert not_json.status_code == 400
+        assert not_array.status_code == 400
+        assert missing.status_code == 400
+
+    def test_multiple_statements_write_atomically(self, client: httpx.Client):
+        """Test a failing statement rolls back the ones before it"""
+        connection_uid = self._create_connection(client)
+        url = f"/connection/{connection_uid}/entitities/users/queries"
+        count = "SELECT COUNT(*) AS total FROM users"
+        before = client.get(url, params={"query": count}).json()["rows"][0]["total"]
+
+        failed = client.get(
+            url,
+            params={
+                "query": "INSERT INTO users (name, email) VALUES ('Batch', 'batch@example.com'); "
+                "INSERT INTO missing_table VALUES (1)"
+            },
+        )
+        written = client.get(
+            url,
+            params={
+                "query": "INSERT INTO users (name, email) VALUES ('Batch', 'batch@example.com'); "
+                f"{count}"
+            },
+        )
+
+        assert failed.status_code != 200
+        assert written.status_code == 200
+        assert written.json()["rows"][0]["total"] == before + 1
+
+    def test_limit_is_pushed_down_and_truncation_reported(self, client: httpx.Client):
+        """Test limit/offset page the statement and rows left out are counted"""
+        connection_uid = self._create_connection(client)
+        url = f"/connection/{connection_uid}/entitities/users/queries"
+        total = client.get(
+            url, params={"query": "SELECT COUNT(*) AS total FROM users"}
+        ).json()["rows"][0]["total"]
+        query = "SELECT * FROM users\nWHERE id IN (SELECT id FROM users LIMIT 1000)\nORDER BY id"
+
+        first = client.get(url, params={"query": query, "limit": 1, "offset": 0})
+        second = client.get(url, params={"query": query, "limit": 1, "offset": 1})
+        everything = client.get(url, params={"query": query, "limit": -1})
+
+        assert first.status_code == 200
+        assert len(first.json()["rows"]) == 1
+        assert first.json()["truncated"] is (total > 1)
+        assert first.json()["total_rows"] == total
+        assert second.json()["rows"][0]["id"] > first.json()["rows"][0]["id"]
+        assert everything.json()["truncated"] is False
+        assert len(everything.json()["rows"]) == total
@@ -0,0 +1,123 @@
+import asyncio
+import sqlite3
+from contextlib import closing
+import pytest
+from api.services.advisor import IndexAdvisor, shape
+from api.services.querystats import query_stats
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "advisor.db"
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT, age INT, city TEXT)"
+        )
+        conn.executemany(
+            "INSERT INTO users VALUES (?, ?, ?, ?)",
+            [(i, f"user{i}@example.com", i % 80, f"city{i % 50}") for i in range(5000)],
+        )
+        conn.commit()
+    return str(path)
+
+
+def run(connection_id: str, query: str, params=None, calls: int = 3):
+    for _ in range(calls):
+        query_stats.record(connection_id, query, 10, 1, params)
+
+
+class StatementShapeTests:
+    """Tests for finding the columns an index could serve"""
+
+    def test_filters_and_ordering(self):
+        statement = shape(
+            "SELECT * FROM users WHERE email = ? AND age > 20 ORDER BY city DESC"
+        )
+
+        assert statement.tables == {"users": "users"}
+        assert statement.equality == [(None, "email")]
+        assert statement.ranges == [(None, "age")]
+        assert statement.ordering == [(None, "city")]
+
+    def test_aliases_and_joins(self):
+        statement = shape(
+            "select * from posts p join main.users as u on u.id = p.user_id where lower(u.email) = 'x'"
+        )
+
+        assert statement.tables["p"] == "posts"
+        assert statement.tables["u"] == "main.users"
+        assert statement.joins == [("u", "id"), ("p", "user_id")]
+        assert statement.equality == []
+
+    def test_update_assignments_are_not_filters(self):
+        statement = shape("UPDATE users SET age = 1 WHERE city IN ('a', 'b')")
+
+        assert statement.equality == [(None, "city")]
+
+
+class IndexAdvisorTests:
+    """Tests for suggesting and applying indexes on sqlite"""
+
+    async def test_repeated_scans_get_measured_suggestions(self, database):
+        run("advisor-1", "SELECT * FROM users WHERE email = ?", ["user7@example.com"])
+        run("advisor-1", "SELECT * FROM users WHERE city = 'city3' ORDER BY age")
+        run("advisor-1", "SELECT * FROM users WHERE id = 3")
+        run("advisor-1", "SELECT * FROM users WHERE age = 3", calls=1)
+        advisor = IndexAdvisor()
+
+        advice = await advisor.advise("advisor-1", "sqlite", database)
+
+        assert advice.method == "scratch copy"
+        assert advice.analyzed == 3
+        assert {tuple(c.columns) for c in advice.candidates} == {
+            ("email",),
+            ("city", "age"),
+        }
+        assert all(c.improvement > 0.5 for c in advice.candidates)
+        with closing(sqlite3.connect(database)) as conn:
+            assert not conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            ).fetchall()
+
+    async def test_applied_suggestion_creates_the_index(self, database):
+        run("advisor-2", "SELECT * FROM users WHERE email = ?", ["user7@example.com"])
+        advisor = IndexAdvisor()
+        advice = await advisor.advise("advisor-2", "sqlite", database)
+
+        job = advisor.apply("advisor-2", "sqlite", database, advice.candidates[0])
+        while job.status in ("pending", "running"):
+            await asyncio.sleep(0.01)
+
+        assert job.status == "done"
+        assert advisor.candidate("advisor-2", advice.candidates[0].id) is None
+        with closing(sqlite3.connect(database)) as conn:
+            plan = conn.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM users WHERE email = 'x'"
+            ).fetchall()
+        assert "idx_users_email" in plan[0][3]
+
+    async def test_same_index_on_two_connections_gets_two_jobs(
+        self, database, tmp_path
+    ):
+        other = tmp_path / "other.db"
+        with closing(sqlite3.connect(database)) as source, closing(
+            sqlite3.connect(other)
+        ) as copy:
+            source.backup(copy)
+        run("advisor-3", "SELECT * FROM users WHERE email = ?", ["user7@example.com"])
+        run("advisor-4", "SELECT * FROM users WHERE email = ?", ["user7@example.com"])
+        advisor = IndexAdvisor()
+        first = (await advisor.advise("advisor-3", "sqlite", database)).candidates[0]
+        second = (await advisor.advise("advisor-4", "sqlite", str(other))).candidates[0]
+        assert first.id == second.id
+
+        jobs = [
+            advisor.apply("advisor-3", "sqlite", database, first),
+            advisor.apply("advisor-4", "sqlite", str(other), second),
+        ]
+        while any(job.status in ("pending", "running") for job in jobs):
+            await asyncio.sleep(0.01)
+
+        assert jobs[0] is not jobs[1]
+        assert [job.connection_id for job in jobs] == ["advisor-3", "advisor-4"]
+        assert all(job.status == "done" for job in jobs)
@@ -0,0 +1,123 @@
+import time
+import pytest
+from api.config import AppConfig
+from api.services.breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitOpen,
+    breakers,
+    is_unreachable,
+)
+from api.services.pools import PoolManager
+
+
+@pytest.fixture
+def down(monkeypatch):
+    """Pools of the server cannot connect while `down["value"]` is set."""
+    monkeypatch.setattr(AppConfig, "BREAKER_FAILURES", 3)
+    monkeypatch.setattr(AppConfig, "BREAKER_BACKOFF", 10)
+    monkeypatch.setattr(AppConfig, "BREAKER_MAX_BACKOFF", 30)
+    state = {"value": True, "attempts": 0}
+    get = PoolManager.get
+
+    async def flaky_get(self, connection_id, source, uri, read_only=False):
+        state["attempts"] += 1
+        if state["value"]:
+            raise ConnectionRefusedError("connection refused")
+        return await get(self, connection_id, source, uri, read_only)
+
+    monkeypatch.setattr(PoolManager, "get", flaky_get)
+    return state
+
+
+async def use(manager: PoolManager, connection_id: str, uri: str):
+    async with manager.acquire(connection_id, "sqlite", uri) as conn:
+        conn.execute("SELECT 1")
+
+
+def expire(breaker):
+    breaker.retry_at = time.monotonic() - 1
+
+
+class CircuitBreakerTests:
+    """Tests for failing fast on servers that cannot be reached"""
+
+    async def test_opens_after_consecutive_failures(self, down, tmp_path):
+        manager, uri = PoolManager(), str(tmp_path / "a.db")
+        for _ in range(3):
+            with pytest.raises(ConnectionRefusedError):
+                await use(manager, "breaker-1", uri)
+
+        with pytest.raises(CircuitOpen) as error:
+            await use(manager, "breaker-1", uri)
+
+        breaker = breakers.get("breaker-1", uri)
+        assert breaker.state == OPEN
+        assert down["attempts"] == 3
+        assert breaker.rejected == 1
+        assert "connection refused" in str(error.value)
+        assert 9 < error.value.retry_after <= 10
+
+    async def test_failed_probe_doubles_the_backoff(self, down, tmp_path):
+        manager, uri = PoolManager(), str(tmp_path / "b.db")
+        for _ in range(3):
+            with pytest.raises(ConnectionRefusedError):
+                await use(manager, "breaker-2", uri)
+        breaker = breakers.get("breaker-2", uri)
+        expire(breaker)
+
+        with pytest.raises(ConnectionRefusedError):
+            await use(manager, "breaker-2", uri)
+
+        assert breaker.state == OPEN
+        assert breaker.backoff == 20
+        assert down["attempts"] == 4
+
+    async def test_successful_probe_closes(self, down, tmp_path):
+        manager, uri = PoolManager(), str(tmp_path / "c.db")
+        for _ in range(3):
+            with pytest.raises(ConnectionRefusedError):
+                await use(manager, "breaker-3", uri)
+        breaker = breakers.get("breaker-3", uri)
+        expire(breaker)
+        down["value"] = False
+
+        breaker.allow()
+        assert breaker.state == HALF_OPEN
+        # one probe at a time, the others keep failing fast
+        with pytest.raises(CircuitOpen):
+            await use(manager, "breaker-3", uri)
+        breaker.settle()
+        await use(manager, "breaker-3", uri)
+
+        assert breaker.state == CLOSED
+        assert breaker.failures == 0
+        await manager.close_all()
+
+    async def test_errors_from_the_server_do_not_count(self, down, tmp_path):
+        manager, uri = PoolManager(), str(tmp_path / "d.db")
+        down["value"] = False
+        for _ in range(5):
+            with pytest.raises(Exception):
+                async with manager.acquire("breaker-4", "sqlite", uri) as conn:
+                    conn.execute("SELECT * FROM missing")
+
+        assert breakers.get("breaker-4", uri).state == CLOSED
+        await manager.close_all()
+
+    async def test_bad_parameters_do_not_count(self, down, tmp_path):
+        asyncpg = pytest.importorskip("asyncpg")
+        manager, uri = PoolManager(), str(tmp_path / "e.db")
+        down["value"] = False
+        for _ in range(5):
+            # what asyncpg raises for "true" bound to a boolean placeholder
+            with pytest.raises(asyncpg.exceptions._base.DataError):
+                async with manager.acquire("breaker-5", "sqlite", uri):
+                    raise asyncpg.exceptions._base.DataError(
+                        "invalid input for query argument $1"
+                    )
+
+        assert breakers.get("breaker-5", uri).state == CLOSED
+        assert is_unreachable(asyncpg.exceptions.ConnectionDoesNotExistError("lost"))
+        await manager.close_all()
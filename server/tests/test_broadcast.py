@@ -0,0 +1,100 @@
+import asyncio
+import asyncpg
+import pytest
+from api.config import AppConfig
+from api.services.broadcast import PostgresNotifyTransport
+
+
+class FakeConnection:
+    """Just enough of an asyncpg connection to listen and notify."""
+
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+        self.termination_listeners = []
+
+    async def add_listener(self, channel, callback):
+        self.server["listeners"].append(callback)
+
+    def add_termination_listener(self, callback):
+        self.termination_listeners.append(callback)
+
+    async def execute(self, query, channel, payload):
+        if self.closed:
+            raise asyncpg.exceptions.ConnectionDoesNotExistError(
+                "connection was closed"
+            )
+        self.server["sent"].append(payload)
+
+    def is_closed(self):
+        return self.closed
+
+    def terminate(self):
+        self.closed = True
+        for callback in self.termination_listeners:
+            callback(self)
+
+    async def close(self):
+        self.terminate()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Connects fail while `server["down"]` is set."""
+    monkeypatch.setattr(AppConfig, "BREAKER_BACKOFF", 0.01)
+    monkeypatch.setattr(AppConfig, "BREAKER_MAX_BACKOFF", 0.02)
+    state = {
+        "down": False,
+        "attempts": 0,
+        "listeners": [],
+        "sent": [],
+        "connections": [],
+    }
+
+    async def connect(uri):
+        state["attempts"] += 1
+        if state["down"]:
+            raise ConnectionRefusedError("connection refused")
+        conn = FakeConnection(state)
+        state["connections"].append(conn)
+        return conn
+
+    monkeypatch.setattr(asyncpg, "connect", connect)
+    return state
+
+
+async def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+class BroadcastTests:
+    """Tests for keeping postgres broadcasts going over lost connections"""
+
+    async def test_reconnects_and_reports_missed_messages(self, server):
+        missed = []
+        transport = PostgresNotifyTransport("postgresql://config")
+        await transport.start(lambda data: None, lambda: missed.append(True))
+        try:
+            server["down"] = True
+            server["connections"][0].terminate()
+            transport.publish(b'{"type": "data_changed"}')
+            await wait_for(lambda: server["attempts"] >= 3)
+            assert not missed and not server["sent"]
+            server["down"] = False
+            await wait_for(lambda: server["sent"])
+            assert missed == [True]
+            assert server["sent"] == ['{"type": "data_changed"}']
+            assert len(server["listeners"]) == 2
+        finally:
+            await transport.stop()
+
+    async def test_stop_does_not_reconnect(self, server):
+        transport = PostgresNotifyTransport("postgresql://config")
+        await transport.start(lambda data: None, lambda: None)
+        await transport.stop()
+        await asyncio.sleep(0.05)
+        assert server["attempts"] == 1
@@ -110,3 +110,75 @@ class BucketTests:
         assert response.status_code == 200
         data = response.json()
         assert "uid" in data
+
+    def test_upload_gzip_compressed_file(self, client: httpx.Client):
+        """Test that a compressed upload is stored decompressed"""
+        import gzip
+        from api.routes import UPLOAD_DIR
+
+        file_content = b"Compressed content " * 10000
+
+        response = client.post(
+            "/bucket",
+            files={
+                "file": (
+                    "archive.txt.gz",
+                    io.BytesIO(gzip.compress(file_content)),
+                    "application/gzip",
+                )
+            },
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["filename"] == "archive.txt.gz"
+        with open(UPLOAD_DIR / f"{data['uid']}.txt", "rb") as f:
+            assert f.read() == file_content
+
+    def test_upload_truncated_compressed_file(self, client: httpx.Client):
+        """Test that a truncated compressed upload is rejected"""
+        import gzip
+
+        data = gzip.compress(b"Content " * 10000)
+
+        response = client.post(
+            "/bucket",
+            files={"file": ("file.txt.gz", io.BytesIO(data[:-20]), "application/gzip")},
+        )
+
+        assert response.status_code == 400
+
+    def test_download_file(self, client: httpx.Client):
+        """Test downloading an uploaded file, whole and from an offset"""
+        file_content = b"Downloadable content " * 1000
+        response = client.post(
+            "/bucket",
+            files={"file": ("download.txt", io.BytesIO(file_content), "text/plain")},
+        )
+        uid = response.json()["uid"]
+
+        response = client.get(f"/bucket/{uid}")
+        assert response.status_code == 200
+        assert response.content == file_content
+        assert "download.txt" in response.headers["content-disposition"]
+        etag = response.headers["etag"]
+
+        # a download resumed where it stopped
+        response = client.get(
+            f"/bucket/{uid}", headers={"Range": "bytes=1000-", "If-Range": etag}
+        )
+        assert response.status_code == 206
+        assert response.content == file_content[1000:]
+        assert (
+            response.headers["content-range"]
+            == f"bytes 1000-{len(file_content) - 1}/{len(file_content)}"
+        )
+
+        response = client.get(f"/bucket/{uid}", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    def test_download_missing_file(self, client: httpx.Client):
+        """Test downloading a file that was never uploaded"""
+        response = client.get("/bucket/missing")
+
+        assert response.status_code == 404
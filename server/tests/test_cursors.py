@@ -0,0 +1,97 @@
+import sqlite3
+from contextlib import closing
+import pytest
+from api.config import AppConfig
+from api.services.cursors import CursorLimitExceeded, CursorRegistry, CursorSession
+from api.services.pools import pools
+
+
+def database(path, journal_mode: str) -> str:
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        conn.execute("CREATE TABLE t (i INTEGER)")
+        conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(100)])
+        conn.commit()
+    return str(path)
+
+
+def write(path: str):
+    # fails at once with "database is locked" while a reader holds the file
+    with closing(sqlite3.connect(path, timeout=0)) as conn:
+        conn.execute("INSERT INTO t VALUES (-1)")
+        conn.commit()
+
+
+class CursorTests:
+    """Tests for paging through sqlite results with cursor sessions"""
+
+    def test_sessions_are_abstract(self):
+        with pytest.raises(TypeError):
+            CursorSession("c", "owner", "SELECT 1", None, None)
+
+    @pytest.mark.parametrize("journal_mode", ["delete", "wal"])
+    async def test_open_cursor_does_not_block_writers(self, tmp_path, journal_mode):
+        path = database(tmp_path / f"{journal_mode}.db", journal_mode)
+        registry = CursorRegistry()
+        session = await registry.open(
+            "cursors-1", "sqlite", path, "owner", "SELECT i FROM t"
+        )
+        _, rows, exhausted = await registry.fetch(
+            "cursors-1", session.cursor_id, "owner", 0, 10
+        )
+
+        write(path)
+
+        assert [row["i"] for row in rows] == list(range(10))
+        assert not exhausted
+        _, rows, exhausted = await registry.fetch(
+            "cursors-1", session.cursor_id, "owner", 0, 10
+        )
+        assert [row["i"] for row in rows] == list(range(10))
+        await registry.close_all()
+
+    @pytest.mark.parametrize("journal_mode", ["delete", "wal"])
+    async def test_pages_stop_at_max_result_rows(
+        self, tmp_path, monkeypatch, journal_mode
+    ):
+        monkeypatch.setattr(AppConfig, "MAX_RESULT_ROWS", 50)
+        path = database(tmp_path / f"{journal_mode}.db", journal_mode)
+        registry = CursorRegistry()
+        session = await registry.open(
+            "cursors-2", "sqlite", path, "owner", "SELECT i FROM t"
+        )
+
+        _, rows, exhausted = await registry.fetch(
+            "cursors-2", session.cursor_id, "owner", 40, 20
+        )
+
+        assert [row["i"] for row in rows] == list(range(40, 50))
+        assert not exhausted
+        with pytest.raises(ValueError):
+            await registry.fetch("cursors-2", session.cursor_id, "owner", 50, 20)
+        await registry.close_all()
+
+    async def test_only_reads_can_be_opened(self, tmp_path):
+        path = database(tmp_path / "reads.db", "wal")
+        registry = CursorRegistry()
+
+        with pytest.raises(ValueError):
+            await registry.open("cursors-3", "sqlite", path, "owner", "DELETE FROM t")
+
+        with closing(sqlite3.connect(path)) as conn:
+            assert conn.execute("SELECT count(*) FROM t").fetchone()[0] == 100
+
+    async def test_cursors_leave_pool_connections_to_queries(
+        self, tmp_path, monkeypatch
+    ):
+        monkeypatch.setattr(AppConfig, "POOL_MAX_SIZE", 3)
+        monkeypatch.setattr(AppConfig, "MAX_CURSORS", 10)
+        path = database(tmp_path / "cap.db", "wal")
+        registry = CursorRegistry()
+        for owner in ("a", "b"):
+            await registry.open("cursors-4", "sqlite", path, owner, "SELECT i FROM t")
+
+        with pytest.raises(CursorLimitExceeded):
+            await registry.open("cursors-4", "sqlite", path, "c", "SELECT i FROM t")
+        await registry.close_all()
+        await pools.discard("cursors-4")
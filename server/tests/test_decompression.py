@@ -0,0 +1,83 @@
+import gzip
+import random
+import pytest
+from api.services.compression import (
+    OUTPUT_CHUNK,
+    DecompressionLimitExceeded,
+    StreamDecompressor,
+    sniff,
+)
+
+PAYLOAD = b"SQLite format 3\x00" + random.Random(0).randbytes(256 * 1024) * 4
+
+
+def decompress(encoding: str, data: bytes, chunk: int = 4096, **limits) -> bytes:
+    out = bytearray()
+    decompressor = StreamDecompressor(
+        encoding,
+        out.extend,
+        limits.get("max_size", 1 << 30),
+        limits.get("max_ratio", 1000),
+    )
+    for start in range(0, len(data), chunk):
+        decompressor.decompress(data[start : start + chunk])
+    decompressor.finish()
+    return bytes(out)
+
+
+class StreamDecompressorTests:
+    """Tests for decompressing uploads while they stream in"""
+
+    def test_gzip_round_trip(self):
+        assert decompress("gzip", gzip.compress(PAYLOAD)) == PAYLOAD
+
+    def test_concatenated_gzip_members(self):
+        data = gzip.compress(PAYLOAD[:1000]) + gzip.compress(PAYLOAD[1000:])
+
+        assert decompress("gzip", data) == PAYLOAD
+
+    def test_zstd_round_trip(self):
+        zstandard = pytest.importorskip("zstandard")
+
+        data = zstandard.ZstdCompressor().compress(PAYLOAD)
+
+        assert decompress("zstd", data) == PAYLOAD
+
+    @pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+    def test_truncated_upload_is_rejected(self, encoding):
+        if encoding == "zstd":
+            data = pytest.importorskip("zstandard").ZstdCompressor().compress(PAYLOAD)
+        else:
+            data = gzip.compress(PAYLOAD)
+
+        with pytest.raises(ValueError):
+            decompress(encoding, data[: len(data) // 2])
+
+    def test_corrupt_upload_is_rejected(self):
+        with pytest.raises(Exception):
+            decompress("gzip", b"\x1f\x8b" + b"\x00" * 64)
+
+    def test_output_is_written_in_bounded_pieces(self):
+        pieces = []
+        decompressor = StreamDecompressor("gzip", pieces.append, 1 << 30, 1 << 20)
+
+        decompressor.decompress(gzip.compress(bytes(8 * OUTPUT_CHUNK)))
+        decompressor.finish()
+
+        assert max(map(len, pieces)) <= OUTPUT_CHUNK
+        assert decompressor.written == 8 * OUTPUT_CHUNK
+
+    def test_expansion_ratio_is_limited(self):
+        bomb = gzip.compress(bytes(64 * OUTPUT_CHUNK))
+
+        with pytest.raises(DecompressionLimitExceeded):
+            decompress("gzip", bomb, max_ratio=100)
+
+    def test_size_is_limited(self):
+        with pytest.raises(DecompressionLimitExceeded):
+            decompress("gzip", gzip.compress(PAYLOAD), max_size=len(PAYLOAD) - 1)
+
+    def test_sniff(self):
+        assert sniff(gzip.compress(b"x")) == "gzip"
+        assert sniff(b"\x28\xb5\x2f\xfd...") == "zstd"
+        assert sniff(PAYLOAD) is None
@@ -0,0 +1,38 @@
+import asyncio
+import sqlite3
+from contextlib import closing
+from api.services.executor import run_query
+from api.services.pools import pools
+from api.services.sql import classify
+
+# counts far enough to run for minutes unless interrupted
+ENDLESS = (
+    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+    "SELECT count(*) FROM n WHERE i < 0"
+)
+
+
+class ExecutorTests:
+    """Tests for running statements on pooled connections"""
+
+    async def test_cancelled_sqlite_query_releases_an_idle_connection(self, tmp_path):
+        path = str(tmp_path / "cancel.db")
+        with closing(sqlite3.connect(path)) as conn:
+            conn.execute("CREATE TABLE t (a)")
+        task = asyncio.create_task(
+            run_query("executor-1", "sqlite", path, classify(ENDLESS))
+        )
+        await asyncio.sleep(0.2)
+
+        task.cancel()
+        await asyncio.wait_for(asyncio.gather(task, return_exceptions=True), 5)
+
+        pool = await pools.get("executor-1", "sqlite", path, True)
+        assert pool.get_idle_size() == pool.get_size() == 1
+        # the connection is reused and nothing is left running on it
+        _, rows = await asyncio.wait_for(
+            run_query("executor-1", "sqlite", path, classify("SELECT count(*) FROM t")),
+            5,
+        )
+        assert list(rows) == [(0,)]
+        await pools.discard("executor-1")
@@ -0,0 +1,103 @@
+import sqlite3
+from contextlib import closing
+import pytest
+from api.services.federation import (
+    FederatedSource,
+    Federation,
+    FederationError,
+    find_remote_tables,
+    push_down,
+    rewrite,
+)
+
+
+def described(query: str, **columns) -> dict:
+    tables, _ = find_remote_tables(query, {"pg"})
+    for table in tables.values():
+        table.columns = columns
+    return tables
+
+
+class FederationTests:
+    """Tests for planning and running federated queries"""
+
+    def test_remote_tables_are_rewritten(self):
+        query = "SELECT * FROM pg.users u JOIN local.orders o ON o.user_id = u.id"
+        tables, spans = find_remote_tables(query, {"pg"})
+
+        assert [key for key in tables] == [("pg", "users")]
+        assert rewrite(query, tables, spans) == (
+            'SELECT * FROM "_remote0"."users" u JOIN local.orders o ON o.user_id = u.id'
+        )
+
+    def test_column_references_are_not_tables(self):
+        query = "SELECT pg.users.id FROM pg.users"
+        tables, spans = find_remote_tables(query, {"pg"})
+
+        assert tables[("pg", "users")].references == 1
+        assert (
+            rewrite(query, tables, spans)
+            == 'SELECT "_remote0"."users".id FROM "_remote0"."users"'
+        )
+
+    def test_literal_comparisons_are_pushed_down(self):
+        query = (
+            "SELECT * FROM pg.users u JOIN local.orders o ON o.user_id = u.id "
+            "WHERE u.age >= 18 AND u.country IN ('de', 'fr') AND o.total > 10 AND 5 < u.id"
+        )
+        tables = described(query, id="integer", age="integer", country="text")
+
+        push_down(query, tables)
+
+        assert tables[("pg", "users")].predicates == [
+            '"age" >= 18',
+            "\"country\" IN ('de', 'fr')",
+            '"id" > 5',
+        ]
+
+    def test_mismatched_or_disjunctive_terms_are_not_pushed_down(self):
+        query = "SELECT * FROM pg.users WHERE age = 'x' OR users.country = 'de'"
+        tables = described(query, age="integer", country="text")
+
+        push_down(query, tables)
+
+        assert tables[("pg", "users")].predicates == []
+
+    def test_tables_used_in_subqueries_are_not_filtered(self):
+        query = "SELECT * FROM local.t WHERE id IN (SELECT id FROM pg.users) AND id = 1"
+        tables = described(query, id="integer")
+
+        push_down(query, tables)
+
+        assert tables[("pg", "users")].predicates == []
+
+    async def test_sqlite_connections_are_joined(self, tmp_path):
+        for name, rows in (
+            ("a", [(1, "x"), (2, "y")]),
+            ("b", [(1, 10), (1, 20), (3, 30)]),
+        ):
+            with closing(sqlite3.connect(tmp_path / f"{name}.db")) as conn:
+                conn.execute("CREATE TABLE t (id INTEGER, v)")
+                conn.executemany("INSERT INTO t VALUES (?, ?)", rows)
+                conn.commit()
+        sources = [
+            FederatedSource(alias, alias, "sqlite", str(tmp_path / f"{alias}.db"))
+            for alias in "ab"
+        ]
+
+        columns, rows, pulls = await Federation().run(
+            sources,
+            "SELECT a.t.v, sum(b.t.v) FROM a.t JOIN b.t USING (id) GROUP BY 1",
+            10,
+        )
+
+        assert len(columns) == 2
+        assert [tuple(row) for row in rows] == [("x", 30)]
+        assert pulls == []
+
+    async def test_writes_are_rejected(self, tmp_path):
+        sqlite3.connect(tmp_path / "a.db").close()
+        sources = [FederatedSource("a", "a", "sqlite", str(tmp_path / "a.db"))]
+
+        with pytest.raises(FederationError):
+            await Federation().run(sources, "DELETE FROM a.t", 10)
@@ -0,0 +1,70 @@
+import gc
+import json
+import pytest
+from api.config import AppConfig
+from api.services.memory import MemoryBudgetExceeded, RowBuffer, memory
+from api.services.serialization import encode_query_result
+
+COLUMNS = [{"name": "id", "type": None}, {"name": "body", "type": None}]
+
+
+def batches(count: int, size: int = 100):
+    for start in range(0, count, size):
+        yield [(i, "x" * 500) for i in range(start, min(start + size, count))]
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    monkeypatch.setattr(AppConfig, "MEMORY_QUERY_BUDGET", 100_000)
+    monkeypatch.setattr(AppConfig, "MEMORY_SPILL", True)
+    return monkeypatch
+
+
+class MemoryBudgetTests:
+    """Tests for accounting result rows and spilling them past the budget"""
+
+    def test_rows_within_budget_are_charged_until_released(self, budget):
+        used = memory.used
+        buffer = RowBuffer(memory.open("c", "SELECT 1"))
+        for batch in batches(50):
+            buffer.extend(batch)
+        rows = buffer.result()
+
+        assert not rows.spilled
+        assert memory.used > used
+
+        del buffer, rows
+        gc.collect()
+        assert memory.used == used
+
+    def test_rows_past_budget_spill_to_disk(self, budget):
+        buffer = RowBuffer(memory.open("c", "SELECT 2"))
+        for batch in batches(1000):
+            buffer.extend(batch)
+        rows = buffer.result()
+        rows.truncate(750)
+
+        data = json.loads(encode_query_result({"query": "SELECT 2"}, COLUMNS, rows))
+
+        assert rows.spilled
+        assert len(rows) == 750
+        assert [row["id"] for row in data["rows"]] == list(range(750))
+        usage = next(
+            q for q in memory.snapshot()["queries"] if q["query"] == "SELECT 2"
+        )
+        assert usage["bytes"] == 0
+        assert usage["spilled_bytes"] > 0
+
+    def test_rows_past_budget_abort_without_spill(self, budget):
+        budget.setattr(AppConfig, "MEMORY_SPILL", False)
+        used = memory.used
+        buffer = RowBuffer(memory.open("c", "SELECT 3"))
+
+        with pytest.raises(MemoryBudgetExceeded):
+            for batch in batches(1000):
+                buffer.extend(batch)
+
+        del buffer
+        gc.collect()
+        assert memory.used == used
+        assert all(q["query"] != "SELECT 3" for q in memory.snapshot()["queries"])
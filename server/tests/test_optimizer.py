@@ -0,0 +1,66 @@
+import sqlite3
+from contextlib import closing
+import pytest
+from api.config import AppConfig
+from api.services.optimizer import OptimizationSkipped, is_sqlite_file, optimize_sqlite
+
+
+@pytest.fixture
+def fragmented(tmp_path):
+    path = tmp_path / "upload.db"
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, body TEXT)")
+        conn.execute("CREATE INDEX t_body ON t (body)")
+        conn.executemany(
+            "INSERT INTO t VALUES (?, ?)", [(i, "x" * 200) for i in range(5000)]
+        )
+        conn.commit()
+        conn.execute("DELETE FROM t WHERE id % 2 = 0")
+        conn.commit()
+    return path
+
+
+class SQLiteOptimizerTests:
+    """Tests for optimizing uploaded sqlite files"""
+
+    def test_file_is_compacted_analyzed_and_switched_to_wal(
+        self, fragmented, monkeypatch
+    ):
+        monkeypatch.setattr(AppConfig, "OPTIMIZE_PAGE_SIZE", 8192)
+
+        report = optimize_sqlite(fragmented)
+
+        assert report["size_after"] < report["size_before"]
+        assert report["page_size_before"] == 4096
+        assert report["page_size_after"] == 8192
+        assert set(report["steps"]) == {
+            "integrity_check",
+            "vacuum",
+            "analyze",
+            "optimize",
+            "swap",
+        }
+        assert not (fragmented.parent / "upload.db.optimizing").exists()
+        with closing(sqlite3.connect(fragmented)) as conn:
+            assert conn.execute("SELECT count(*) FROM t").fetchone()[0] == 2500
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("SELECT count(*) FROM sqlite_stat1").fetchone()[0] > 0
+
+    def test_corrupt_file_is_left_alone(self, fragmented):
+        data = bytearray(fragmented.read_bytes())
+        # scribble over the pages after the schema
+        data[8192:12288] = b"\xff" * 4096
+        fragmented.write_bytes(bytes(data))
+
+        with pytest.raises((OptimizationSkipped, sqlite3.DatabaseError)):
+            optimize_sqlite(fragmented)
+
+        assert fragmented.read_bytes() == bytes(data)
+        assert not (fragmented.parent / "upload.db.optimizing").exists()
+
+    def test_only_sqlite_files_are_recognized(self, fragmented, tmp_path):
+        text = tmp_path / "notes.db"
+        text.write_text("SQLite database content")
+
+        assert is_sqlite_file(fragmented)
+        assert not is_sqlite_file(text)
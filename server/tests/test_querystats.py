@@ -0,0 +1,85 @@
+import pytest
+from api.config import AppConfig
+from api.services.querystats import QueryStatsRegistry
+from api.services.sql import fingerprint
+
+
+@pytest.fixture
+def slow(monkeypatch):
+    monkeypatch.setattr(AppConfig, "SLOW_QUERY_MS", 100)
+    monkeypatch.setattr(AppConfig, "SLOW_QUERY_PLAN_INTERVAL", 300)
+    return monkeypatch
+
+
+class FingerprintTests:
+    """Tests for grouping statements that differ only in their values"""
+
+    def test_literals_and_params_are_replaced(self):
+        assert fingerprint("SELECT * FROM t WHERE a = 1 AND b = 'x'") == fingerprint(
+            "select *  from t\nwhere a = $1 and b = 'it''s'"
+        )
+
+    def test_lists_collapse(self):
+        assert fingerprint("SELECT 1 FROM t WHERE id IN (1, 2, 3)") == fingerprint(
+            "SELECT 1 FROM t WHERE id IN ($1, $2)"
+        )
+
+    def test_structure_is_kept(self):
+        assert fingerprint("SELECT a FROM t") != fingerprint("SELECT b FROM t")
+
+
+class QueryStatsTests:
+    """Tests for aggregating executions per fingerprint"""
+
+    def test_executions_are_aggregated(self, slow):
+        registry = QueryStatsRegistry()
+        for i in range(1, 21):
+            stats = registry.record("c", f"SELECT * FROM t WHERE id = {i}", i * 10, 1)
+
+        assert stats.calls == 20
+        assert stats.rows == 20
+        assert stats.total_ms == 2100
+        assert stats.mean_ms == 105
+        assert stats.max_ms == 200
+        assert 180 <= stats.p95_ms <= 200
+        assert stats.slow_calls == 11
+        assert stats.query == "SELECT * FROM t WHERE id = 20"
+
+    def test_top_orders_and_filters(self, slow):
+        registry = QueryStatsRegistry()
+        registry.record("c", "SELECT 1", 50, 1)
+        for _ in range(3):
+            registry.record("c", "SELECT * FROM t", 20, 10)
+        registry.record("d", "SELECT * FROM u", 500, 1)
+
+        assert [s.query for s in registry.top("c")] == ["SELECT * FROM t", "SELECT 1"]
+        assert [s.query for s in registry.top("c", "mean")] == [
+            "SELECT 1",
+            "SELECT * FROM t",
+        ]
+        assert registry.top(order_by="p95", limit=1)[0].connection_id == "d"
+
+    def test_least_recently_seen_is_evicted(self, slow):
+        slow.setattr(AppConfig, "QUERY_STATS_MAX", 2)
+        registry = QueryStatsRegistry()
+        registry.record("c", "SELECT a FROM t", 1, 1)
+        registry.record("c", "SELECT b FROM t", 1, 1)
+        registry.record("c", "SELECT a FROM t", 1, 1)
+        registry.record("c", "SELECT c FROM t", 1, 1)
+
+        assert {s.query for s in registry.top(limit=None)} == {
+            "SELECT a FROM t",
+            "SELECT c FROM t",
+        }
+
+    def test_plans_are_throttled_per_fingerprint(self, slow):
+        registry = QueryStatsRegistry()
+        fast = registry.record("c", "SELECT 1", 10, 1)
+        stats = registry.record("c", "SELECT * FROM t WHERE id = 1", 150, 1)
+
+        assert not registry.plan_due(fast, 10)
+        assert registry.plan_due(stats, 150)
+        assert not registry.plan_due(stats, 150)
+
+        stats.plan_logged_at -= 301
+        assert registry.plan_due(stats, 150)
@@ -0,0 +1,65 @@
+import datetime
+import json
+import uuid
+from decimal import Decimal
+from api.services.serialization import encode_query_result, ROW_BATCH_SIZE
+
+
+class SerializationTests:
+    """Tests for the raw query result encoder"""
+
+    columns = [{"name": "id", "type": None}, {"name": "value", "type": None}]
+    meta = {"query": "SELECT 1", "connection_id": "c", "entity_name": "e"}
+
+    def test_driver_types(self):
+        """Test values drivers return are encoded like the pydantic path did"""
+        rows = [
+            (1, Decimal("12.50")),
+            (2, datetime.datetime(2024, 1, 1, 12, 30)),
+            (3, uuid.UUID(int=1)),
+            (4, b"text"),
+            (5, b"\xff\x00"),
+        ]
+        data = json.loads(encode_query_result(self.meta, self.columns, rows))
+
+        assert [row["value"] for row in data["rows"]] == [
+            "12.50",
+            "2024-01-01T12:30:00",
+            "00000000-0000-0000-0000-000000000001",
+            "text",
+            "\\xff00",
+        ]
+
+    def test_wire_shape(self):
+        """Test the document has the QueryResult fields and rows keyed by column"""
+        rows = [(i, str(i)) for i in range(ROW_BATCH_SIZE * 2 + 1)]
+        data = json.loads(encode_query_result(self.meta, self.columns, rows))
+
+        assert data["query"] == "SELECT 1"
+        assert data["columns"] == self.columns
+        assert len(data["rows"]) == len(rows)
+        assert data["rows"][-1] == {"id": len(rows) - 1, "value": str(len(rows) - 1)}
+
+    def test_empty_result(self):
+        """Test statements without rows still produce valid JSON"""
+        data = json.loads(encode_query_result(self.meta, [], []))
+        assert data["rows"] == []
+        assert data["columns"] == []
+
+    def test_rows_stop_at_max_bytes(self):
+        """Test rows past the byte budget are left out and flagged"""
+        rows = [(i, "x" * 100) for i in range(ROW_BATCH_SIZE * 2)]
+        body = encode_query_result(self.meta, self.columns, rows, max_bytes=50_000)
+        data = json.loads(body)
+
+        assert len(body) <= 50_000
+        assert 0 < len(data["rows"]) < len(rows)
+        assert data["rows"][-1]["id"] == len(data["rows"]) - 1
+        assert data["truncated"] is True
+
+    def test_not_truncated_within_budget(self):
+        data = json.loads(
+            encode_query_result(self.meta, self.columns, [(1, "a")], max_bytes=10_000)
+        )
+        assert data["truncated"] is False
+        assert len(data["rows"]) == 1
@@ -0,0 +1,46 @@
+from api.services.cache import ResultCache
+from api.services.shared_cache import SharedCache
+
+
+class SharedCacheTests:
+    """Tests for the cache tier shared by the workers of a host"""
+
+    key = ("connection", "query", "SELECT 1", "users", None, None)
+
+    def _workers(self, tmp_path, count=2):
+        return [
+            ResultCache(1024 * 1024, 30, SharedCache(str(tmp_path), 30, 1024 * 1024))
+            for _ in range(count)
+        ]
+
+    def test_entry_is_visible_to_other_workers(self, tmp_path):
+        first, second = self._workers(tmp_path)
+
+        payload = first.put(self.key, b'{"rows": []}')
+        first.add_encoding(self.key, payload, "gzip", b"compressed")
+
+        cached = second.get(self.key)
+        assert cached.body == b'{"rows": []}'
+        assert cached.encoded == {"gzip": b"compressed"}
+
+    def test_invalidation_reaches_shared_tier(self, tmp_path):
+        first, second = self._workers(tmp_path)
+
+        first.put(self.key, b'{"rows": []}')
+        second.invalidate("connection")
+
+        assert SharedCache(str(tmp_path), 30, 1024 * 1024).get(self.key) is None
+
+    def test_expired_entries_are_ignored(self, tmp_path):
+        shared = SharedCache(str(tmp_path), -1, 1024 * 1024)
+        shared.put(self.key, b"{}")
+        assert shared.get(self.key) is None
+
+    def test_sweep_enforces_size_limit(self, tmp_path):
+        shared = SharedCache(str(tmp_path), 30, 10)
+        for i in range(3):
+            shared.put(("connection", i), b"0123456789")
+        shared.sweep()
+
+        stored = [shared.get(("connection", i)) for i in range(3)]
+        assert sum(1 for entry in stored if entry is not None) == 1
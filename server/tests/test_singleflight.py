@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from api.services.singleflight import SingleFlight
+from api.services.sql import normalize
+
+
+class SingleFlightTests:
+    """Tests for coalescing identical concurrent queries"""
+
+    async def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = 0
+
+        async def query():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return ["row"]
+
+        results = await asyncio.gather(*(flight.do("key", query) for _ in range(5)))
+
+        assert calls == 1
+        assert results == [["row"]] * 5
+        assert flight.coalesced == 4
+        assert flight.in_flight == 0
+
+    async def test_cancelled_leader_does_not_fail_followers(self):
+        flight = SingleFlight()
+
+        async def query():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.create_task(flight.do("key", query))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", query))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await follower == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    async def test_errors_reach_every_waiter(self):
+        flight = SingleFlight()
+
+        async def query():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            flight.do("key", query), flight.do("key", query), return_exceptions=True
+        )
+        assert all(isinstance(result, ValueError) for result in results)
+
+    async def test_sequential_calls_run_again(self):
+        flight = SingleFlight()
+        calls = 0
+
+        async def query():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        assert await flight.do("key", query) == 1
+        assert await flight.do("key", query) == 2
+
+    def test_normalize_keeps_literals(self):
+        assert normalize("SELECT  *\n FROM users -- all\n;") == "SELECT * FROM users"
+        assert normalize("SELECT 'a  b'") != normalize("SELECT 'a b'")
@@ -0,0 +1,168 @@
+import asyncio
+import pytest
+from api.services.snapshots import (
+    CopyReader,
+    SnapshotError,
+    SnapshotJob,
+    SnapshotTable,
+    Snapshots,
+    _create_snapshot_file,
+    _finish_snapshot_file,
+    _index_snapshot_file,
+    _open_snapshot_file,
+    _partitions,
+)
+
+
+class FakeLeader:
+    """Answers COPY queries with fixed rows in the text format."""
+
+    def __init__(self, rows: bytes):
+        self.rows = rows
+        self.queries = []
+
+    async def copy_from_query(self, query, *args, output, format):
+        self.queries.append((query, args))
+        await output(self.rows)
+
+
+async def copy(
+    table: SnapshotTable, store, rows: bytes, create: bool, where="", args=()
+):
+    leader = FakeLeader(rows)
+    job = SnapshotJob("conn", "snap", "table", [table])
+    await Snapshots()._copy_range(
+        job,
+        "postgres",
+        "postgresql://",
+        leader,
+        "exported",
+        table,
+        None,
+        store,
+        asyncio.Lock(),
+        create,
+        source_sql="SELECT * FROM events",
+        where=where,
+        args=list(args),
+        indexes=[],
+    )
+    return leader
+
+
+class SnapshotTests:
+    """Tests for copying postgres tables into sqlite snapshots"""
+
+    def test_copy_rows_split_across_chunks(self):
+        reader = CopyReader({"id": "integer", "body": "text"})
+
+        assert reader.feed(b"1\tfir") == []
+        assert reader.feed(b"st\n2\t") == [["1", "first"]]
+        assert reader.feed(b"second\n") == [["2", "second"]]
+        reader.finish()
+
+    def test_copy_escapes_and_nulls(self):
+        reader = CopyReader({"body": "text", "note": "text", "data": "bytea"})
+
+        rows = reader.feed(b"a\\tb\\nc\\\\d\t\\N\t\\\\x00ff\n\t\xc3\xa9\t\\N\n")
+
+        assert rows == [["a\tb\nc\\d", None, b"\x00\xff"], ["", "é", None]]
+
+    def test_truncated_copy_output(self):
+        reader = CopyReader({"id": "integer"})
+        reader.feed(b"1\n2")
+
+        with pytest.raises(SnapshotError):
+            reader.finish()
+
+    @pytest.mark.parametrize(
+        "source, tables",
+        [
+            ("sqlite", [SnapshotTable("t", table="t")]),
+            ("postgres", []),
+            ("postgres", [SnapshotTable("t", table="t", query="SELECT 1")]),
+            ("postgres", [SnapshotTable("t", query="DELETE FROM t")]),
+            ("postgres", [SnapshotTable("", query="SELECT 1")]),
+            (
+                "postgres",
+                [SnapshotTable("t", table="a"), SnapshotTable("T", table="b")],
+            ),
+        ],
+    )
+    async def test_invalid_snapshots_are_rejected(self, tmp_path, source, tables):
+        async def register(job, snapshot):
+            raise AssertionError("nothing should be copied")
+
+        with pytest.raises(SnapshotError):
+            Snapshots().create(
+                "conn",
+                source,
+                "postgresql://",
+                "s",
+                tables,
+                str(tmp_path / "s.db"),
+                register,
+            )
+
+    @pytest.mark.parametrize(
+        "low, high, count, ranges",
+        [
+            (None, None, 4, []),
+            (7, 7, 4, [(7, 7)]),
+            (1, 10, 3, [(1, 3), (4, 6), (7, 10)]),
+            (5, 6, 4, [(5, 5), (6, 6)]),
+            (-3, 3, 2, [(-3, -1), (0, 3)]),
+        ],
+    )
+    def test_key_ranges_cover_every_key_once(self, low, high, count, ranges):
+        assert _partitions(low, high, count) == ranges
+
+    def test_indexes_are_built_once_with_the_watermark(self, tmp_path):
+        table = SnapshotTable(
+            "events",
+            table="public.events",
+            watermark="updated_at",
+            columns={"id": "integer", "updated_at": "timestamp", "body": "text"},
+        )
+        conn = _create_snapshot_file(str(tmp_path / "s.db"), [table])
+        indexes = [(True, ["id"]), (True, ["id"]), (False, ["dropped"])]
+
+        _index_snapshot_file(conn, table, indexes)
+
+        built = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name"
+        ).fetchall()
+        assert built == [("events_id",), ("events_updated_at",)]
+        _finish_snapshot_file(conn, commit=True, create=True)
+
+    async def test_refresh_replaces_rows_by_key(self, tmp_path):
+        path = str(tmp_path / "s.db")
+        table = SnapshotTable(
+            "events",
+            table="public.events",
+            watermark="updated_at",
+            columns={"id": "integer", "updated_at": "integer", "body": "text"},
+            key=["id"],
+        )
+        store = _create_snapshot_file(path, [table])
+        await copy(table, store, b"1\t10\tfirst\n2\t20\tsecond\n", create=True)
+        _index_snapshot_file(store, table, [(True, ["id"])])
+        _finish_snapshot_file(store, commit=True, create=True)
+
+        store = _open_snapshot_file(path)
+        leader = await copy(
+            table,
+            store,
+            b"2\t30\tchanged\n3\t30\tthird\n",
+            create=False,
+            where=' WHERE "updated_at" >= $1::integer',
+            args=["20"],
+        )
+        _finish_snapshot_file(store, commit=True, create=False)
+
+        query, args = leader.queries[0]
+        assert query.endswith(' WHERE "updated_at" >= $1::integer') and args == ("20",)
+        store = _open_snapshot_file(path)
+        rows = store.execute("SELECT * FROM events ORDER BY id").fetchall()
+        _finish_snapshot_file(store, commit=False, create=False)
+        assert rows == [(1, 10, "first"), (2, 30, "changed"), (3, 30, "third")]
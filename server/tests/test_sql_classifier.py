@@ -0,0 +1,91 @@
+import pytest
+from api.services.sql import StatementKind, classify, paginate, split_statements
+
+
+class SQLClassifierTests:
+    """Tests for telling reads from writes and DDL"""
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "SELECT * FROM users",
+            "  -- latest first\n select 1;",
+            "select 1; select 2",
+            "with recursive r(n) as (select 1 union all select n + 1 from r) select * from r",
+            "select 'delete from x; drop table y'",
+            "VALUES (1)",
+            "TABLE users",
+            "SHOW search_path",
+            "EXPLAIN SELECT 1",
+            "EXPLAIN QUERY PLAN SELECT 1",
+            "PRAGMA table_info(users)",
+        ],
+    )
+    def test_reads(self, query):
+        assert classify(query).kind == StatementKind.READ
+        assert classify(query).read_only
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "INSERT INTO t SELECT * FROM u",
+            "select 1; delete from x",
+            "WITH x AS (DELETE FROM t RETURNING *) SELECT * FROM x",
+            "SELECT * INTO new_t FROM t",
+            "SELECT * FROM t FOR UPDATE",
+            "SELECT nextval('s')",
+            "SELECT pg_advisory_lock(1)",
+            "EXPLAIN ANALYZE DELETE FROM t",
+            "PRAGMA journal_mode=WAL",
+            "PRAGMA main.optimize",
+            "do $$ begin perform 1; end $$",
+            "",
+        ],
+    )
+    def test_writes(self, query):
+        assert classify(query).kind == StatementKind.WRITE
+
+    @pytest.mark.parametrize(
+        "query",
+        ["drop table t", "select 1; create table t(a int)", "ALTER TABLE t ADD b int"],
+    )
+    def test_ddl(self, query):
+        assert classify(query).kind == StatementKind.DDL
+
+    def test_split_keeps_literals_and_trigger_bodies(self):
+        query = (
+            "CREATE TRIGGER tr AFTER INSERT ON t BEGIN "
+            "UPDATE x SET a = CASE WHEN 1 THEN 2 END; DELETE FROM y; END; "
+            "SELECT ';';"
+        )
+
+        statements = classify(query).statements
+
+        assert len(split_statements(query)) == 2
+        assert statements[0].endswith("DELETE FROM y; END")
+        assert statements[1] == "SELECT ';'"
+
+    def test_controls_transaction(self):
+        assert classify("BEGIN; INSERT INTO t VALUES (1); COMMIT").controls_transaction
+        assert not classify(
+            "INSERT INTO t VALUES (1); INSERT INTO t VALUES (2)"
+        ).controls_transaction
+
+
+class PaginateTests:
+    """Tests for pushing a LIMIT down by wrapping the statement"""
+
+    def test_wraps_queries(self):
+        query = "SELECT * FROM t WHERE a IN (SELECT a FROM u LIMIT 5) -- recent"
+
+        paged = paginate(query, 101, 200)
+
+        assert paged.startswith("SELECT * FROM (SELECT * FROM t")
+        assert paged.endswith(") AS _page LIMIT 101 OFFSET 200")
+        assert "-- recent\n)" in paged
+
+    @pytest.mark.parametrize(
+        "query", ["PRAGMA table_info(t)", "EXPLAIN SELECT 1", "SHOW search_path"]
+    )
+    def test_leaves_other_statements(self, query):
+        assert paginate(query, 10) is None
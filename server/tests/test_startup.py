@@ -0,0 +1,20 @@
+import os
+from benchmarks.bench_startup import measure
+
+# generous default, CI can tighten it with STARTUP_BUDGET_SECONDS
+STARTUP_BUDGET_SECONDS = float(os.environ.get("STARTUP_BUDGET_SECONDS", 3.0))
+
+
+class StartupTests:
+    """A fresh worker has to become ready within the startup budget"""
+
+    def test_startup_within_budget(self):
+        result = measure(runs=3)
+        assert result["total"] < STARTUP_BUDGET_SECONDS, (
+            f"worker took {result['total']:.2f}s to become ready, "
+            f"budget is {STARTUP_BUDGET_SECONDS:.2f}s"
+        )
+
+    def test_postgres_driver_is_not_imported_at_startup(self):
+        # asyncpg is only needed once a postgres connection is used
+        assert measure(runs=1)["asyncpg_loaded"] is False
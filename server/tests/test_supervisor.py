@@ -0,0 +1,84 @@
+import asyncio
+import sqlite3
+from contextlib import closing
+import pytest
+from api.config import AppConfig
+from api.services.pools import pools
+from api.services.supervisor import PoolSupervisor
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "supervised.db"
+    with closing(sqlite3.connect(path)) as conn:
+        conn.execute("CREATE TABLE t (a INT)")
+    return str(path)
+
+
+class PoolSupervisorTests:
+    """Tests for warming and checking the pools of connections"""
+
+    async def test_recent_connections_are_warmed(self, database, monkeypatch):
+        monkeypatch.setattr(AppConfig, "POOL_WARM_SIZE", 2)
+        supervisor = PoolSupervisor()
+
+        async def recent():
+            return [("warm-1", "sqlite", database)]
+
+        await supervisor.start(recent)
+        while (
+            not (health := supervisor._connections.get("warm-1"))
+            or not health.checked_at
+        ):
+            await asyncio.sleep(0.01)
+        await supervisor.stop()
+
+        snapshot = supervisor.snapshot()
+        assert snapshot["status"] == "ok"
+        assert [p["size"] for p in snapshot["connections"][0]["pools"]] == [2, 2]
+        await pools.discard("warm-1")
+
+    async def test_missing_database_is_unhealthy_and_not_created(self, tmp_path):
+        supervisor = PoolSupervisor()
+        path = str(tmp_path / "gone.db")
+        supervisor.watch("missing-1", "sqlite", path)
+
+        await supervisor.check()
+
+        snapshot = supervisor.snapshot()
+        assert snapshot["status"] == "degraded"
+        assert snapshot["connections"][0]["healthy"] is False
+        assert "missing" in snapshot["connections"][0]["error"]
+        assert not (tmp_path / "gone.db").exists()
+
+    async def test_check_pings_idle_connections(self, database):
+        supervisor = PoolSupervisor()
+        supervisor.watch("check-1", "sqlite", database)
+        await supervisor.warm(supervisor._connections["check-1"])
+
+        await supervisor.check()
+
+        health = supervisor._connections["check-1"]
+        assert health.healthy
+        assert health.failures == 0
+        assert health.latency_ms is not None
+        await pools.discard("check-1")
+
+    async def test_last_uses_are_saved_once(self, database):
+        saved = []
+
+        async def recent():
+            return []
+
+        async def save(updates):
+            saved.append(updates)
+
+        supervisor = PoolSupervisor()
+        await supervisor.start(recent, save)
+        supervisor.watch("used-1", "sqlite", database)
+        used_at = supervisor._connections["used-1"].last_used_at
+
+        await supervisor.flush()
+        await supervisor.stop()
+
+        assert saved == [{"used-1": used_at}]
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+import pytest
+from api.config import AppConfig
+from api.services import supervisor as supervisor_module, tiering
+from api.services.pools import pools
+from api.services.supervisor import PoolSupervisor
+from api.services.tiering import BucketStore, QuotaExceeded
+
+
+@pytest.fixture
+def bucket(tmp_path, monkeypatch):
+    monkeypatch.setattr(AppConfig, "BUCKET_DIR", str(tmp_path))
+    monkeypatch.setattr(AppConfig, "BUCKET_COLD_DIR", None)
+    monkeypatch.setattr(AppConfig, "BUCKET_MIN_IDLE", 60)
+    for uid in ("old", "recent"):
+        with closing(sqlite3.connect(tmp_path / f"{uid}.db")) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("CREATE TABLE t (body TEXT)")
+            conn.executemany(
+                "INSERT INTO t VALUES (?)", [(f"row {i}",) for i in range(2000)]
+            )
+            conn.commit()
+    old = time.time() - 3600
+    os.utime(tmp_path / "old.db", (old, old))
+    return tmp_path
+
+
+def store_for(bucket) -> BucketStore:
+    store = BucketStore()
+    saved = {}
+
+    async def load():
+        return {"old": 0, "recent": 0}
+
+    async def save(updates):
+        for uid, changes in updates.items():
+            saved.setdefault(uid, {}).update(changes)
+
+    store._load, store._save, store.saved = load, save, saved
+    return store
+
+
+class BucketStoreTests:
+    """Tests for the disk quota and cold tier of the bucket"""
+
+    async def test_idle_files_are_tiered_over_the_quota(self, bucket, monkeypatch):
+        monkeypatch.setattr(AppConfig, "BUCKET_QUOTA_BYTES", 1)
+        store = store_for(bucket)
+
+        await store.sweep()
+
+        assert not (bucket / "old.db").exists()
+        assert list((bucket / "cold").iterdir())[0].name.startswith("old.db.")
+        # used within BUCKET_MIN_IDLE, by its modification time
+        assert (bucket / "recent.db").exists()
+        assert store.saved["old"]["tier"] == "cold"
+
+    async def test_no_quota_keeps_files_hot(self, bucket, monkeypatch):
+        monkeypatch.setattr(AppConfig, "BUCKET_QUOTA_BYTES", 0)
+        store = store_for(bucket)
+
+        await store.sweep()
+
+        assert (bucket / "old.db").exists()
+
+    async def test_cold_file_is_restored_on_access(self, bucket, monkeypatch):
+        monkeypatch.setattr(AppConfig, "BUCKET_QUOTA_BYTES", 1)
+        store = store_for(bucket)
+        path = bucket / "old.db"
+        await store.sweep()
+        assert store.exists(path)
+
+        assert await store.ensure_hot(path)
+
+        with closing(sqlite3.connect(path)) as conn:
+            assert conn.execute("SELECT count(*) FROM t").fetchone()[0] == 2000
+        assert not list((bucket / "cold").iterdir())
+        assert await store.ensure_hot(path) is False
+
+    async def test_pooled_files_are_never_tiered(self, bucket, monkeypatch):
+        monkeypatch.setattr(AppConfig, "BUCKET_QUOTA_BYTES", 1)
+        monkeypatch.setattr(AppConfig, "BUCKET_MIN_IDLE", 0)
+        store = store_for(bucket)
+        path = str(bucket / "old.db")
+        async with pools.acquire("tiering", "sqlite", path):
+            await store.sweep()
+
+        assert os.path.exists(path)
+        assert "last_accessed_at" in store.saved["old"]
+        await pools.discard("tiering")
+
+    async def test_pool_opened_while_tiering_sees_the_data(self, bucket, monkeypatch):
+        monkeypatch.setattr(AppConfig, "BUCKET_QUOTA_BYTES", 1)
+        store = store_for(bucket)
+        monkeypatch.setattr(tiering, "bucket_store", store)
+        compressing, release = threading.Event(), threading.Event()
+        compress = store._tier
+
+        def slow_tier(path):
+            compressing.set()
+            release.wait(5)
+            return compress(path)
+
+        monkeypatch.setattr(store, "_tier", slow_tier)
+        path = str(bucket / "old.db")
+        sweep = asyncio.create_task(store.sweep())
+        await asyncio.to_thread(compressing.wait, 5)
+
+        # the pool waits for the file to be moved, then restores it
+        query = asyncio.create_task(pools.get("tiering-race", "sqlite", path))
+        await asyncio.sleep(0.05)
+        assert not query.done()
+        release.set()
+        await sweep
+        pool = await query
+
+        conn = await pool.acquire()
+        try:
+            assert conn.execute("SELECT count(*) FROM t").fetchone()[0] == 2000
+        finally:
+            await pool.release(conn)
+        await pools.discard("tiering-race")
+
+    async def test_pools_wait_for_the_file_lock(self, bucket, monkeypatch):
+        store = store_for(bucket)
+        monkeypatch.setattr(tiering, "bucket_store", store)
+        path = str(bucket / "recent.db")
+
+        async with store.lock(path):
+            query = asyncio.create_task(pools.get("tiering-lock", "sqlite", path))
+            await asyncio.sleep(0.05)
+            assert not query.done()
+        await query
+        await pools.discard("tiering-lock")
+
+    async def test_health_checks_do_not_keep_files_hot(self, bucket, monkeypatch):
+        monkeypatch.setattr(AppConfig, "BUCKET_QUOTA_BYTES", 1)
+        store = store_for(bucket)
+        monkeypatch.setattr(tiering, "bucket_store", store)
+        monkeypatch.setattr(supervisor_module, "bucket_store", store)
+        supervisor = PoolSupervisor()
+        path = str(bucket / "old.db")
+        supervisor.watch("tiering-check", "sqlite", path)
+        health = supervisor._connections["tiering-check"]
+        await supervisor.warm(health)
+
+        await supervisor.check()
+        await store.sweep()
+        await supervisor.check()
+        await supervisor.warm(health)
+
+        assert not os.path.exists(path)
+        assert health.healthy
+        assert pools.stats("tiering-check") == []
+        assert "last_accessed_at" not in store.saved.get("old", {})
+
+    async def test_upload_is_refused_when_nothing_can_be_tiered(
+        self, bucket, monkeypatch
+    ):
+        monkeypatch.setattr(AppConfig, "BUCKET_QUOTA_BYTES", 1)
+        monkeypatch.setattr(AppConfig, "BUCKET_MIN_IDLE", 86400)
+        store = store_for(bucket)
+
+        with pytest.raises(QuotaExceeded):
+            await store.reserve()
@@ -0,0 +1,148 @@
+import sqlite3
+from contextlib import asynccontextmanager
+import asyncpg
+import pytest
+from api.services import watch
+from api.services.watch import (
+    PostgresWatcher,
+    SQLiteWatcher,
+    TableWatcher,
+    quote_identifier,
+    parse_watermark,
+)
+
+
+class FakePostgres:
+    """Answers the catalog lookups of a watcher, records bound parameters."""
+
+    def __init__(self):
+        self.params = []
+
+    async def fetchval(self, query, *args):
+        if "format_type" in query:
+            return "integer"
+        return 0
+
+    async def prepare(self, query):
+        return self
+
+    def get_attributes(self):
+        return []
+
+    async def fetch(self, *params):
+        self.params.append(params)
+        return []
+
+
+@pytest.fixture
+def postgres(monkeypatch):
+    conn = FakePostgres()
+
+    @asynccontextmanager
+    async def acquire(*args, **kwargs):
+        yield conn
+
+    monkeypatch.setattr(watch.pools, "acquire", acquire)
+    return conn
+
+
+class WatchTests:
+    """Tests for following new rows of a sqlite table"""
+
+    @pytest.fixture
+    def database(self, tmp_path):
+        path = tmp_path / "watch.db"
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute("CREATE TABLE events (id INTEGER PRIMARY KEY, kind TEXT)")
+        conn.executemany("INSERT INTO events (kind) VALUES (?)", [("old",), ("old",)])
+        yield path, conn
+        conn.close()
+
+    async def _poll(self, watcher):
+        return [batch async for batch in watcher.poll()]
+
+    async def test_only_rows_committed_after_start_are_sent(self, database):
+        path, conn = database
+        watcher = SQLiteWatcher("connection", str(path), "events", None, None)
+        await watcher.start()
+        try:
+            assert not await watcher.changed()
+
+            conn.execute("INSERT INTO events (kind) VALUES ('new')")
+
+            assert await watcher.changed()
+            batches = await self._poll(watcher)
+            assert len(batches) == 1
+            watermark, columns, rows = batches[0]
+            assert [column["name"] for column in columns] == ["id", "kind"]
+            assert rows == [(3, "new")]
+            assert watermark == 3
+            assert not await watcher.changed()
+        finally:
+            await watcher.close()
+
+    async def test_resume_from_watermark(self, database):
+        path, conn = database
+        watcher = SQLiteWatcher("connection", str(path), "events", "id", 1)
+        await watcher.start()
+        try:
+            batches = await self._poll(watcher)
+            assert [rows for _, _, rows in batches] == [[(2, "old")]]
+            assert watcher.event_id == "2"
+        finally:
+            await watcher.close()
+
+    async def test_large_changes_are_sent_in_batches(self, database):
+        path, conn = database
+        watcher = SQLiteWatcher("connection", str(path), "events", None, None)
+        watcher.batch_size = 2
+        await watcher.start()
+        try:
+            conn.executemany("INSERT INTO events (kind) VALUES (?)", [("new",)] * 5)
+            assert await watcher.changed()
+            batches = await self._poll(watcher)
+            assert [len(rows) for _, _, rows in batches] == [2, 2, 1]
+        finally:
+            await watcher.close()
+
+    def test_watcher_must_implement_polling(self):
+        class Incomplete(TableWatcher):
+            async def start(self):
+                pass
+
+        with pytest.raises(TypeError):
+            Incomplete("c1", "uri", "events", None, None)
+
+    def test_identifiers_are_validated(self):
+        assert quote_identifier("public.events") == '"public"."events"'
+        with pytest.raises(ValueError):
+            quote_identifier("events; DROP TABLE events")
+
+    def test_parse_watermark(self):
+        assert parse_watermark("42") == 42
+        assert parse_watermark('{"xmin": 7, "seen": []}') == {"xmin": 7, "seen": []}
+        assert parse_watermark("2024-01-01 10:00") == "2024-01-01 10:00"
+        assert parse_watermark(None) is None
+
+    async def test_failed_start_does_not_count_as_xmin_watcher(
+        self, postgres, monkeypatch
+    ):
+        async def connect(uri):
+            raise ConnectionRefusedError("connection refused")
+
+        monkeypatch.setattr(asyncpg, "connect", connect)
+        watcher = PostgresWatcher(
+            "c1", "postgresql://", "events", None, None, channel="events"
+        )
+
+        with pytest.raises(ConnectionRefusedError):
+            await watcher.start()
+        assert PostgresWatcher.xmin_watchers == 0
+
+    async def test_numeric_watermark_is_bound_as_text(self, postgres):
+        watcher = PostgresWatcher("c1", "postgresql://", "events", "id", 100)
+        await watcher.start()
+
+        assert [batch async for batch in watcher.poll()] == []
+        assert postgres.params == [("100",)]
+        await watcher.close()